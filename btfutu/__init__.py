@@ -1,11 +1,21 @@
+from .futustore import *
 from .futubroker import *
 from .futufeed import *
-from .futustore import *
-import futu as ft
+from .aggregator import BarAggregator
+from .analyzers import FutuLatency
+from .basket import Basket
+from .gateway import FutuGateway
+from .latency import LatencyRecorder
+from .notifications import MessageQueue, OrderNotifications
+from .optimize import ArrayFeed, ParamSweep, SharedHistory
+from .orderbook import OrderBook
+from .ringbuffer import RingBuffer
+from .simulator import FutuSimulator
+from .spreads import SpreadTable
+from .staticdata import StaticData
 
 
 def set_futu_debug_model(on_off=True):
+    '''Turns the debug logs of futu on or off, off by default'''
+    import futu as ft
     ft.common.set_debug_model(on_off)
-
-
-set_futu_debug_model(True)
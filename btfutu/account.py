@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+import futu as ft
+
+
+class AccountState(object):
+    '''Cash, value and position sizes of an account kept in memory.
+
+    ``reset`` seeds it from the frames returned by ``accinfo_query`` and
+    ``position_list_query`` and ``deal`` applies a fill from a deal push in
+    between, marking the position to the price of the fill. Fees are only
+    accounted for by the next ``reset``.
+
+    Both run in futu or store threads, ``cash``, ``value`` and the buying
+    ``power`` are plain attributes which the cerebro thread reads without
+    locking.
+    '''
+    _SIGNS = {
+        ft.TrdSide.BUY: 1.0,
+        ft.TrdSide.BUY_BACK: 1.0,
+        ft.TrdSide.SELL: -1.0,
+        ft.TrdSide.SELL_SHORT: -1.0,
+    }
+
+    # deals which correct earlier ones, left to the next reset
+    _SKIPDEALS = frozenset([ft.DealStatus.CANCELLED, ft.DealStatus.CHANGED])
+
+    def __init__(self):
+        self.cash = 0.0
+        self.value = 0.0
+        self.power = 0.0  # buying power
+        self.mktval = 0.0
+        self.positions = dict()  # code -> [qty, price]
+        self._deals = set()
+        self._lock = threading.Lock()
+
+    def reset(self, accinfo, positions):
+        pos = dict()
+        cols = (positions['code'].values, positions['qty'].values,
+                positions['nominal_price'].values)
+        for code, qty, price in zip(*cols):
+            pos[code] = [float(qty), float(price)]
+
+        with self._lock:
+            self.positions = pos
+            self.mktval = sum(qty * price for qty, price in pos.values())
+            self.cash = float(accinfo['cash'].values[0])
+            self.value = self.cash + self.mktval
+            self.power = float(accinfo['power'].values[0]) \
+                if 'power' in accinfo else self.cash
+
+    def deal(self, dealid, code, side, qty, price, status=None):
+        sign = self._SIGNS.get(side)
+        if sign is None or status in self._SKIPDEALS:
+            return
+
+        with self._lock:
+            if dealid in self._deals:  # pushed again
+                return
+            self._deals.add(dealid)
+
+            pos = self.positions.get(code)
+            if pos is None:
+                self.positions[code] = pos = [0.0, price]
+
+            self.mktval += pos[0] * (price - pos[1]) + sign * qty * price
+            pos[0] += sign * qty
+            pos[1] = price
+            self.cash -= sign * qty * price
+            self.power -= sign * qty * price
+            self.value = self.cash + self.mktval
+
+
+class TradeAccount(object):
+    '''What the store keeps per account: the trade context of its market,
+    the rate limiters and queues of its calls, since OpenD counts the limits
+    per account, and its ``AccountState``.
+
+    ``key`` is ``(trade, acc_id, trd_env)`` with ``trade`` one of the trade
+    types of the store. ``acc_id`` ``0`` is the first account of the market.
+    '''
+
+    def __init__(self, key, ctx, limiters, reads, writes):
+        self.key = key
+        self.trade, self.acc_id, self.trd_env = key
+        self.ctx = ctx
+        self.limiters = limiters
+        self.reads = reads
+        self.writes = writes
+        self.state = AccountState()
+        self.ready = threading.Event()  # set with the first state
+        self.q_account = None
+        self.threads = []
+
+    def kwargs(self):
+        '''Keyword arguments selecting the account in the context calls'''
+        return dict(acc_id=self.acc_id, trd_env=self.trd_env)
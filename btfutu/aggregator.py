@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import bisect
+import math
+import threading
+import time
+
+
+def _secs(h, m):
+    return h * 3600 + m * 60
+
+
+# Trading sessions per market in exchange local time, as seconds of the day:
+# (start, end, auction). An auction session makes a single bar of its own
+SESSIONS = {
+    'HK': ((_secs(9, 0), _secs(9, 30), True),     # pre-opening auction
+           (_secs(9, 30), _secs(12, 0), False),
+           (_secs(13, 0), _secs(16, 0), False),
+           (_secs(16, 0), _secs(16, 10), True)),  # closing auction
+    'SH': ((_secs(9, 15), _secs(9, 30), True),
+           (_secs(9, 30), _secs(11, 30), False),
+           (_secs(13, 0), _secs(14, 57), False),
+           (_secs(14, 57), _secs(15, 0), True)),
+    'SZ': ((_secs(9, 15), _secs(9, 30), True),
+           (_secs(9, 30), _secs(11, 30), False),
+           (_secs(13, 0), _secs(14, 57), False),
+           (_secs(14, 57), _secs(15, 0), True)),
+    'US': ((_secs(9, 30), _secs(16, 0), False),),
+}
+
+ALLDAY = ((0, 86400, False),)
+
+_DAYSECS = 86400.0
+
+
+class BarAggregator(object):
+    '''Builds bars from trades one trade at a time in constant time.
+
+    Params:
+
+      - ``mode``: one of
+
+          - ``Time``: bars of ``size`` seconds aligned to the session start
+            and stamped with their end time, like futu K-lines
+          - ``Ticks``: bars of ``size`` trades
+          - ``Volume``: a bar closes once it holds ``size`` shares
+          - ``Dollar``: a bar closes once it holds ``size`` of turnover
+
+        Count based bars are stamped with the time of their last trade
+
+      - ``size``: see above
+
+      - ``put``: callable receiving each completed bar as
+        ``[datetime, open, high, low, close, volume]``
+
+      - ``sessions`` (default: ``ALLDAY``)
+
+        The ``(start, end, auction)`` sessions of the market, see
+        ``SESSIONS``. Bars never span a break between sessions, an auction
+        session makes one bar and trades reported outside the sessions
+        (e.g. during the lunch break) are added to the last bar of the
+        previous session or to the first one of the day
+
+    ``add`` is called from the futu callback thread and ``expire`` from the
+    cerebro thread.
+    '''
+    (Time, Ticks, Volume, Dollar) = range(4)
+
+    def __init__(self, mode, size, put, sessions=ALLDAY):
+        if size <= 0:
+            raise ValueError('BarAggregator size must be positive')
+
+        self.mode = mode
+        self.size = size
+        self.sessions = sessions
+        self._put = put
+        self._starts = [s[0] for s in sessions]
+
+        self._bar = None
+        self._closeat = 0.0  # bar end for Time, session end otherwise
+        self._count = 0.0
+        self._lastdt = 0.0
+        self._lastrecv = 0.0
+        self._lock = threading.Lock()
+
+    def _locate(self, dt):
+        '''Returns the ends of the bucket and of the session of ``dt`` as
+        float dates'''
+        day = math.floor(dt)
+        secs = round((dt - day) * _DAYSECS, 3)  # futu times are in ms
+        sessions = self.sessions
+
+        i = bisect.bisect_right(self._starts, secs) - 1
+        if i < 0:  # before the first session
+            start, end, auction = sessions[0]
+            secs = start
+        else:
+            start, end, auction = sessions[i]
+            if secs >= end:  # in a break or after the close
+                secs = end - 1e-3
+
+        if auction or self.mode != self.Time:
+            bend = end
+        else:
+            bend = min(start + (math.floor((secs - start) / self.size) + 1) *
+                       self.size, end)
+
+        return day + bend / _DAYSECS, day + end / _DAYSECS
+
+    def add(self, dt, price, volume):
+        with self._lock:
+            self._lastdt = dt
+            self._lastrecv = time.monotonic()
+
+            bend, send = self._locate(dt)
+            closeat = bend if self.mode == self.Time else send
+
+            bar = self._bar
+            if bar is not None and closeat != self._closeat:
+                self._put(bar)
+                bar = None
+
+            if bar is None:
+                self._bar = bar = [dt, price, price, price, price, volume]
+                self._closeat = closeat
+                self._count = 0.0
+            else:
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += volume
+
+            mode = self.mode
+            if mode == self.Time:
+                bar[0] = bend
+                return
+
+            bar[0] = dt
+            if mode == self.Ticks:
+                self._count += 1
+            elif mode == self.Volume:
+                self._count += volume
+            else:
+                self._count += price * volume
+
+            if self._count >= self.size:
+                self._bar = None
+                self._put(bar)
+
+    def expire(self, force=False):
+        '''Completes the bar in progress if its end has been reached or if
+        ``force`` is set. The current exchange time is estimated from the
+        time of the last trade and the time elapsed since it was received,
+        which keeps it free from the timezone and clock of the machine'''
+        with self._lock:
+            if self._bar is None:
+                return
+
+            now = self._lastdt + (time.monotonic() - self._lastrecv) / _DAYSECS
+            if force or now >= self._closeat:
+                self._put(self._bar)
+                self._bar = None
+
+    def reset(self):
+        with self._lock:
+            self._bar = None
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import backtrader as bt
+
+from .futustore import FutuStore
+
+
+class FutuLatency(bt.Analyzer):
+    '''Stamps the end of ``next`` of the strategy in the ``LatencyRecorder``
+    of the store and returns the statistics of each stage in microseconds,
+    see ``LatencyRecorder``. Empty unless the store has been created with
+    ``latency=True``.
+
+    Params:
+
+      - ``path`` (default: ``None``)
+
+        File the statistics are also written to as JSON at the end
+    '''
+    params = (
+        ('path', None),
+    )
+
+    def start(self):
+        self._latency = FutuStore().latency
+
+    def next(self):
+        if self._latency is not None:
+            self._latency.next()
+
+    def stop(self):
+        if self._latency is not None:
+            self.rets.update(self._latency.dump(self.p.path))
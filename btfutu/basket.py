@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+import time
+
+
+class Basket(object):
+    '''Orders submitted together by ``FutuBroker.submit_basket``.
+
+    The orders are notified one by one as usual. Once none of them is alive
+    the basket is put once in the store notifications, i.e. passed to
+    ``notify_store`` of the strategies, and ``done`` is set.
+
+    Attributes:
+
+      - ``orders``: the orders, rejected ones included
+      - ``status``: order status name -> number of orders ended with it
+      - ``value``: value executed, bought minus sold
+      - ``elapsed``: seconds from the submission to the end of the last order
+    '''
+
+    def __init__(self, name=None):
+        self.name = name
+        self.orders = []
+        self.status = collections.Counter()
+        self.value = 0.0
+        self.elapsed = None
+        self.done = threading.Event()
+        self._alive = 0
+        self._t0 = time.time()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return 'Basket %s: %d orders, %s, value %.2f in %.3fs' % (
+            self.name, len(self.orders), dict(self.status), self.value,
+            self.elapsed or 0.0)
+
+    def _add(self, order):
+        self.orders.append(order)
+        self._alive += 1
+
+    def _end(self, order):
+        '''Accounts for ``order`` having ended, returns ``True`` for the
+        last one'''
+        with self._lock:
+            self.status[order.getstatusname()] += 1
+            executed = order.executed
+            self.value += executed.size * (executed.price or 0.0)
+            self._alive -= 1
+            if self._alive:
+                return False
+
+        self.elapsed = time.time() - self._t0
+        self.done.set()
+        return True
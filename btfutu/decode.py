@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''Column-wise conversion of the DataFrames returned by futu into bar arrays
+and from bar arrays into backtrader lines.
+
+A bar array is a ``(n, NCOLS)`` float64 array with the columns below and
+backtrader float dates in ``DATETIME``.
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import array
+
+import numpy as np
+
+(DATETIME, OPEN, HIGH, LOW, CLOSE, VOLUME) = range(6)
+NCOLS = 6
+
+_EPOCH = np.datetime64('0001-01-01T00:00:00', 'us')
+_ONEDAY = np.timedelta64(1, 'D')
+
+
+def dtstr_to_num(values):
+    '''Converts futu ``YYYY-MM-DD HH:MM:SS[.fff]`` strings to backtrader
+    float dates in a single pass'''
+    dts = np.array(np.asarray(values).astype(str), dtype='datetime64[us]')
+    return (dts - _EPOCH) / _ONEDAY + 1.0
+
+
+def dtstr_to_num1(dtstr):
+    '''Single string version of ``dtstr_to_num``'''
+    return float((np.datetime64(dtstr, 'us') - _EPOCH) / _ONEDAY) + 1.0
+
+
+def _frame_to_array(dts, df, o, h, l, c, v):
+    out = np.empty((len(df), NCOLS))
+    out[:, DATETIME] = dtstr_to_num(dts)
+    out[:, OPEN] = df[o].values
+    out[:, HIGH] = df[h].values
+    out[:, LOW] = df[l].values
+    out[:, CLOSE] = df[c].values
+    out[:, VOLUME] = df[v].values
+    return out
+
+
+def kline_to_array(df):
+    '''For ``get_cur_kline``, ``request_history_kline`` and K-line pushes'''
+    return _frame_to_array(df['time_key'].values, df,
+                           'open', 'high', 'low', 'close', 'volume')
+
+
+def ticker_to_array(df):
+    '''For ``get_rt_ticker`` and ticker pushes: one single price bar per
+    trade'''
+    return _frame_to_array(df['time'].values, df,
+                           'price', 'price', 'price', 'price', 'volume')
+
+
+def quote_to_array(df):
+    '''For ``get_stock_quote`` and quote pushes: one single price bar per
+    quote with the day volume'''
+    dts = np.char.add(df['data_date'].values.astype(str), ' ')
+    dts = np.char.add(dts, df['data_time'].values.astype(str))
+    return _frame_to_array(dts, df, 'last_price', 'last_price', 'last_price',
+                           'last_price', 'volume')
+
+
+def snapshot_to_array(df):
+    '''For ``get_market_snapshot``: one single price bar per code with the
+    day volume. The codes never traded have no update time and get a ``NaN``
+    date'''
+    dts = np.asarray(df['update_time'].values).astype(str)
+    dts[np.char.str_len(dts) < 10] = ''  # '' or 'N/A' -> NaT
+    return _frame_to_array(dts, df, 'last_price', 'last_price', 'last_price',
+                           'last_price', 'volume')
+
+
+def fill_lines(data, bars):
+    '''Appends ``bars`` to the unbounded line buffers of ``data`` in one go,
+    as ``preload`` would do bar by bar. Lines not in a bar array are filled
+    with ``NaN``'''
+    n = len(bars)
+    lines = data.lines
+    cols = ((lines.datetime, DATETIME), (lines.open, OPEN),
+            (lines.high, HIGH), (lines.low, LOW), (lines.close, CLOSE),
+            (lines.volume, VOLUME))
+
+    filled = set()
+    for line, col in cols:
+        line.array.extend(array.array(str('d'), bars[:, col].tobytes()))
+        filled.add(id(line))
+
+    nans = np.full(n, np.nan).tobytes()
+    zeros = np.zeros(n).tobytes()
+    for line in lines:
+        if id(line) not in filled:
+            vals = zeros if line is lines.openinterest else nans
+            line.array.extend(array.array(str('d'), vals))
+
+    for line in lines:
+        line.idx += n
+        line.lencount += n
@@ -1,3 +1,6 @@
 class FutuNotSupported(Exception):
     pass
 
+
+class FutuRequestError(Exception):
+    pass
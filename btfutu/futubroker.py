@@ -23,13 +23,17 @@ from __future__ import (absolute_import, division, print_function,
 
 import collections
 import json
+import math
 
 from backtrader import BrokerBase, OrderBase, BuyOrder, SellOrder, CommInfoBase
 from backtrader.commissions import CommInfo
-from backtrader.position import Position
 from backtrader.utils.py3 import queue, with_metaclass
 
 from . import FutuStore
+from .basket import Basket
+from .exceptions import FutuNotSupported
+from .notifications import OrderNotifications
+from .simulator import FutuSimulator
 
 
 class FutuOrder(OrderBase):
@@ -37,7 +41,48 @@ class FutuOrder(OrderBase):
 
 
 class FutuCommInfo(CommInfoBase):
-    pass
+    '''Fee schedule of Futu for Hong Kong stocks, per execution of an
+    order, as the sum of:
+
+      - ``commission`` of the turnover, ``mincomm`` at least
+      - ``platform``: the fixed platform fee per order
+      - ``stamp``: stamp duty of the turnover, rounded up to the dollar
+      - ``sfc`` and ``afrc``: the transaction levies of the SFC and AFRC
+      - ``trading``: the trading fee of the exchange, ``mintrading`` at
+        least
+      - ``settlement``: the CCASS settlement fee, between ``minsettle`` and
+        ``maxsettle``
+
+    All rates are fractions of the turnover, e.g. ``0.0003`` for 0.03%.
+    '''
+    params = (
+        ('commission', 0.0003),
+        ('mincomm', 3.0),
+        ('platform', 15.0),
+        ('stamp', 0.001),
+        ('sfc', 0.000027),
+        ('afrc', 0.0000015),
+        ('trading', 0.0000565),
+        ('mintrading', 0.01),
+        ('settlement', 0.00002),
+        ('minsettle', 2.0),
+        ('maxsettle', 100.0),
+        ('stocklike', True),
+        ('commtype', CommInfoBase.COMM_PERC),
+        ('percabs', True),
+    )
+
+    def _getcommission(self, size, price, pseudoexec):
+        turnover = abs(size) * price
+        if not turnover:
+            return 0.0
+
+        p = self.p
+        return (max(turnover * p.commission, p.mincomm) + p.platform +
+                math.ceil(turnover * p.stamp) +
+                turnover * (p.sfc + p.afrc) +
+                max(turnover * p.trading, p.mintrading) +
+                min(max(turnover * p.settlement, p.minsettle), p.maxsettle))
 
 
 class MetaFutuBroker(BrokerBase.__class__):
@@ -49,69 +94,153 @@ class MetaFutuBroker(BrokerBase.__class__):
 
 
 class FutuBroker(with_metaclass(MetaFutuBroker, BrokerBase)):
+    '''Broker of the orders of a Futu account, the other keyword arguments
+    are those of ``FutuStore``.
+
+    Params:
+
+      - ``simulate`` (default: ``False``)
+
+        Match the orders on the bars of the datas with a ``FutuSimulator``
+        instead of sending them to OpenD, e.g. for backtests, with the same
+        order handling otherwise. The commissions default to
+        ``FutuCommInfo``
+
+      - ``cash`` (default: ``1000000.0``)
+
+        Starting cash of the simulation
+    '''
+    params = (
+        ('simulate', False),
+        ('cash', 1000000.0),
+    )
 
     def __init__(self, **kwargs):
         super(FutuBroker, self).__init__()
 
-        self.store = FutuStore(**kwargs)
+        if self.p.simulate:
+            self.store = FutuSimulator(FutuStore(**kwargs), cash=self.p.cash)
+            if self.comminfo[None] is self.p.commission:  # the default
+                self.comminfo[None] = FutuCommInfo()
+        else:
+            self.store = FutuStore(**kwargs)
         self.orders = collections.OrderedDict()
-        self.notifs = collections.deque()
+        self.notifs = OrderNotifications()
         self.opending = collections.defaultdict(list)
         self.brackets = dict()
 
         self.startingcash = self.cash = 0.0
         self.startingvalue = self.value = 0.0
-        self.positions = collections.defaultdict(Position)
+        self._started = False
+        self.positions = self.store.positions
 
         self._ocos = dict()
         self._ocol = collections.defaultdict(list)
         self._pchildren = collections.defaultdict(collections.deque)
+        self._recovering = []  # journal entries waiting for their data
+        self._baskets = dict()  # oref -> Basket
 
     def start(self):
         super(FutuBroker, self).start()
-        self.store.start(broker=self)
-        self.startingcash = self.cash = cash = self.store.get_cash()
-        self.startingvalue = self.value = self.store.get_value()
-
-        # comminfo = OandaV20CommInfo(
-        #     leverage=self.o.get_leverage(),
-        #     stocklike=False,
-        #     commtype=CommInfoBase.COMM_FIXED)
-        # # set as default comminfo
-        # self.addcommissioninfo(comminfo, name=None)
-        #
-        # if self.p.use_positions:
-        #     positions = self.o.get_positions()
-        #     if positions is None:
-        #         return
-        #     for p in positions:
-        #         size = float(p['long']['units']) + float(p['short']['units'])
-        #         price = (
-        #             float(p['long']['averagePrice']) if size > 0
-        #             else float(p['short']['averagePrice']))
-        #         self.positions[p['instrument']] = Position(size, price)
+        self.store.start(broker=self)  # the account opens in the background
+        self._started = False
 
     def stop(self):
         super(FutuBroker, self).stop()
         self.store.stop()
 
+    def _startvalues(self):
+        # Read on first use, once the store has opened the account
+        self._started = True
+        self.startingcash = self.cash = self.store.get_cash()
+        self.startingvalue = self.value = self.store.get_value()
+
+    def setcash(self, cash):
+        '''Sets the cash of a simulation'''
+        if not self.p.simulate:
+            raise FutuNotSupported('the cash of an account is not set')
+        self.p.cash = cash
+        self.store.set_cash(cash)
+
     def getcash(self):
-        # This call cannot block if no answer is available from oanda
+        if not self._started:
+            self._startvalues()
+        # Read from the account state kept by the store, no call to OpenD
         self.cash = cash = self.store.get_cash()
         return cash
 
     def getvalue(self, datas=None):
+        if not self._started:
+            self._startvalues()
         self.value = self.store.get_value()
         return self.value
 
     def getposition(self, data, clone=True):
-        # return self.o.getposition(data._dataname, clone=clone)
-        pos = self.positions[data._dataname]
+        # Seeded by the store from the account, a lookup without allocation
+        pos = self.positions.get(data._dataname)
         if clone:
             pos = pos.clone()
 
         return pos
 
+    def get_notification(self):
+        return self.notifs.get()
+
+    def next(self):
+        if self.p.simulate:
+            return self.store.next()
+
+        recovered = self.store.recovered()
+        if recovered:
+            self._recovering.extend(recovered)
+        if self._recovering:
+            self._recover()
+
+    def _recover(self):
+        # The orders alive at OpenD from the journal of the process before
+        # the restart, created again and owned by the first strategy once
+        # their data has a bar. Their oco groups and brackets are not
+        # journaled
+        entries, self._recovering = self._recovering, []
+        for e in entries:
+            data = self.store.getdatabyname(e.code)
+            if data is None:
+                self.store.put_notification(
+                    'no data %s for recovered order %d' % (e.code, e.ref))
+                continue
+            if not len(data):
+                self._recovering.append(e)
+                continue
+
+            ordercls = BuyOrder if e.isbuy else SellOrder
+            order = ordercls(owner=None, data=data, size=e.size,
+                             price=e.price or None,
+                             pricelimit=e.pricelimit or None,
+                             exectype=e.exectype,
+                             trailamount=e.trailamount or None,
+                             trailpercent=e.trailpercent or None)
+            order.ref = e.ref
+            if e.exectype in (order.StopTrail, order.StopTrailLimit):
+                # trailed from the stop it had when journaled
+                order.created.price = e.price
+                order.created.pricelimit = e.pricelimit
+            order.addinfo(trade=e.key[0], acc_id=e.key[1], trd_env=e.key[2])
+            order.addcomminfo(self.getcommissioninfo(data))
+            self.orders[order.ref] = order
+            self._ocoize(order, None)
+
+            order.submit(self)
+            if e.oid is not None:
+                order.accept(self)
+            if e.dealt:
+                size = e.dealt if e.isbuy else -e.dealt
+                pos = self.getposition(data, clone=False)
+                order.execute(0.0, size, e.avgprice, 0, 0.0, 0.0,
+                              size, 0.0, 0.0, 0.0, 0.0, pos.size, pos.price)
+                order.partial()
+            self.notify(order)
+            self.store.adopt(order, e)
+
     def orderstatus(self, order):
         o = self.orders[order.ref]
         return o.status
@@ -131,8 +260,9 @@ class FutuBroker(with_metaclass(MetaFutuBroker, BrokerBase)):
                          histnotify=histnotify)
 
         order.addinfo(**kwargs)
+        order.addcomminfo(self.getcommissioninfo(data))
         self._ocoize(order, oco)
-        return self.submit(order, check=_checksubmit)
+        return self._transmit(order)
 
     def sell(self, owner, data,
              size, price=None, plimit=None,
@@ -149,11 +279,259 @@ class FutuBroker(with_metaclass(MetaFutuBroker, BrokerBase)):
                           histnotify=histnotify)
 
         order.addinfo(**kwargs)
+        order.addcomminfo(self.getcommissioninfo(data))
         self._ocoize(order, oco)
         return self._transmit(order)
 
+    def submit_basket(self, orders, owner=None, name=None):
+        '''Submits ``orders`` together and returns their ``Basket``.
+
+        Each order is a dict with the ``data`` and the ``size``, negative
+        to sell, and any other argument of ``buy``/``sell``. The orders are
+        checked against the static data of the store, those of odd lots, of
+        codes with no known lot or at market on a closed day are rejected.
+        The buying power is checked once for the basket, the buys are
+        rejected if their value less the one of the sells is over it. The
+        sells are sent before the buys, all of them to the order workers of
+        the store, which place them concurrently within the rate limits.
+
+        ``owner`` defaults to the first strategy for the notifications.
+        '''
+        basket = Basket(name)
+        buys, sells = [], []
+        for spec in orders:
+            kwargs = dict(spec)
+            data, size = kwargs.pop('data'), kwargs.pop('size')
+            ordercls = BuyOrder if size > 0 else SellOrder
+            order = ordercls(
+                owner=owner, data=data, size=abs(size),
+                price=kwargs.pop('price', None),
+                pricelimit=kwargs.pop('plimit', None),
+                exectype=kwargs.pop('exectype', None),
+                valid=kwargs.pop('valid', None),
+                tradeid=kwargs.pop('tradeid', 0),
+                trailamount=kwargs.pop('trailamount', None),
+                trailpercent=kwargs.pop('trailpercent', None))
+            order.addinfo(**kwargs)
+            order.addcomminfo(self.getcommissioninfo(data))
+            self.orders[order.ref] = order
+            self._ocoize(order, None)
+            self._baskets[order.ref] = basket
+            basket._add(order)
+            (buys if size > 0 else sells).append(order)
+
+        rejects = []
+        for order in sells + buys:
+            msg = ('exectype not supported' if not self.store.supports(order)
+                   else self.store.checkorder(order))
+            if msg is not None:
+                rejects.append((order, msg))
+
+        value = 0.0
+        invalid = set(order.ref for order, _ in rejects)
+        for order in sells + buys:
+            if order.ref not in invalid:  # rejected, never placed
+                created = order.created
+                value += created.size * (created.pricelimit or created.price)
+        power = self.store.get_power()
+        if value > power:
+            self.store.put_notification(
+                'basket %s value %.2f over buying power %.2f, buys rejected'
+                % (name, value, power))
+            rejects.extend((order, None) for order in buys)
+
+        rejected = set()
+        for order, msg in rejects:
+            if order.ref not in rejected:
+                rejected.add(order.ref)
+                if msg is not None:
+                    self.store.put_notification(msg, oref=order.ref)
+                order.submit(self)
+                self._reject(order.ref)
+
+        for order in sells + buys:
+            if order.ref not in rejected:
+                self.store.order_create(order)
+
+        return basket
+
+    def cancel(self, order):
+        o = self.orders[order.ref]
+        if not o.alive():  # already cancelled or done
+            return
+
+        pref = getattr(o.parent, 'ref', None)
+        if pref is not None and self.brackets.get(pref, [None])[0] is not None:
+            # child held until its parent executes, never sent
+            return self._cancel(o.ref)
+
+        return self.store.order_cancel(order)
+
     def notify(self, order):
-        self.notifs.append(order.clone())
+        # cloned on delivery, superseded transitions coalesce until then
+        self.notifs.put(order)
+
+    def _ocoize(self, order, oco):
+        oref = order.ref
+        if oco is None:
+            self._ocos[oref] = oref  # current order is parent
+            self._ocol[oref].append(oref)  # create ocogroup
+        else:
+            ocoref = self._ocos[oco.ref]  # ref to group leader
+            self._ocos[oref] = ocoref  # ref to group leader
+            self._ocol[ocoref].append(oref)  # add to group
+
+    def _ococheck(self, order):
+        # The first execution or the end of an order cancels the others of
+        # its oco group
+        ocoref = self._ocos.get(order.ref, order.ref)
+        for oref in self._ocol.pop(ocoref, ()):
+            o = self.orders.get(oref, None)
+            if o is not None and o is not order and o.alive():
+                self.cancel(o)
+
+    def _basketcheck(self, order):
+        basket = self._baskets.pop(order.ref, None)
+        if basket is not None and basket._end(order):
+            self.store.put_notification(basket)
+
+    def _bracketize(self, order, cancel=False):
+        pref = getattr(order.parent, 'ref', order.ref)  # parent ref or self
+        br = self.brackets.get(pref, None)
+        if br is None:
+            return
+
+        parent = br[0]
+        if not cancel:
+            if order is parent:
+                if order.status != order.Completed:
+                    return  # children are sent for the whole size only
+                # parent done: send the children, which cancel each other
+                br[0] = None
+                for o in br[1:]:
+                    if o is not None:
+                        self.store.order_send(o)
+                return
+
+            # filling a child: cancel the other one
+            del self.brackets[pref]
+            for o in br[1:]:
+                if o is not None and o is not order:
+                    self.cancel(o)
+            return
+
+        # Any cancellation cancels the others, the children never sent are
+        # cancelled here
+        del self.brackets[pref]
+        for o in br:
+            if o is None or o is order or not o.alive():
+                continue
+            if parent is not None and o is not parent:
+                self._cancel(o.ref)
+            else:
+                self.cancel(o)
+
+    # The store calls these from its threads with the ref of the order. A
+    # transition may be reported more than once, e.g. by place_order and
+    # then by the order push
+    def _submit(self, oref):
+        order = self.orders[oref]
+        order.submit(self)
+        self.notify(order)
+
+    def _accept(self, oref):
+        order = self.orders[oref]
+        if order.status != order.Submitted:
+            return
+
+        order.accept(self)
+        self.notify(order)
+
+    def _reject(self, oref):
+        order = self.orders[oref]
+        if not order.alive():
+            return
+
+        order.reject(self)
+        self.notify(order)
+        self._bracketize(order, cancel=True)
+        self._ococheck(order)
+        self._basketcheck(order)
+
+    def _cancel(self, oref):
+        order = self.orders[oref]
+        if not order.alive():
+            return
+
+        order.cancel()
+        self.notify(order)
+        self._bracketize(order, cancel=True)
+        self._ococheck(order)
+        self._basketcheck(order)
+
+    def _margin(self, oref):
+        order = self.orders[oref]
+        if not order.alive():
+            return
+
+        order.margin()
+        self.notify(order)
+        self._bracketize(order, cancel=True)
+        self._ococheck(order)
+        self._basketcheck(order)
+
+    def _expire(self, oref):
+        order = self.orders[oref]
+        if not order.alive():
+            return
+
+        order.expire()
+        self.notify(order)
+        self._bracketize(order, cancel=True)
+        self._ococheck(order)
+        self._basketcheck(order)
+
+    def _fill(self, oref, size, price):
+        order = self.orders[oref]
+        first = not order.executed.size
+        if not order.isbuy():
+            size = -size
+
+        data = order.data
+        pprice_orig = self.positions.get(data._dataname).price
+        psize, pprice, opened, closed = self.positions.update(
+            data._dataname, size, price)
+
+        # commission of the whole fill, shared by its closing and opening
+        # parts for the minimums not to be charged twice
+        comminfo = order.comminfo
+        comm = comminfo.getcommission(size, price)
+        closedcomm = comm * abs(closed) / abs(size)
+        openedcomm = comm - closedcomm
+        closedvalue = comminfo.getoperationcost(closed, pprice_orig)
+        openedvalue = comminfo.getoperationcost(opened, price)
+        pnl = comminfo.profitandloss(-closed, pprice_orig, price)
+        margin = 0.0
+
+        with self.notifs.lock:  # not cloned halfway by get_notification
+            self.notifs.executing(order)
+            order.execute(data.datetime[0], size, price,
+                          closed, closedvalue, closedcomm,
+                          opened, openedvalue, openedcomm,
+                          margin, pnl,
+                          psize, pprice)
+
+            if order.executed.remsize:
+                order.partial()
+            else:
+                order.completed()
+            self.notify(order)
+
+        self._bracketize(order)
+        if first:
+            self._ococheck(order)
+        if not order.executed.remsize:
+            self._basketcheck(order)
 
     def _transmit(self, order):
         oref = order.ref
@@ -178,7 +556,7 @@ class FutuBroker(with_metaclass(MetaFutuBroker, BrokerBase)):
                     if o is not None:
                         self.orders[o.ref] = o  # write them down
                 self.brackets[pref] = [parent, stopside, takeside]
-                self.o.order_create(parent, stopside, takeside)
+                self.store.order_create(parent, stopside, takeside)
                 return takeside or stopside
 
             else:  # Parent order, which is being transmitted
@@ -21,28 +21,443 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-import time
-from collections import deque
+import itertools
+from concurrent.futures import wait
 from datetime import datetime
 
-import backtrader as bt
+import futu as ft
+from backtrader import date2num, num2date
+import numpy as np
 from backtrader.feed import DataBase
 from backtrader.utils.py3 import with_metaclass
 
 from . import FutuStore
+from .aggregator import ALLDAY, SESSIONS, BarAggregator
+from .decode import DATETIME, NCOLS, fill_lines
+from .exceptions import FutuNotSupported, FutuRequestError
+from .gateway import ShmRingReader, ring_name
+from .history import INTRADAY
+from .ringbuffer import RingBuffer
 
 
 class MetaFutuFeed(DataBase.__class__):
     def __init__(cls, name, bases, dct):
         '''Class has already been created ... register'''
-        print(DataBase.__class__)
         # Initialize the class
         super(MetaFutuFeed, cls).__init__(name, bases, dct)
 
-        # Register with the store
-        FutuStore.DataCls = cls
+        # Register with the store, unless it is a specialized feed
+        if dct.get('_register', True):
+            FutuStore.DataCls = cls
 
 
 class FutuFeed(with_metaclass(MetaFutuFeed, DataBase)):
+    '''Futu Data Feed.
+
+    ``dataname`` is the futu code, e.g. ``HK.00700``.
+
+    Params:
+
+      - ``subtype`` (default: ``ft.SubType.K_1M``)
+
+        The futu push to subscribe to. K-line subtypes deliver a bar once
+        futu starts pushing the next one, ``TICKER`` delivers every trade
+        and ``QUOTE`` every quote update as a single price bar
+
+      - ``historical`` (default: ``False``)
+
+        If set to ``True`` the data feed will stop after doing the first
+        download of data.
+
+        The standard data feed parameters ``fromdate`` and ``todate`` will be
+        used as reference.
+
+      - ``backfill_start`` (default: ``True``)
+
+        Backfill K-lines from ``fromdate`` with ``request_history_kline``
+        before switching to the pushed bars. Requests of all the datas run
+        concurrently in the store and can be cached on disk with the
+        ``histcache`` param of the store
+
+      - ``qcheck`` (default: ``0.5``)
+
+        Time in seconds to wake up if no data is received to give a chance to
+        resample/replay packets properly and pass notifications up the chain
+
+      - ``qsize`` (default: ``4096``)
+
+        Number of bars the push buffer holds before ``backpressure`` applies
+
+      - ``backpressure`` (default: ``RingBuffer.DropOldest``)
+
+        One of ``RingBuffer.DropOldest``, ``RingBuffer.Coalesce`` or
+        ``RingBuffer.Block``. The ``dropped`` and ``coalesced`` counters of
+        ``qlive`` tell how often it kicked in
+
+      - ``aggregate`` (default: ``None``)
+
+        Build the bars from ``TICKER`` pushes instead of using futu K-lines,
+        which also forces ``subtype`` to ``TICKER``. One of
+        ``BarAggregator.Time``, ``BarAggregator.Ticks``,
+        ``BarAggregator.Volume`` or ``BarAggregator.Dollar``. Set
+        ``timeframe`` and ``compression`` accordingly for the benefit of
+        analyzers, e.g. ``bt.TimeFrame.Seconds`` and ``10`` for 10 second
+        bars
+
+      - ``aggsize`` (default: ``10``)
+
+        Seconds per bar for ``Time`` and trades, shares or turnover per bar
+        for the others
+
+      - ``sessions`` (default: ``None``)
+
+        Trading sessions used by ``aggregate``, see ``BarAggregator``.
+        ``None`` picks the sessions of the market of ``dataname`` from
+        ``aggregator.SESSIONS``
+
+      - ``gateway`` (default: ``None``)
+
+        Name of a ``FutuGateway`` running in another process to read the
+        pushes from, through shared memory, instead of subscribing. The
+        history is still backfilled by the store. Not available with
+        ``aggregate``
+
+      - ``poll`` (default: ``False``)
+
+        Poll ``get_market_snapshot`` every ``snapshot`` seconds of the store
+        instead of subscribing, for watchlists beyond the subscription quota
+        of OpenD. A single price bar with the day volume is delivered when
+        the last price or the volume changed, as for ``QUOTE`` which
+        ``subtype`` is forced to. Not available with ``aggregate``,
+        ``gateway`` or order books
+    '''
+    params = (
+        ('subtype', ft.SubType.K_1M),
+        ('historical', False),
+        ('backfill_start', True),
+        ('qcheck', 0.5),
+        ('qsize', 4096),
+        ('backpressure', RingBuffer.DropOldest),
+        ('aggregate', None),
+        ('aggsize', 10),
+        ('sessions', None),
+        ('gateway', None),
+        ('poll', False),
+    )
+
+    _store = FutuStore
+
+    # subtypes which may deliver several bars with the same time
+    _TICKS = (ft.SubType.TICKER, ft.SubType.QUOTE, ft.SubType.ORDER_BOOK)
+
+    # States for the Finite State Machine in _load
+    _ST_HISTORBACK, _ST_LIVE, _ST_OVER = range(3)
+
     def islive(self):
-        return True
\ No newline at end of file
+        '''Historical datas are not live, which lets cerebro preload them'''
+        return not self.p.historical
+
+    def __init__(self, **kwargs):
+        self.o = self._store(**kwargs)
+        self.qlive = RingBuffer(self.p.qsize, self.p.backpressure)
+        self._curbar = None
+
+        if self.p.poll:
+            if (self.p.aggregate is not None or self.p.gateway is not None or
+                    self.p.subtype == ft.SubType.ORDER_BOOK):
+                raise FutuNotSupported('poll with aggregate, a gateway or '
+                                       'an order book')
+            self.p.subtype = ft.SubType.QUOTE
+
+        self._agg = None
+        if self.p.aggregate is not None:
+            if self.p.gateway is not None:
+                raise FutuNotSupported('aggregate with a gateway')
+            self.p.subtype = ft.SubType.TICKER
+            sessions = self.p.sessions
+            if sessions is None:
+                market = self.p.dataname.split('.')[0]
+                sessions = SESSIONS.get(market, ALLDAY)
+            put = self.qlive.put
+            if self.o.latency is not None:
+                put = self._putstamped
+            self._agg = BarAggregator(self.p.aggregate, self.p.aggsize,
+                                      put, sessions)
+
+        self._kline = self.p.subtype not in self._TICKS
+        # time bars have unique times, the other aggregates may not
+        self._ticks = not self._kline and \
+            self.p.aggregate != BarAggregator.Time
+
+    def setenvironment(self, env):
+        '''Receives an environment (cerebro) and passes it over to the store it
+        belongs to'''
+        super(FutuFeed, self).setenvironment(env)
+        env.addstore(self.o)
+
+    def start(self):
+        super(FutuFeed, self).start()
+        self._start_finish()
+        self.o.register(self)
+        self.qlive.clear()
+        self._curbar = None
+        if self._agg is not None:
+            self._agg.reset()
+        self._state = self._ST_LIVE
+        self._hist = self._histrows = None
+
+        if self.p.historical or self.p.backfill_start:
+            if self._kline and self.fromdate > float('-inf'):
+                self._st_historback()
+
+        if self.p.historical:
+            if self._hist is None:
+                self.put_notification(self.DISCONNECTED)
+                self._state = self._ST_OVER
+            return
+
+        if self.p.gateway is not None:
+            name = ring_name(self.p.gateway, self.p.dataname, self.p.subtype)
+            try:
+                self.qlive = ShmRingReader(name)
+            except (OSError, ValueError):  # gateway not running
+                self._subscribe_failed('no gateway ring %s' % name)
+            return
+
+        if not self.o.start(data=self):
+            self.put_notification(self.NOTSUBSCRIBED)
+            self._state = self._ST_OVER
+
+    def _st_historback(self):
+        now = datetime.now()
+        if self.todate < float('inf'):
+            dtend = num2date(self.todate)
+            self._histlimit = self.todate
+        else:
+            dtend = now
+            if self.p.subtype in INTRADAY:
+                self._histlimit = date2num(now)  # time_key is the bar end
+            else:  # today's bar is not complete yet
+                self._histlimit = date2num(
+                    datetime(now.year, now.month, now.day)) - 1e-9
+
+        self._hist = self.o.backfill(self, num2date(self.fromdate), dtend)
+        self.put_notification(self.DELAYED)
+        self._state = self._ST_HISTORBACK
+
+    def stop(self):
+        super(FutuFeed, self).stop()
+        if isinstance(self.qlive, ShmRingReader):
+            self.qlive.close()
+            self.qlive = RingBuffer(self.p.qsize, self.p.backpressure)
+        self.o.unsubscribe(self)
+        self.o.stop()
+
+    def _subscribe_failed(self, msg):
+        self.put_notification(self.NOTSUBSCRIBED, msg)
+        self._state = self._ST_OVER
+
+    def haslivedata(self):
+        return bool(self.qlive)
+
+    def _putstamped(self, bar):
+        # with the latency stamps of the push appended to the bar
+        self.qlive.put(list(bar) + self.o.latency.stamps())
+
+    def push(self, bars):
+        '''Called from the futu callback threads with the bar array decoded
+        from a push'''
+        agg = self._agg
+        if agg is not None:
+            add = agg.add
+            for dt, price, _, _, _, volume in bars.tolist():
+                add(dt, price, volume)
+            return
+
+        put = self.qlive.put
+        if self.o.latency is not None:
+            put = self._putstamped
+
+        if not self._kline:
+            for bar in bars.tolist():
+                put(bar)
+            return
+
+        # futu keeps pushing the bar in progress, it is complete once the
+        # next time_key shows up
+        curbar = self._curbar
+        for bar in bars.tolist():
+            if curbar is not None and curbar[0] != bar[0]:
+                put(curbar)
+            curbar = bar
+        self._curbar = curbar
+
+    def preload(self):
+        '''Historical datas without filters bulk-load the downloaded arrays
+        into the lines instead of going through ``_load`` bar by bar'''
+        if (self._state != self._ST_HISTORBACK or self._filters or
+                self._tzinput):
+            return super(FutuFeed, self).preload()
+
+        try:
+            arrays = self._hist.result()
+        except FutuRequestError as e:
+            arrays = []
+            self.put_notification(self.NOTSUBSCRIBED, str(e))
+
+        bars = np.concatenate(arrays) if arrays else np.empty((0, NCOLS))
+        dts = bars[:, DATETIME]
+        keep = dts <= self._histlimit
+        keep[1:] &= dts[1:] > dts[:-1]  # time already seen
+        fill_lines(self, bars[keep])
+
+        self._hist = None
+        self.put_notification(self.DISCONNECTED)
+        self._state = self._ST_OVER
+        self._last()
+        self.home()
+
+    def _load(self):
+        self.o.flush_subscriptions()
+        if self._state == self._ST_OVER:
+            return False
+
+        while True:
+            if self._state == self._ST_HISTORBACK:
+                if self._histrows is None:
+                    # historical datas are preloaded and have to wait
+                    tmout = None if self.p.historical else self._qcheck
+                    if wait([self._hist], timeout=tmout).not_done:
+                        return None  # still downloading
+
+                    try:
+                        arrays = self._hist.result()
+                    except FutuRequestError as e:
+                        # no backfill, live datas go on with the pushes
+                        self.put_notification(self.NOTSUBSCRIBED, str(e))
+                        arrays = []
+
+                    self._histrows = itertools.chain.from_iterable(arrays)
+
+                bar = next(self._histrows, None)
+                if bar is not None and bar[0] <= self._histlimit:
+                    if self._load_bar(bar):
+                        return True
+                    continue
+
+                self._hist = self._histrows = None
+                if self.p.historical:
+                    self.put_notification(self.DISCONNECTED)
+                    self._state = self._ST_OVER
+                    return False
+
+                self._state = self._ST_LIVE
+                continue
+
+            pushesdone = self.o.pushesdone()
+            if self.p.gateway is not None:
+                pushesdone = self.qlive.closed  # the gateway stopped
+            bar = self.qlive.get(timeout=self._qcheck)
+            if bar is None and self._agg is not None:
+                # no trade may come to close the bar, flush it at the end
+                # of a replayed push log
+                self._agg.expire(force=pushesdone)
+                bar = self.qlive.get()
+
+            if bar is None:
+                if pushesdone:  # end of a replayed push log
+                    self.put_notification(self.DISCONNECTED)
+                    self._state = self._ST_OVER
+                    return False
+                return None  # indicate timeout situation
+
+            if self._laststatus != self.LIVE:
+                self.put_notification(self.LIVE)
+
+            if self._load_bar(bar):
+                if self.p.gateway is not None:
+                    # no push in this process for the store to arm on
+                    self.o.gatewayprice(self.p.dataname, bar[4])
+                elif self.o.latency is not None:
+                    self.o.latency.loaded(bar[-2:])  # the stamps of the push
+                return True
+
+    def _load_bar(self, bar):
+        dt = bar[0]
+        lastdt = self.lines.datetime[-1]
+        if dt < lastdt or (dt == lastdt and not self._ticks):
+            return False  # time already seen
+
+        lines = self.lines
+        lines.datetime[0] = dt
+        lines.open[0] = bar[1]
+        lines.high[0] = bar[2]
+        lines.low[0] = bar[3]
+        lines.close[0] = bar[4]
+        lines.volume[0] = bar[5]
+        lines.openinterest[0] = 0.0
+        return True
+
+
+class FutuBookFeed(FutuFeed):
+    '''Futu order book feed.
+
+    Subscribes to ``ORDER_BOOK`` pushes and delivers a bar per push with the
+    mid price as OHLC and these extra lines:
+
+      - ``bid``, ``ask``: best bid and ask prices
+      - ``spread``: ``ask - bid``
+      - ``microprice``: mid price weighted by the volume of the other side
+      - ``imbalance``: ``(bidvol - askvol) / (bidvol + askvol)`` over the
+        first ``levels`` levels
+
+    The full depth is available as ``book``, an ``OrderBook`` shared by the
+    datas of the same code and updated in place by the store.
+
+    Params:
+
+      - ``depth`` (default: ``10``)
+
+        Number of levels kept per side
+
+      - ``levels`` (default: ``None``)
+
+        Number of levels used for ``imbalance``. ``None`` means all
+    '''
+    _register = False
+
+    lines = ('bid', 'ask', 'spread', 'microprice', 'imbalance',)
+
+    params = (
+        ('subtype', ft.SubType.ORDER_BOOK),
+        ('backfill_start', False),
+        ('backpressure', RingBuffer.Coalesce),
+        ('depth', 10),
+        ('levels', None),
+    )
+
+    book = None
+
+    def pushbook(self, book):
+        '''Called from the futu callback thread after ``book`` has been
+        updated'''
+        bid, ask, spread, microprice, imbalance = book.stats(self.p.levels)
+        mid = (bid + ask) / 2.0
+        bar = (book.dt, mid, mid, mid, mid, 0.0,
+               bid, ask, spread, microprice, imbalance)
+        if self.o.latency is not None:
+            self._putstamped(bar)
+        else:
+            self.qlive.put(bar)
+
+    def _load_bar(self, bar):
+        if not super(FutuBookFeed, self)._load_bar(bar):
+            return False
+
+        lines = self.lines
+        lines.bid[0] = bar[6]
+        lines.ask[0] = bar[7]
+        lines.spread[0] = bar[8]
+        lines.microprice[0] = bar[9]
+        lines.imbalance[0] = bar[10]
+        return True
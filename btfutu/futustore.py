@@ -26,13 +26,31 @@ import threading
 from datetime import datetime
 from functools import wraps
 import collections
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 
 import backtrader as bt
 import futu as ft
+from futu.common.utils import merge_qot_mkt_stock_str
 from backtrader.metabase import MetaParams
-from backtrader.utils.py3 import with_metaclass
+from backtrader.utils.py3 import queue, with_metaclass
 
-from btfutu.exceptions import FutuNotSupported
+from btfutu.account import TradeAccount
+from btfutu.decode import (CLOSE, kline_to_array, quote_to_array,
+                           ticker_to_array)
+from btfutu.exceptions import FutuNotSupported, FutuRequestError
+from btfutu.history import HistoryCache, HistoryLoader
+from btfutu.journal import OrderJournal
+from btfutu.latency import LatencyRecorder
+from btfutu.notifications import MessageQueue
+from btfutu.orderbook import OrderBook
+from btfutu.positions import PositionBook
+from btfutu.pushlog import PushLogWriter, PushReplayContext
+from btfutu.ratelimit import Coalescer, RateLimiter, WriteQueue
+from btfutu.snapshot import SnapshotPoller
+from btfutu.staticdata import StaticData
+from btfutu.subscriptions import SubscriptionRegistry
+from btfutu.triggers import TriggerEngine
 
 
 class MetaSingleton(MetaParams):
@@ -51,66 +69,130 @@ class MetaSingleton(MetaParams):
 
 
 class FutuTradeOrderHandler(ft.TradeOrderHandlerBase):
+    def __init__(self, store):
+        super(FutuTradeOrderHandler, self).__init__()
+        self.store = store
+
     def on_recv_rsp(self, rsp_pb):
         ret, content = super(FutuTradeOrderHandler, self).on_recv_rsp(rsp_pb)
 
         if ret == ft.RET_OK:
-            print("* FutuTradeOrderHandler RET_OK content=\n{}\n".format(content.to_json()))
-            order_status = content['order_status']
-            oid = content['order_id']
-            if order_status == ft.OrderStatus.UNSUBMITTED:
-                pass
-            elif order_status == ft.OrderStatus.WAITING_SUBMIT:
-                pass
-            elif order_status == ft.OrderStatus.SUBMITTING:
-                pass
-            elif order_status == ft.OrderStatus.SUBMITTED:
-                pass
-            elif order_status == ft.OrderStatus.SUBMIT_FAILED:
-                pass
-            elif order_status == ft.OrderStatus.FILLED_PART:
-                pass
-            elif order_status == ft.OrderStatus.FILLED_ALL:
-                pass
-            elif order_status == ft.OrderStatus.FILL_CANCELLED:
-                pass
-            elif order_status == ft.OrderStatus.CANCELLING_PART:
-                pass
-            elif order_status == ft.OrderStatus.CANCELLED_PART:
-                pass
-            elif order_status == ft.OrderStatus.CANCELLING_ALL:
-                pass
-            elif order_status == ft.OrderStatus.CANCELLED_ALL:
-                pass
-            elif order_status == ft.OrderStatus.TIMEOUT:
-                pass
-            elif order_status == ft.OrderStatus.FAILED:
-                pass
-            elif order_status == ft.OrderStatus.DISABLED:
-                pass
-            elif order_status == ft.OrderStatus.DELETED:
-                pass
-            elif order_status == ft.OrderStatus.NONE:
-                pass
-            else:
-                pass
-
+            self.store._order_updates(content)
         else:
-            print("* FutuTradeOrderHandler RET_ERROR content=\n{}\n".format(content.to_json))
+            self.store.put_notification(content)
 
         return ret, content
 
 
 class FutuTradeDealHandler(ft.TradeDealHandlerBase):
+    def __init__(self, store, trade):
+        super(FutuTradeDealHandler, self).__init__()
+        self.store = store
+        self.trade = trade
+
     def on_recv_rsp(self, rsp_pb):
         ret, content = super(FutuTradeDealHandler, self).on_recv_rsp(rsp_pb)
 
         if ret == ft.RET_OK:
-            print("* TradeDealTest content=\n{}\n".format(content))
+            header = rsp_pb.s2c.header
+            self.store._deals(self.trade, header.accID,
+                              ft.TrdEnv.to_string2(header.trdEnv), content)
+
+        return ret, content
+
+
+class FutuCurKlineHandler(ft.CurKlineHandlerBase):
+    def __init__(self, store):
+        super(FutuCurKlineHandler, self).__init__()
+        self.store = store
+
+    def on_recv_rsp(self, rsp_pb):
+        latency = self.store.latency
+        if latency is not None:
+            latency.received()
+        if self.store.recorder is not None:
+            self.store.recorder.write(ft.ProtoId.Qot_UpdateKL, rsp_pb)
+
+        ret, content = super(FutuCurKlineHandler, self).on_recv_rsp(rsp_pb)
+
+        if ret == ft.RET_OK:
+            bars = kline_to_array(content)
+            if latency is not None:
+                latency.decoded()
+            self.store._pushframe(content['k_type'].values[0], content, bars)
 
         return ret, content
 
 
+class FutuTickerHandler(ft.TickerHandlerBase):
+    def __init__(self, store):
+        super(FutuTickerHandler, self).__init__()
+        self.store = store
+
+    def on_recv_rsp(self, rsp_pb):
+        latency = self.store.latency
+        if latency is not None:
+            latency.received()
+        if self.store.recorder is not None:
+            self.store.recorder.write(ft.ProtoId.Qot_UpdateTicker, rsp_pb)
+
+        ret, content = super(FutuTickerHandler, self).on_recv_rsp(rsp_pb)
+
+        if ret == ft.RET_OK:
+            bars = ticker_to_array(content)
+            if latency is not None:
+                latency.decoded()
+            self.store._pushframe(ft.SubType.TICKER, content, bars)
+
+        return ret, content
+
+
+class FutuStockQuoteHandler(ft.StockQuoteHandlerBase):
+    def __init__(self, store):
+        super(FutuStockQuoteHandler, self).__init__()
+        self.store = store
+
+    def on_recv_rsp(self, rsp_pb):
+        latency = self.store.latency
+        if latency is not None:
+            latency.received()
+        if self.store.recorder is not None:
+            self.store.recorder.write(ft.ProtoId.Qot_UpdateBasicQot, rsp_pb)
+
+        ret, content = super(FutuStockQuoteHandler, self).on_recv_rsp(rsp_pb)
+
+        if ret == ft.RET_OK:
+            bars = quote_to_array(content)
+            if latency is not None:
+                latency.decoded()
+            self.store._pushframe(ft.SubType.QUOTE, content, bars)
+
+        return ret, content
+
+
+class FutuOrderBookHandler(ft.OrderBookHandlerBase):
+    def __init__(self, store):
+        super(FutuOrderBookHandler, self).__init__()
+        self.store = store
+
+    def on_recv_rsp(self, rsp_pb):
+        latency = self.store.latency
+        if latency is not None:
+            latency.received()
+        if self.store.recorder is not None:
+            self.store.recorder.write(ft.ProtoId.Qot_UpdateOrderBook, rsp_pb)
+
+        # The base class parses each level into tuples and dicts, the books
+        # are updated in place from the protobuf instead
+        if rsp_pb.retType != ft.RET_OK:
+            return ft.RET_ERROR, rsp_pb.retMsg
+
+        if latency is not None:
+            latency.decoded()
+        self.store._pushbook(rsp_pb.s2c)
+        return ft.RET_OK, rsp_pb.s2c
+
+
 class FutuStoreException(Exception):
     pass
 
@@ -124,12 +206,112 @@ class FutuStore(with_metaclass(MetaSingleton, object)):
 
     (HKTrade, CNTrade, USTrade, FutureTrade, HKCCTrade) = range(5)
 
+    # OpenD limits per trade interface: calls per period and the minimum
+    # seconds between two calls
+    _RATELIMITS = {
+        'place_order': (15, 30.0, 0.02),
+        'modify_order': (20, 30.0, 0.04),
+        'accinfo_query': (10, 30.0),
+        'position_list_query': (10, 30.0),
+        'order_list_query': (10, 30.0),
+        'deal_list_query': (10, 30.0),
+    }
+
+    # Lanes of the order writes, cancels first
+    _LANE_CANCEL, _LANE_PLACE = range(2)
+
+    # Context class of each trade type, looked up in futu when opened, and
+    # its keyword arguments
+    _TRADECTXS = {
+        HKTrade: ('OpenSecTradeContext',
+                  dict(filter_trdmarket=ft.TrdMarket.HK)),
+        CNTrade: ('OpenSecTradeContext',
+                  dict(filter_trdmarket=ft.TrdMarket.CN)),
+        USTrade: ('OpenSecTradeContext',
+                  dict(filter_trdmarket=ft.TrdMarket.US)),
+        FutureTrade: ('OpenFutureTradeContext', dict()),
+        HKCCTrade: ('OpenSecTradeContext',
+                    dict(filter_trdmarket=ft.TrdMarket.HKCC)),
+    }
+
+    # Trade type of the orders by market prefix of the code of their data
+    _MARKETS = {
+        'HK': HKTrade,
+        'US': USTrade,
+        'SH': CNTrade,
+        'SZ': CNTrade,
+    }
+
+    # Markets of the static data of each trade type
+    _TRADEMARKETS = {
+        HKTrade: ('HK',),
+        USTrade: ('US',),
+        CNTrade: ('SH', 'SZ'),
+        HKCCTrade: ('SH', 'SZ'),
+    }
+
+    # Transition of the backtrader order for each futu order status, after
+    # any increase of the dealt quantity has been filled. Statuses not in the
+    # table leave the order as it is
+    _ORDERSTATUS = {
+        ft.OrderStatus.SUBMITTED: '_accept',
+        ft.OrderStatus.CANCELLED_PART: '_cancel',
+        ft.OrderStatus.CANCELLED_ALL: '_cancel',
+        ft.OrderStatus.DISABLED: '_cancel',
+        ft.OrderStatus.DELETED: '_cancel',
+        ft.OrderStatus.SUBMIT_FAILED: '_reject',
+        ft.OrderStatus.FAILED: '_reject',
+        ft.OrderStatus.TIMEOUT: '_expire',
+    }
+
+    # Statuses after which nothing happens to an order any longer
+    _ENDSTATUS = frozenset(
+        [ft.OrderStatus.FILLED_ALL] +
+        [status for status in _ORDERSTATUS
+         if status != ft.OrderStatus.SUBMITTED])
+
+    _ORDEREXECS = {
+        bt.Order.Market: ft.OrderType.MARKET,
+        bt.Order.Limit: ft.OrderType.NORMAL,
+    }
+
+    # Orders triggered by the store and the type they are placed as then
+    _TRIGGERS = {
+        bt.Order.Stop: ft.OrderType.MARKET,
+        bt.Order.StopTrail: ft.OrderType.MARKET,
+        bt.Order.StopLimit: ft.OrderType.NORMAL,
+        bt.Order.StopTrailLimit: ft.OrderType.NORMAL,
+    }
+
     params = (
         ('host', '127.0.0.1'),
-        ('port', '11111'),
-        ('trade', HKTrade),
+        ('port', 11111),
+        ('subbatch', 200),  # codes per subscribe/unsubscribe call
+        ('snapshot', 5.0),  # seconds to poll every code of the polled datas
+        ('snapbatch', 400),  # codes per get_market_snapshot call
+        ('snaprate', (60, 30.0)),  # OpenD limit: snapshots per seconds
+        ('autype', ft.AuType.QFQ),  # price adjustment of history K-lines
+        ('histcache', None),  # directory of the history cache, if any
+        ('histworkers', 4),  # threads requesting history concurrently
+        ('histrate', (60, 30.0)),  # OpenD limit: requests per seconds
+        ('record', None),  # file to record the quote pushes to
+        ('replay', None),  # recorded file to play instead of OpenD pushes
+        ('replayspeed', None),  # None: as fast as possible, else a multiple
+        ('orderworkers', 4),  # threads calling place_order concurrently
+        ('orderqsize', 1000),  # orders queued before order_create blocks
+        ('notifqsize', 1000),  # notifications queued before the oldest drop
+        ('ratelimits', None),  # name -> (calls, period, spacing) overrides
+        ('coalesce', 1.0),  # seconds a trade query result is reused
+        ('account_tmout', 10.0),  # seconds between account reconciliations
+        ('trade', HKTrade),  # for codes of other markets
+        ('acc_id', 0),  # 0: the first account of the market
         ('password', '123456'),
         ('trd_env', ft.TrdEnv.SIMULATE),
+        ('latency', False),  # stamp the push to place_order path
+        ('journal', None),  # file of the order journal, recovered at start
+        ('staticdata', None),  # directory of the static data cache, if any
+        ('staticmarkets', None),  # None: the markets of trade, () for none
+        ('static_tmout', 30.0),  # seconds orders wait for the lots at start
     )
 
     @classmethod
@@ -144,189 +326,880 @@ class FutuStore(with_metaclass(MetaSingleton, object)):
 
     def __init__(self):
         super(FutuStore, self).__init__()
-        self.notifs = collections.deque()
+        self.notifs = MessageQueue(self.p.notifqsize, marker=self._dropped)
         self.broker = None
 
         self._orders = collections.OrderedDict()
         self._ordersrev = collections.OrderedDict()
         self._transpend = collections.defaultdict(collections.deque)
+        self._cancelpend = set()
+        self._dealt = dict()  # order_id -> (dealt qty, dealt value)
+        self._inflight = 0  # place_order calls not returned
+        self._adoptpend = set()  # order_ids journaled, not adopted yet
+        self._dealpend = []  # deals of unknown orders while orders in flight
+        self._lock_orders = threading.Lock()
+        self._lock_updates = threading.Lock()
 
-        self._cash = 0.0
-        self._value = 0.0
-        self._evt_acct = threading.Event()
-
-        if self.p.trade == self.HKTrade:
-            self.trade_ctx = ft.OpenHKTradeContext(host="127.0.0.1", port=11111)
-        elif self.p.trade == self.CNTrade:
-            self.trade_ctx = ft.OpenCNTradeContext(host="127.0.0.1", port=11111)
-        elif self.p.trade == self.USTrade:
-            self.trade_ctx = ft.OpenUSTradeContext(host="127.0.0.1", port=11111)
-        elif self.p.trade == self.FutureTrade:
-            self.trade_ctx = ft.OpenFutureTradeContext(host="127.0.0.1", port=11111)
-        elif self.p.trade == self.HKCCTrade:
-            self.trade_ctx = ft.OpenHKCCTradeContext(host="127.0.0.1", port=11111)
-        else:
-            raise FutuStoreException('Unknown trade type')
+        self._orderaccts = dict()  # oref -> TradeAccount
+        self._triggers = TriggerEngine(self._fire)
+        self._armed = dict()  # oref -> place_order kwargs
+
+        self._tradectxs = dict()  # trade -> context
+        self._accounts = dict()  # (trade, acc_id, trd_env) -> TradeAccount
+        self._lock_accounts = threading.Lock()
+        self._unlocked = False
+        self.account = None  # AccountState of the default account
+        self.positions = PositionBook()  # of all the accounts
+        self.static = StaticData(self.p.staticdata)
+        self._staticpulls = dict()  # market -> Event set once pulled
+        self._tradestart = None  # thread opening the default account
+        self._pool = None  # executor of concurrent trade queries
+
+        self._t0 = None
+        self.startup = collections.OrderedDict()  # phase -> (start, secs)
+
+        self.quote_ctx = None
+        self._lock_quote = threading.Lock()
+        self.recorder = None
+        self._histloader = None
+        self._subs = SubscriptionRegistry(batchsize=self.p.subbatch)
+        self._books = dict()  # code -> OrderBook
+
+        # LatencyRecorder, stamped by the store, the datas and the broker
+        self.latency = LatencyRecorder() if self.p.latency else None
+
+        self.journal = None
+        self._journaled = None  # entries replayed, reconciled by _t_trade
+        self._recovered = None  # entries alive, for the broker to adopt
+        self._datas = dict()  # dataname -> data, for the recovered orders
+        self._poller = None  # SnapshotPoller of the polled datas
 
     def start(self, data=None, broker=None):
         if data is None and broker is None:
-            self._cash = None
             return
 
+        if self._t0 is None:
+            self._t0 = time.time()
+
         if data is not None:
-            pass
+            return self._subscribe(data)
         elif broker is not None:
             self.broker = broker
-            if self.p.trd_env == ft.TrdEnv.REAL:
-                self.trade_ctx.unlock_trade(password=self.p.password)
-            self.trd_ctx.set_handler(FutuTradeOrderHandler())
-            self.trd_ctx.set_handler(FutuTradeDealHandler())
-            self.trade_ctx.accinfo_query(trd_env=self.p.trd_env)
+            if self.p.journal is not None and self.journal is None:
+                self._open_journal()
+            self._load_static()
+            # Started before the datas by cerebro: the trade context opens,
+            # unlocks and is queried while the quote context opens and the
+            # datas backfill. The account is waited for when first read
+            self._tradestart = t = threading.Thread(target=self._t_trade)
+            t.daemon = True
+            t.start()
+
+    def _t_trade(self):
+        t = time.time()
+        try:
+            acct = self._account(self.p.trade, self.p.acc_id, self.p.trd_env)
+        except Exception as e:
+            self.put_notification(e)
+            return
+
+        self.account = acct.state
+        if self._journaled:
+            self._reconcile(self._journaled)
+        self._journaled = None
+
+        if acct.ready.wait(self.p.account_tmout):
+            self._phase('account', t)
+
+    def _load_static(self):
+        # The cached markets are used at once, those out of date are pulled
+        # in the background. Lots are looked up in the static data, ticks
+        # in the spread tables, neither needs OpenD in the order path
+        t = time.time()
+        markets = self.staticmarkets()
+        stale = [m for m in markets if not self.static.load(m)]
+        self.positions.uselots(self.static.lots)
+        if stale and self.p.replay is None:
+            for market in stale:
+                self._staticpulls[market] = threading.Event()
+            thread = threading.Thread(target=self._t_static, args=(stale,))
+            thread.daemon = True
+            thread.start()
+        elif markets:
+            self._phase('static', t)
+
+    def staticmarkets(self):
+        '''Returns the markets of the static data'''
+        markets = self.p.staticmarkets
+        if markets is None:
+            markets = self._TRADEMARKETS.get(self.p.trade, ())
+        return markets
+
+    def _t_static(self, markets):
+        t = time.time()
+        ctx = self._open_quote()
+        for market in markets:
+            try:
+                self.static.refresh(ctx, market)
+            except Exception as e:
+                # out of date lookups go on, the unknown codes are rejected
+                self.put_notification(e)
+            finally:
+                self.positions.uselots(self.static.lots)
+                self._staticpulls[market].set()
+        self._phase('static', t)
+
+    def lot(self, code):
+        '''Returns the board lot of ``code``, ``None`` if it is not known in
+        a market of the static data. The first orders of a market pulled at
+        start wait up to ``static_tmout`` seconds for its lots, the pull
+        failing or not done by then leaves the lots of the market unknown'''
+        if self.codetrade(code) == self.FutureTrade:
+            return self.positions.lot(code)  # contracts, not in the cache
+
+        market = code.split('.', 1)[0]
+        pull = self._staticpulls.get(market)
+        if pull is not None and not pull.is_set():
+            if not pull.wait(self.p.static_tmout):
+                pull.set()  # the next orders do not wait again
+                self.put_notification(
+                    'static data of %s not pulled in %.1f seconds' % (
+                        market, self.p.static_tmout))
+
+        if pull is None and not self.static.has(market):
+            return self.positions.lot(code)  # not a market of the cache
+        return self.positions.lot(code, None)
+
+    def _open_journal(self):
+        t = time.time()
+        self.journal = OrderJournal(self.p.journal)
+        self._journaled = self.journal.open()
+        # new refs above the journaled ones, which are remarks at OpenD
+        nextref = max(self.journal.nextref, next(bt.OrderBase.refbasis))
+        bt.OrderBase.refbasis = itertools.count(nextref)
+        self._phase('journal', t)
+
+    def _reconcile(self, entries):
+        '''Checks the journaled orders against one order list query per
+        account and keeps those still alive for the broker to adopt'''
+        t = time.time()
+        byacct = collections.defaultdict(list)
+        with self._lock_orders:  # their pushes wait for the adoption
+            for entry in entries.values():
+                byacct[entry.key].append(entry)
+                if entry.oid is not None:
+                    self._adoptpend.add(entry.oid)
+
+        alive = []
+        for key, acctentries in byacct.items():
+            acct = self._account(*key)
+            ret, orders = self._query(acct, 'order_list_query')
+            if ret != ft.RET_OK:
+                self.put_notification(orders)
+                continue
+
+            cols = (orders['order_id'].values, orders['order_status'].values,
+                    orders['dealt_qty'].values,
+                    orders['dealt_avg_price'].values, orders['remark'].values)
+            rows, byremark = dict(), dict()
+            for row in zip(*cols):
+                rows[row[0]] = byremark[row[4]] = row
+
+            for entry in acctentries:
+                row = rows.get(entry.oid) if entry.oid is not None else \
+                    byremark.get(str(entry.ref))  # died before the ack
+                if row is None:
+                    if entry.oid is None and entry.exectype in self._TRIGGERS:
+                        alive.append(entry)  # armed in the store
+                    else:
+                        self.journal.end(entry.ref)  # never placed or old
+                    continue
+
+                oid, status, dealt, avgprice = row[:4]
+                if status in self._ENDSTATUS:
+                    self.journal.end(entry.ref)
+                    continue
+
+                entry.oid = oid
+                entry.dealt, entry.avgprice = float(dealt), float(avgprice)
+                with self._lock_orders:
+                    self._adoptpend.add(oid)
+                alive.append(entry)
+
+        self._recovered = alive
+        self._phase('reconcile', t)
+
+    def recovered(self):
+        '''Returns once the journaled orders found alive at OpenD after the
+        restart, ``None`` until then. Called by the broker'''
+        recovered = self._recovered
+        if recovered is not None:
+            self._recovered = None
+        return recovered
+
+    def adopt(self, order, entry):
+        '''Takes ``order``, created again by the broker from ``entry``, back
+        into the store: its pushes are applied from then on and an order
+        armed in the store is armed again'''
+        acct = self._account(*entry.key)
+        oref, oid = order.ref, entry.oid
+        if oid is None:
+            self.order_send(order)
+            return
+
+        self._orderaccts[oref] = acct
+        with self._lock_orders:
+            self._orders[oref] = oid
+            self._ordersrev[oid] = oref
+            self._dealt[oid] = (entry.dealt, entry.dealt * entry.avgprice)
+            self._adoptpend.discard(oid)
+            updates = self._transpend.pop(oid, None)
+
+        if updates:  # pushed since the restart
+            with self._lock_updates:
+                for update in updates:
+                    self._order_update(oref, *update)
+
+    def register(self, data):
+        '''Keeps ``data`` as the one of its code for the broker to attach the
+        recovered orders to'''
+        self._datas.setdefault(data.p.dataname, data)
+
+    def getdatabyname(self, dataname):
+        return self._datas.get(dataname)
+
+    def _wait_account(self):
+        '''Waits once for the default account opened by ``start``'''
+        t = self._tradestart
+        if t is not None:
+            # every caller waits, the first one to return clears it
+            t.join(self.p.account_tmout)
+            self._tradestart = None
+
+    def _phase(self, name, t):
+        '''Times the startup phase ``name`` begun at ``t``, once'''
+        if name not in self.startup:
+            t0 = self._t0 if self._t0 is not None else t
+            self.startup[name] = (t - t0, time.time() - t)
+
+    def startup_report(self):
+        '''Returns the startup phases timed so far as lines of text: their
+        start from the first ``start`` call and their duration, in
+        seconds'''
+        phases = sorted(self.startup.items(), key=lambda x: x[1][0])
+        return '\n'.join('%-20s %8.3f %8.3f' % (name, start, secs)
+                         for name, (start, secs) in phases)
 
     def stop(self):
-        self.trade_ctx.close()
+        self._wait_account()
+        with self._lock_accounts:
+            for acct in self._accounts.values():
+                acct.q_account.put(None)
+                acct.writes.close()
+            self._accounts.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self._datas.clear()
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+        if self._histloader is not None:
+            self._histloader.shutdown()
+            self._histloader = None
+        if self.quote_ctx is not None:
+            self.quote_ctx.close()
+            self.quote_ctx = None
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        for ctx in self._tradectxs.values():
+            ctx.close()
+        self._tradectxs.clear()
+
+    def _trade_ctx(self, trade):
+        ctx = self._tradectxs.get(trade, None)
+        if ctx is None:
+            if trade not in self._TRADECTXS:
+                raise FutuStoreException('Unknown trade type')
+
+            ctxname, ctxkwargs = self._TRADECTXS[trade]
+            ctxcls = getattr(ft, ctxname)
+            t = time.time()
+            ctx = ctxcls(host=self.p.host, port=int(self.p.port), **ctxkwargs)
+            self._phase('trade_open', t)
+            ctx.set_handler(FutuTradeOrderHandler(self))
+            ctx.set_handler(FutuTradeDealHandler(self, trade))
+            self._tradectxs[trade] = ctx
+
+        return ctx
+
+    def _account(self, trade, acc_id, trd_env):
+        '''Returns the account of the key, opening the context of its market
+        and starting its threads the first time'''
+        key = (trade, acc_id, trd_env)
+        acct = self._accounts.get(key, None)
+        if acct is not None:
+            return acct
+
+        with self._lock_accounts:
+            acct = self._accounts.get(key, None)
+            if acct is not None:
+                return acct
+
+            ctx = self._trade_ctx(trade)
+            if trd_env == ft.TrdEnv.REAL and not self._unlocked:
+                t = time.time()
+                ctx.unlock_trade(password=self.p.password)
+                self._unlocked = True
+                self._phase('unlock', t)
+
+            limits = dict(self._RATELIMITS, **(self.p.ratelimits or {}))
+            limiters = dict((name, RateLimiter(*limit))
+                            for name, limit in limits.items())
+            writes = WriteQueue([
+                (limiters['modify_order'], 0),  # _LANE_CANCEL
+                (limiters['place_order'], self.p.orderqsize),
+            ])
+            acct = TradeAccount(key, ctx, limiters,
+                                Coalescer(maxage=self.p.coalesce), writes)
+
+            acct.q_account = queue.Queue()
+            acct.q_account.put(True)  # force an immediate update
+            targets = [self._t_account] + \
+                [self._t_orders] * self.p.orderworkers
+            for target in targets:
+                t = threading.Thread(target=target, args=(acct,))
+                t.daemon = True
+                t.start()
+                acct.threads.append(t)
+
+            self._accounts[key] = acct
+
+        return acct
+
+    def codetrade(self, code):
+        '''Returns the trade type of the orders of ``code``'''
+        market, _, symbol = code.partition('.')
+        if market == 'HK' and not symbol.isdigit():
+            return self.FutureTrade
+        return self._MARKETS.get(market, self.p.trade)
+
+    def _order_account(self, order):
+        '''Routes ``order`` by the market prefix of its data, unless the
+        ``trade``, ``acc_id`` or ``trd_env`` keyword arguments were given
+        with it. HK codes other than numbers, e.g. ``HK.HSImain``, are
+        futures'''
+        info = order.info
+        trade = info.get('trade', None)
+        if trade is None:
+            trade = self.codetrade(order.data._dataname)
+
+        return self._account(trade, info.get('acc_id', self.p.acc_id),
+                             info.get('trd_env', self.p.trd_env))
+
+    def _open_quote(self):
+        if self.quote_ctx is not None:
+            return self.quote_ctx
+
+        with self._lock_quote:  # opened by the static data thread too
+            if self.quote_ctx is not None:
+                return self.quote_ctx
+
+            if self.p.replay is not None:
+                ctx = PushReplayContext(self.p.replay,
+                                        speed=self.p.replayspeed)
+            else:
+                t = time.time()
+                ctx = ft.OpenQuoteContext(host=self.p.host,
+                                          port=int(self.p.port))
+                self._phase('quote_open', t)
+            if self.p.record is not None:
+                self.recorder = PushLogWriter(self.p.record)
+
+            ctx.set_handler(FutuCurKlineHandler(self))
+            ctx.set_handler(FutuTickerHandler(self))
+            ctx.set_handler(FutuStockQuoteHandler(self))
+            ctx.set_handler(FutuOrderBookHandler(self))
+            self.quote_ctx = ctx
+
+        return ctx
+
+    def _subscribe(self, data):
+        self._open_quote()
+        if getattr(data.p, 'poll', False):  # not a param of the publishers
+            if self._poller is None:
+                self._poller = SnapshotPoller(
+                    self.quote_ctx, self._pushpolled,
+                    interval=self.p.snapshot, batchsize=self.p.snapbatch,
+                    limiter=RateLimiter(*self.p.snaprate),
+                    notify=self.put_notification)
+                self._poller.start()
+            self._poller.add(data.p.dataname, data)
+            return True
+
+        if data.p.subtype == ft.SubType.ORDER_BOOK:
+            code = data.p.dataname
+            if code not in self._books:
+                self._books[code] = OrderBook(depth=data.p.depth)
+            data.book = self._books[code]
+
+        self._subs.add(data.p.dataname, data.p.subtype, data)
+        return True
+
+    def unsubscribe(self, data):
+        if getattr(data.p, 'poll', False):
+            if self._poller is not None:
+                self._poller.remove(data.p.dataname, data)
+            return
+        self._subs.remove(data.p.dataname, data.p.subtype, data)
+
+    def flush_subscriptions(self):
+        '''Sends the subscriptions queued by the datas in batches. Called by
+        the datas from ``_load``, hence from the cerebro thread'''
+        if self.quote_ctx is None or not self._subs.pending():
+            return
+
+        t = time.time()
+        for datas, msg in self._subs.flush(self.quote_ctx):
+            self.put_notification(msg)
+            for data in datas:
+                data._subscribe_failed(msg)
+        self._phase('subscribe', t)
+
+    def pushesdone(self):
+        '''Returns ``True`` once a replayed push log has been played out'''
+        return (self.p.replay is not None and self.quote_ctx is not None and
+                self.quote_ctx.done.is_set())
+
+    def backfill(self, data, start, end):
+        '''Returns a future with the list of bar arrays of ``data`` between
+        the datetimes ``start`` and ``end``'''
+        if self._histloader is None:
+            cache = None
+            if self.p.histcache is not None:
+                cache = HistoryCache(self.p.histcache, autype=self.p.autype)
+
+            self._histloader = HistoryLoader(
+                self._open_quote(), cache=cache,
+                workers=self.p.histworkers,
+                limiter=RateLimiter(*self.p.histrate),
+                autype=self.p.autype)
+
+        future = self._histloader.submit(data.p.dataname, data.p.subtype,
+                                         start, end)
+        if 'history' not in self.startup:
+            t = time.time()
+            future.add_done_callback(lambda f: self._phase('history', t))
+        return future
+
+    def _pushframe(self, subtype, content, bars):
+        if not len(bars):
+            return
+
+        codes = content['code'].values
+        code = codes[0]
+        if len(codes) == 1 or (codes == code).all():
+            self._push(code, subtype, bars)
+            return
+
+        for code in set(codes):
+            self._push(code, subtype, bars[codes == code])
+
+    def _pushbook(self, s2c):
+        code = merge_qot_mkt_stock_str(s2c.security.market, s2c.security.code)
+        book = self._books.get(code)
+        if book is None:
+            return
+
+        book.update(s2c)
+        for data in self._subs.index.get((code, ft.SubType.ORDER_BOOK), ()):
+            data.pushbook(book)
+
+    def _push(self, code, subtype, bars):
+        for data in self._subs.index.get((code, subtype), ()):
+            data.push(bars)
+
+        if code in self._triggers:
+            closes = bars[:, CLOSE]
+            self._triggers.price(code, closes.min(), closes.max())
+
+    def _pushpolled(self, code, bars):
+        for data in self._poller.index.get(code, ()):
+            data.push(bars)
+
+        if code in self._triggers:
+            price = bars[0, CLOSE]
+            self._triggers.price(code, price, price)
+
+    def gatewayprice(self, code, price):
+        '''Prices of the datas fed by a gateway, which do not go through
+        ``_push``, for the orders armed by the store'''
+        if code in self._triggers:
+            self._triggers.price(code, price, price)
 
     def order_create(self, order, stopside=None, takeside=None, **kwargs):
-        price = format(
-                order.created.price,
-                '.%df' % order.data.contractdetails['displayPrecision'])
-        qty = (abs(int(order.created.size)))
-        if self.p.trade == FutuStore.HKTrade:
-            code = order.data._dataname.upper() + '.HK'
-            if order.exectype == bt.Order.Market:
-                order_type = ft.OrderType.NORMAL
-            elif order.exectype == bt.Order.Close:
-                raise FutuNotSupported('NOT SUPPORTED YET')
-            elif order.exectype == bt.Order.Limit:
-                order_type = ft.OrderType.ABSOLUTE_LIMIT
-            elif order.exectype == bt.Order.Stop:
-                raise FutuNotSupported('NOT SUPPORTED YET')
-            elif order.exectype == bt.Order.StopLimit:
-                raise FutuNotSupported('NOT SUPPORTED YET')
-            elif order.exectype == bt.Order.StopTrail:
-                raise FutuNotSupported('NOT SUPPORTED YET')
-            elif order.exectype == bt.Order.StopTrailLimit:
-                raise FutuNotSupported('NOT SUPPORTED YET')
-            elif order.exectype == bt.Order.Historical:
+        '''Submits ``order`` and the children of its bracket, if any, and
+        sends ``order`` with ``order_send``. The broker sends the children
+        once ``order`` has been executed. ``kwargs`` are passed over to
+        ``place_order``'''
+        orders = [o for o in (order, stopside, takeside) if o is not None]
+        for o in orders:
+            if not self.supports(o):
                 raise FutuNotSupported('NOT SUPPORTED YET')
 
-        elif self.p.trade == FutuStore.CNTrade:
-            code = order.data._dataname.upper() + '.CN'
-            raise FutuNotSupported('NOT SUPPORTED YET')
-        elif self.p.trade == FutuStore.USTrade:
-            code = order.data._dataname.upper() +'.US'
-            raise FutuNotSupported('NOT SUPPORTED YET')
-        else:
-            raise FutuNotSupported('NOT SUPPORTED YET')
+        # notify orders of being submitted
+        for o in orders:
+            self.broker._submit(o.ref)
+
+        if self.latency is not None:
+            self.latency.submitted(order.ref)
+        self.order_send(order, **kwargs)
+        return order
 
-        trd_side = ft.TrdSide.BUY if order.isbuy() else ft.TrdSide.SELL
+    def checkorder(self, order):
+        '''Checks ``order`` against the static data, returns why it would
+        be rejected or ``None``'''
+        code = order.data._dataname
+        lot = self.lot(code)
+        if lot is None:
+            return 'no lot size for %s' % code
+        if abs(order.created.size) % lot:
+            return 'size not a multiple of lot %d' % lot
+        if (order.exectype in (bt.Order.Market, bt.Order.Close) and
+                not self.static.isopen(code)):
+            # nothing for a market order to rest on until the next session
+            return 'market of %s closed today' % code
+        return None
 
+    def supports(self, order):
+        '''Returns whether the execution type of ``order`` can be sent'''
+        return (order.exectype in self._ORDEREXECS or
+                order.exectype in self._TRIGGERS)
 
+    def order_send(self, order, **kwargs):
+        '''Queues ``order``, already submitted, for the order workers or
+        arms it if futu has no such order type. Returns at once'''
+        code = order.data._dataname
+        msg = self.checkorder(order)
+        if msg is not None:
+            self.put_notification(msg, oref=order.ref)
+            self.broker._reject(order.ref)
+            return order
 
         okwargs = dict()
-        okwargs['instrument'] = order.data._dataname
-        okwargs['units'] = (
-            abs(int(order.created.size)) if order.isbuy()
-            else -abs(int(order.created.size)))  # negative for selling
-        okwargs['type'] = self._ORDEREXECS[order.exectype]
-        okwargs['replace'] = order.info.get("replace", None)
-
-        if order.exectype != bt.Order.Market:
-            okwargs['price'] = format(
-                order.created.price,
-                '.%df' % order.data.contractdetails['displayPrecision'])
-            if order.valid is None:
-                okwargs['timeInForce'] = 'GTC'  # good to cancel
-            else:
-                okwargs['timeInForce'] = 'GTD'  # good to date
-                gtdtime = order.data.num2date(order.valid)
-                okwargs['gtdTime'] = gtdtime.strftime(self._DATE_FORMAT)
-
-        if order.exectype == bt.Order.StopLimit:
-            if "replace" not in okwargs:
-                raise Exception("replace param needed for StopLimit order")
-            okwargs['price'] = format(
-                order.plimit or order.price,
-                '.%df' % order.data.contractdetails['displayPrecision'])
-
-        if order.exectype == bt.Order.StopTrail:
-            if "replace" not in okwargs:
-                raise Exception("replace param needed for StopTrail order")
-            trailamount = order.trailamount
-            if order.trailpercent:
-                trailamount = order.price * order.trailpercent
-            okwargs['distance'] = format(
-                trailamount,
-                '.%df' % order.data.contractdetails['displayPrecision'])
-
-        if stopside is not None:
-            if stopside.exectype == bt.Order.StopTrail:
-                trailamount = stopside.trailamount
-                if stopside.trailpercent:
-                    trailamount = order.price * stopside.trailpercent
-                okwargs['trailingStopLossOnFill'] = v20.transaction.TrailingStopLossDetails(
-                    distance=format(
-                        trailamount,
-                        '.%df' % order.data.contractdetails['displayPrecision']),
-                    clientExtensions=v20.transaction.ClientExtensions(
-                        id=self._oref_to_client_id(stopside.ref)
-                    ).dict()
-                ).dict()
-            else:
-                okwargs['stopLossOnFill'] = v20.transaction.StopLossDetails(
-                    price=format(
-                        stopside.price,
-                        '.%df' % order.data.contractdetails['displayPrecision']),
-                    clientExtensions=v20.transaction.ClientExtensions(
-                        id=self._oref_to_client_id(stopside.ref)
-                    ).dict()
-                ).dict()
-
-        if takeside is not None and takeside.price is not None:
-            okwargs['takeProfitOnFill'] = v20.transaction.TakeProfitDetails(
-                price=format(
-                    takeside.price,
-                    '.%df' % order.data.contractdetails['displayPrecision']),
-                clientExtensions=v20.transaction.ClientExtensions(
-                    id=self._oref_to_client_id(takeside.ref)
-                ).dict()
-            ).dict()
-
-        # store backtrader order ref in client extensions
-        okwargs['clientExtensions'] = v20.transaction.ClientExtensions(
-            id=self._oref_to_client_id(order.ref)
-        ).dict()
+        okwargs['code'] = code
+        okwargs['price'] = order.created.price or 0.0
+        okwargs['qty'] = abs(int(order.created.size))
+        okwargs['trd_side'] = (
+            ft.TrdSide.BUY if order.isbuy() else ft.TrdSide.SELL)
+        okwargs['order_type'] = otype = self._ORDEREXECS.get(order.exectype)
+        okwargs['remark'] = str(order.ref)  # found again in order pushes
+        if otype == ft.OrderType.NORMAL:  # to the tick, never past the limit
+            okwargs['price'] = self.static.roundprice(
+                code, okwargs['price'], up=not order.isbuy())
 
+        acct = self._order_account(order)
+        okwargs.update(acct.kwargs())
         okwargs.update(**kwargs)  # anything from the user
-        self.q_ordercreate.put((order.ref, okwargs,))
+        self._orderaccts[order.ref] = acct
+        if self.journal is not None:
+            self.journal.submit(order, acct.key)
 
-        # notify orders of being submitted
-        self.broker._submit(order.ref)
-        if stopside is not None:  # don't make price on stopside mandatory
-            self.broker._submit(stopside.ref)
-        if takeside is not None and takeside.price is not None:
-            self.broker._submit(takeside.ref)
+        if order.exectype in self._TRIGGERS:
+            self._armed[order.ref] = okwargs
+            self._triggers.add(order)
+            self.broker._accept(order.ref)  # held by the store
+            return order
 
+        acct.writes.put(self._LANE_PLACE,
+                        (self._LANE_PLACE, order.ref, okwargs))
         return order
 
+    def _fire(self, order, price):
+        # Called by the trigger engine in the futu callback thread which
+        # pushed ``price``: the order is placed as a market or limit one
+        okwargs = self._armed.pop(order.ref)
+        okwargs['order_type'] = otype = self._TRIGGERS[order.exectype]
+        if otype == ft.OrderType.NORMAL:
+            okwargs['price'] = self.static.roundprice(
+                okwargs['code'], order.created.pricelimit,
+                up=not order.isbuy())
+        else:
+            okwargs['price'] = 0.0
+
+        if self.latency is not None:
+            self.latency.triggered(order.ref)
+        acct = self._orderaccts[order.ref]
+        acct.writes.put(self._LANE_PLACE,
+                        (self._LANE_PLACE, order.ref, okwargs))
+
+    def _t_orders(self, acct):
+        while True:
+            msg = acct.writes.get()
+            if msg is None:
+                break
+
+            lane, oref, okwargs = msg
+            if lane == self._LANE_CANCEL:
+                self._cancel_order(acct, oref)
+            else:
+                self._place_order(acct, oref, okwargs)
+
+    def _place_order(self, acct, oref, okwargs):
+        with self._lock_orders:
+            if oref in self._cancelpend:  # cancelled before being sent
+                self._cancelpend.discard(oref)
+                self.broker._cancel(oref)
+                if self.latency is not None:
+                    self.latency.discard(oref)
+                if self.journal is not None:
+                    self.journal.end(oref)
+                return
+            self._inflight += 1
+
+        latency = self.latency
+        if latency is not None:
+            latency.sending(oref)
+        ret, content = acct.ctx.place_order(**okwargs)
+        if latency is not None:
+            latency.acked(oref, ret == ft.RET_OK)
+        if ret != ft.RET_OK:
+            with self._lock_orders:
+                self._inflight -= 1
+            self._landed()
+            self.put_notification(content, oref=oref)
+            self.broker._reject(oref)
+            if self.journal is not None:
+                self.journal.end(oref)
+            return
+
+        oid = content['order_id'].values[0]
+        if self.journal is not None:
+            self.journal.ack(oref, oid)
+        with self._lock_orders:
+            self._orders[oref] = oid
+            self._ordersrev[oid] = oref
+            cancel = oref in self._cancelpend  # cancelled while in flight
+            self._cancelpend.discard(oref)
+            updates = self._transpend.pop(oid, None)
+            self._inflight -= 1
+
+        self._landed()
+        self.broker._accept(oref)
+        if updates:  # pushed before place_order returned
+            with self._lock_updates:
+                for update in updates:
+                    self._order_update(oref, *update)
+
+        if cancel:
+            acct.writes.put(self._LANE_CANCEL,
+                            (self._LANE_CANCEL, oref, None))
+
     def order_cancel(self, order):
-        pass
+        if self._triggers.remove(order.ref):  # armed, never sent
+            self._armed.pop(order.ref, None)
+            self.broker._cancel(order.ref)
+            if self.journal is not None:
+                self.journal.end(order.ref)
+            return order
+
+        with self._lock_orders:
+            if order.ref not in self._orders:  # not placed yet
+                self._cancelpend.add(order.ref)
+                return order
+
+        acct = self._orderaccts[order.ref]
+        acct.writes.put(self._LANE_CANCEL,
+                        (self._LANE_CANCEL, order.ref, None))
+        return order
+
+    def _cancel_order(self, acct, oref):
+        oid = self._orders[oref]
+        ret, content = acct.ctx.modify_order(
+            ft.ModifyOrderOp.CANCEL, oid, 0, 0.0, **acct.kwargs())
+        if ret != ft.RET_OK:  # else cancelled when the status is pushed
+            self.put_notification(content, oref=oref)
+
+    def _order_updates(self, content):
+        '''Applies the rows of an order push to the backtrader orders'''
+        cols = (content['order_id'].values, content['order_status'].values,
+                content['dealt_qty'].values,
+                content['dealt_avg_price'].values)
+
+        with self._lock_updates:
+            for oid, status, dealtqty, avgprice in zip(*cols):
+                update = (oid, status, float(dealtqty), float(avgprice))
+                with self._lock_orders:
+                    oref = self._ordersrev.get(oid, None)
+                    if oref is None:
+                        # kept if maybe ours, i.e. while orders are in
+                        # flight or journaled ones not adopted yet
+                        if self._inflight or oid in self._adoptpend:
+                            self._transpend[oid].append(update)
+                        continue
+
+                self._order_update(oref, *update)
+
+    def _order_update(self, oref, oid, status, dealtqty, avgprice):
+        prevqty, prevvalue = self._dealt.get(oid, (0.0, 0.0))
+        if dealtqty > prevqty:
+            value = dealtqty * avgprice
+            self._dealt[oid] = (dealtqty, value)
+            size = dealtqty - prevqty
+            self.broker._fill(oref, size, (value - prevvalue) / size)
+            if self.journal is not None:
+                self.journal.fill(oref, dealtqty, avgprice)
+
+        transition = self._ORDERSTATUS.get(status, None)
+        if transition is not None:
+            getattr(self.broker, transition)(oref)
+        elif status == ft.OrderStatus.FILL_CANCELLED:
+            self.put_notification('fills of order %s reversed' % oid,
+                                  oref=oref)
+
+        if self.journal is not None and status in self._ENDSTATUS:
+            self.journal.end(oref)
+
+    def _query(self, acct, name, **kwargs):
+        '''Calls the ``name`` query of the account within its rate limit.
+        Identical queries in flight or made less than ``coalesce`` seconds
+        apart share one call'''
+        kwargs.update(acct.kwargs())
+
+        def query():
+            acct.limiters[name].acquire()
+            return getattr(acct.ctx, name)(**kwargs)
+
+        key = (name,) + tuple(sorted(kwargs.items()))
+        t = time.time()
+        ret, content = acct.reads.call(key, query)
+        if ret != ft.RET_OK:
+            acct.reads.forget(key)
+        else:
+            self._phase(name, t)
+        return ret, content
+
+    def _query_async(self, acct, name, **kwargs):
+        '''Returns a future of the ``name`` query of the account'''
+        if self._pool is None:
+            with self._lock_accounts:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=4)
+        return self._pool.submit(self._query, acct, name, **kwargs)
+
+    def _t_account(self, acct):
+        while True:
+            try:
+                msg = acct.q_account.get(timeout=self.p.account_tmout)
+                if msg is None:
+                    break  # end of thread
+            except queue.Empty:  # tmout -> time to refresh
+                pass
+
+            # both queries are in flight together
+            fpositions = self._query_async(acct, 'position_list_query')
+            ret, accinfo = self._query(acct, 'accinfo_query')
+            if ret != ft.RET_OK:
+                self.put_notification(accinfo)
+                continue
+
+            ret, positions = fpositions.result()
+            if ret != ft.RET_OK:
+                self.put_notification(positions)
+                continue
+
+            acct.state.reset(accinfo, positions)
+            if not acct.ready.is_set():
+                self.positions.seed(positions)  # then kept up to date
+            acct.ready.set()
+
+    def _deals(self, trade, acc_id, trd_env, content):
+        '''Applies the fills of a deal push to the state of its account'''
+        acct = self._accounts.get((trade, acc_id, trd_env), None)
+        if acct is None:  # opened as the first account of the market
+            acct = self._accounts.get((trade, 0, trd_env), None)
+            if acct is None:
+                return
+
+        deal = acct.state.deal
+        cols = (content['deal_id'].values, content['code'].values,
+                content['trd_side'].values, content['qty'].values,
+                content['price'].values, content['status'].values,
+                content['order_id'].values)
+        foreign = []
+        for dealid, code, side, qty, price, status, oid in zip(*cols):
+            deal(dealid, code, side, float(qty), float(price), status)
+            foreign.append((oid, dealid, code, side, float(qty),
+                            float(price), status))
+
+        # The positions are updated by the broker from the fills of its
+        # orders, from the deals for the other ones. A deal of an order not
+        # known yet may be of one in flight and waits for them to land
+        with self._lock_orders:
+            foreign = [d for d in foreign if d[0] not in self._ordersrev]
+            if self._inflight:
+                self._dealpend.extend(foreign)
+                return
+
+        for d in foreign:
+            self.positions.deal(*d[1:])
+
+    def _landed(self):
+        # Applies the deals pending while orders were in flight, the deals of
+        # orders found to be ours being dropped. The pushes of orders still
+        # unknown once none is in flight are not ours
+        with self._lock_orders:
+            if self._inflight:
+                return
+            for oid in list(self._transpend):
+                if oid not in self._adoptpend:
+                    del self._transpend[oid]
+            if not self._dealpend:
+                return
+            pending, self._dealpend = self._dealpend, []
+            pending = [d for d in pending if d[0] not in self._ordersrev]
+
+        for d in pending:
+            self.positions.deal(*d[1:])
 
     def get_cash(self):
-        return self._cash
+        self._wait_account()
+        return self.account.cash if self.account is not None else 0.0
 
     def get_value(self):
-        return self._value
+        self._wait_account()
+        return self.account.value if self.account is not None else 0.0
+
+    def get_power(self):
+        self._wait_account()
+        return self.account.power if self.account is not None else 0.0
 
     def get_positions(self):
-        pass
+        '''Returns the ``PositionBook`` of the positions by code'''
+        return self.positions
 
     def put_notification(self, msg, *args, **kwargs):
-        self.notifs.append((msg, args, kwargs))
+        self.notifs.put((msg, args, kwargs))
 
     def get_notifications(self):
-        self.notifs.append(None)
-        return [x for x in iter(self.notifs.popleft, None)]
+        return self.notifs.drain()
+
+    @staticmethod
+    def _dropped(n):
+        return ('%d notifications dropped, notifqsize is too small' % n,
+                (), dict())
+
+    def notification_stats(self):
+        '''Depth, lag and losses of the queues of the store notifications
+        and of the order notifications of the broker'''
+        stats = dict(messages=self.notifs.stats())
+        if self.broker is not None:
+            stats['orders'] = self.broker.notifs.stats()
+        return stats
 
 
 
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''One process subscribing to OpenD and publishing the bars to the
+strategies of other processes through shared memory.
+
+    python -m btfutu.gateway --codes HK.00700,HK.00005 --subtypes K_1M,TICKER
+
+and in each strategy process::
+
+    data = FutuFeed(dataname='HK.00700', subtype=ft.SubType.TICKER,
+                    gateway='btfutu')
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import logging
+import threading
+import time
+
+import numpy as np
+from multiprocessing import shared_memory
+
+import futu as ft
+
+from .futustore import FutuStore
+
+logger = logging.getLogger(__name__)
+
+_HEADER = 4  # int64: write sequence, size, width, closed
+_BARWIDTH = 6  # see decode
+_BOOKWIDTH = 11  # see FutuBookFeed
+
+
+def ring_name(gateway, code, subtype):
+    return '%s_%s_%s' % (gateway, code, subtype)
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # before Python 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        # else the segment is unlinked when this process exits
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _Ring(object):
+    def _map(self, shm):
+        self._shm = shm
+        self._hdr = np.ndarray((_HEADER,), dtype=np.int64, buffer=shm.buf)
+        self.size = int(self._hdr[1])
+        self.width = int(self._hdr[2])
+        self._rows = np.ndarray((self.size, self.width), dtype=np.float64,
+                                buffer=shm.buf, offset=_HEADER * 8)
+
+
+class ShmRing(_Ring):
+    '''Single writer ring of ``size`` rows of ``width`` floats in shared
+    memory. The writer never waits for the readers, which lose the rows
+    overwritten before they read them'''
+
+    def __init__(self, name, size, width):
+        shm = shared_memory.SharedMemory(
+            name=name, create=True, size=(_HEADER + size * width) * 8)
+        hdr = np.ndarray((_HEADER,), dtype=np.int64, buffer=shm.buf)
+        hdr[:] = (0, size, width, 0)
+        self._map(shm)
+        self._lock = threading.Lock()
+
+    def put(self, row):
+        with self._lock:
+            seq = int(self._hdr[0])
+            self._rows[seq % self.size, :len(row)] = row
+            self._hdr[0] = seq + 1  # published once the row is written
+
+    def close(self):
+        self._hdr[3] = 1
+        self._hdr = self._rows = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class ShmRingReader(_Ring):
+    '''Reads an ``ShmRing`` from the rows written after it attached. Has the
+    ``get``/``clear`` interface of ``RingBuffer``, the rows are read from
+    the shared memory without any other buffer in between, each copied
+    once into the list ``get`` returns.
+
+    There is no wake up across processes, ``get`` polls every ``poll``
+    seconds. ``dropped`` counts the rows overwritten before being read.
+    '''
+
+    def __init__(self, name, poll=0.001):
+        self._map(_attach(name))
+        self.poll = poll
+        self.dropped = 0
+        self._seq = int(self._hdr[0])
+
+    @property
+    def closed(self):
+        return bool(self._hdr[3])
+
+    def __len__(self):
+        return min(int(self._hdr[0]) - self._seq, self.size - 1)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    def get(self, timeout=0.0):
+        hdr, size = self._hdr, self.size
+        deadline = None
+        while True:
+            wseq = int(hdr[0])
+            if wseq == self._seq:
+                if not timeout or self.closed:
+                    return None
+                now = time.time()
+                if deadline is None:
+                    deadline = now + timeout
+                elif now >= deadline:
+                    return None
+                time.sleep(min(self.poll, deadline - now))
+                continue
+
+            # the writer writes the slot of wseq - size next, or is at it
+            if wseq - self._seq >= size:  # lapped by the writer
+                self.dropped += wseq - size + 1 - self._seq
+                self._seq = wseq - size + 1
+
+            # copied out of the slot, the only copy of the row: a view could
+            # be overwritten once returned and the check after the copy is
+            # what tells a torn row
+            row = self._rows[self._seq % size].tolist()
+            if int(hdr[0]) - self._seq >= size:
+                continue  # overwritten while being read
+
+            self._seq += 1
+            return row
+
+    def clear(self):
+        self._seq = int(self._hdr[0])
+
+    def close(self):
+        self._hdr = self._rows = None
+        self._shm.close()
+
+
+class _Publisher(object):
+    # Subscribes to the store like a data and writes the bars to its ring
+    class _Params(object):
+        pass
+
+    def __init__(self, ring, code, subtype, depth):
+        self.ring = ring
+        self.p = self._Params()
+        self.p.dataname = code
+        self.p.subtype = subtype
+        self.p.depth = depth
+        self.book = None
+        self._kline = subtype not in (ft.SubType.TICKER, ft.SubType.QUOTE,
+                                      ft.SubType.ORDER_BOOK)
+        self._curbar = None
+
+    def push(self, bars):
+        put = self.ring.put
+        if not self._kline:
+            for bar in bars:
+                put(bar)
+            return
+
+        # the bar in progress is complete once the next one shows up, as in
+        # FutuFeed.push
+        curbar = self._curbar
+        for bar in bars:
+            if curbar is not None and curbar[0] != bar[0]:
+                put(curbar)
+            curbar = bar
+        self._curbar = curbar
+
+    def pushbook(self, book):
+        bid, ask, spread, microprice, imbalance = book.stats()
+        mid = (bid + ask) / 2.0
+        self.ring.put((book.dt, mid, mid, mid, mid, 0.0,
+                       bid, ask, spread, microprice, imbalance))
+
+    def _subscribe_failed(self, msg):
+        pass  # notified by the store
+
+
+class FutuGateway(object):
+    '''Owns the quote context of the store of its process and publishes the
+    bars of each ``(code, subtype)`` to a ``ShmRing`` named after ``name``,
+    ``code`` and ``subtype``. The datas of other processes read them with
+    the ``gateway`` param of ``FutuFeed`` set to ``name``.
+
+    Order books are published as the bars of ``FutuBookFeed``, with the
+    imbalance over ``depth`` levels.
+
+    ``kwargs`` are passed over to the store, e.g. ``host`` and ``port``.
+    '''
+
+    def __init__(self, codes, subtypes, name='btfutu', size=65536, depth=10,
+                 **kwargs):
+        self.codes = list(codes)
+        self.subtypes = list(subtypes)
+        self.name = name
+        self.size = size
+        self.depth = depth
+        self.store = FutuStore(**kwargs)
+        self.publishers = []
+        self._stop = threading.Event()
+
+    def start(self):
+        for code in self.codes:
+            for subtype in self.subtypes:
+                width = _BOOKWIDTH if subtype == ft.SubType.ORDER_BOOK \
+                    else _BARWIDTH
+                ring = ShmRing(ring_name(self.name, code, subtype),
+                               self.size, width)
+                pub = _Publisher(ring, code, subtype, self.depth)
+                self.publishers.append(pub)
+                self.store.start(data=pub)
+
+        self.store.flush_subscriptions()
+
+    def run(self, interval=1.0):
+        '''Starts and serves until ``stop`` is called or interrupted, the
+        notifications of the store are logged to the ``btfutu.gateway``
+        logger'''
+        self.start()
+        try:
+            while not self._stop.wait(interval):
+                for msg, args, kwargs in self.store.get_notifications():
+                    logger.warning('%s %s', msg, kwargs or '')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        for pub in self.publishers:
+            self.store.unsubscribe(pub)
+        self.store.stop()
+        for pub in self.publishers:
+            pub.ring.close()
+        self.publishers = []
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Publishes futu pushes to strategy processes')
+    parser.add_argument('--codes', required=True,
+                        help='comma separated codes, e.g. HK.00700')
+    parser.add_argument('--subtypes', default=ft.SubType.K_1M,
+                        help='comma separated futu subtypes')
+    parser.add_argument('--name', default='btfutu')
+    parser.add_argument('--size', type=int, default=65536,
+                        help='rows per ring')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11111)
+    args = parser.parse_args(args)
+    logging.basicConfig(format='%(asctime)s %(name)s: %(message)s')
+
+    gateway = FutuGateway(args.codes.split(','), args.subtypes.split(','),
+                          name=args.name, size=args.size,
+                          host=args.host, port=args.port)
+    gateway.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import futu as ft
+import numpy as np
+from backtrader import date2num
+
+from btfutu.decode import DATETIME, NCOLS, kline_to_array
+from btfutu.exceptions import FutuRequestError
+from btfutu.ratelimit import RateLimiter
+
+INTRADAY = frozenset([
+    ft.KLType.K_1M, ft.KLType.K_3M, ft.KLType.K_5M, ft.KLType.K_15M,
+    ft.KLType.K_30M, ft.KLType.K_60M])
+
+
+class HistoryCache(object):
+    '''On-disk bar cache, one ``.npy`` file per code, ktype and partition.
+
+    Intraday K-lines are partitioned per day and the others per year. Only
+    complete partitions are written and a ``meta.json`` per code and ktype
+    records the ``[since, upto)`` span they cover. Partitions are read back
+    memory-mapped.
+
+    Each ``autype`` gets its own directory. Forward adjusted (``QFQ``) bars
+    change after every corporate action, so a cache of them has to be
+    cleared on ex-dates, while ``HFQ`` and ``NONE`` bars never do.
+    '''
+
+    def __init__(self, path, autype=ft.AuType.QFQ):
+        self.path = path
+        self.autype = autype
+
+    @staticmethod
+    def partstart(ktype, d):
+        if ktype in INTRADAY:
+            return d
+        return date(d.year, 1, 1)
+
+    @staticmethod
+    def _partnext(ktype, d):
+        if ktype in INTRADAY:
+            return d + timedelta(days=1)
+        return date(d.year + 1, 1, 1)
+
+    @staticmethod
+    def _partname(ktype, d):
+        fmt = '%Y%m%d' if ktype in INTRADAY else '%Y'
+        return d.strftime(fmt) + '.npy'
+
+    def _dir(self, code, ktype):
+        return os.path.join(self.path, code, ktype, self.autype)
+
+    def span(self, code, ktype):
+        try:
+            with open(os.path.join(self._dir(code, ktype), 'meta.json')) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None, None
+
+        todate = lambda x: datetime.strptime(x, '%Y-%m-%d').date()
+        return todate(meta['since']), todate(meta['upto'])
+
+    def read(self, code, ktype, since, upto):
+        '''Returns the memory-mapped partitions in ``[since, upto)``'''
+        dirname = self._dir(code, ktype)
+        arrays = []
+        d = self.partstart(ktype, since)
+        while d < upto:
+            fname = os.path.join(dirname, self._partname(ktype, d))
+            if os.path.exists(fname):
+                arr = np.load(fname, mmap_mode='r')
+                if len(arr):
+                    arrays.append(arr)
+            d = self._partnext(ktype, d)
+
+        return arrays
+
+    def write(self, code, ktype, arr, since, upto):
+        '''Writes the partitions of ``arr`` in ``[since, upto)``. Both limits
+        must be partition boundaries'''
+        dirname = self._dir(code, ktype)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        dts = arr[:, DATETIME]
+        d = since
+        while d < upto:
+            dnext = self._partnext(ktype, d)
+            i0, i1 = np.searchsorted(
+                dts, [date2num(d), date2num(dnext)], side='left')
+            if i1 > i0:  # no file for days without bars
+                np.save(os.path.join(dirname, self._partname(ktype, d)),
+                        np.ascontiguousarray(arr[i0:i1]))
+            d = dnext
+
+    def setspan(self, code, ktype, since, upto):
+        dirname = self._dir(code, ktype)
+        meta = dict(since=since.isoformat(), upto=upto.isoformat())
+        tmpname = os.path.join(dirname, 'meta.json.tmp')
+        with open(tmpname, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmpname, os.path.join(dirname, 'meta.json'))
+
+
+class HistoryLoader(object):
+    '''Backfills K-lines with ``request_history_kline``, paging with
+    ``page_req_key``.
+
+    Requests for many codes run concurrently on a pool of ``workers``
+    threads, all sharing a ``limiter`` so that OpenD's history K-line limit
+    (60 requests per 30 seconds) is never exceeded. With a ``cache`` only
+    the part of the range not already on disk is requested.
+    '''
+    _FIELDS = [ft.KL_FIELD.DATE_TIME, ft.KL_FIELD.OPEN, ft.KL_FIELD.HIGH,
+               ft.KL_FIELD.LOW, ft.KL_FIELD.CLOSE, ft.KL_FIELD.TRADE_VOL]
+
+    def __init__(self, quote_ctx, cache=None, workers=4, limiter=None,
+                 autype=ft.AuType.QFQ, pagesize=1000):
+        self.quote_ctx = quote_ctx
+        self.cache = cache
+        self.limiter = limiter or RateLimiter(60, 30.0)
+        self.autype = autype
+        self.pagesize = pagesize
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, code, ktype, start, end):
+        '''Returns a future for ``load``'''
+        return self._pool.submit(self.load, code, ktype, start, end)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def load(self, code, ktype, start, end):
+        '''Returns a list of bar arrays covering the datetimes ``start`` to
+        ``end``, both included'''
+        dstart, dend = start.date(), end.date()
+        fetchfrom = HistoryCache.partstart(ktype, dstart)
+        arrays = []
+
+        cache = self.cache
+        since = fetchfrom
+        if cache is not None:
+            cachedsince, upto = cache.span(code, ktype)
+            if cachedsince is not None and cachedsince <= dstart < upto:
+                arrays = cache.read(code, ktype, dstart,
+                                    min(dend + timedelta(days=1), upto))
+                since, fetchfrom = cachedsince, upto
+
+        if fetchfrom <= dend:
+            arr = self._fetch(code, ktype, fetchfrom, dend)
+            arrays.append(arr)
+            if cache is not None:
+                # the partitions of the last requested day and of today may
+                # not be complete yet
+                limit = min(dend + timedelta(days=1), date.today())
+                upto = HistoryCache.partstart(ktype, limit)
+                if upto > fetchfrom:
+                    cache.write(code, ktype, arr, fetchfrom, upto)
+                    cache.setspan(code, ktype, since, upto)
+
+        lo, hi = date2num(start), date2num(end)
+        out = []
+        for arr in arrays:
+            dts = arr[:, DATETIME]
+            i0 = np.searchsorted(dts, lo, side='left')
+            i1 = np.searchsorted(dts, hi, side='right')
+            if i1 > i0:
+                out.append(arr[i0:i1])
+
+        return out
+
+    def _fetch(self, code, ktype, dstart, dend):
+        arrays = []
+        pagekey = None
+        while True:
+            self.limiter.acquire()
+            ret, df, pagekey = self.quote_ctx.request_history_kline(
+                code, start=dstart.isoformat(), end=dend.isoformat(),
+                ktype=ktype, autype=self.autype, fields=self._FIELDS,
+                max_count=self.pagesize, page_req_key=pagekey)
+            if ret != ft.RET_OK:
+                raise FutuRequestError(df)
+
+            arrays.append(kline_to_array(df))
+            if pagekey is None:
+                break
+
+        if not arrays:
+            return np.empty((0, NCOLS))
+
+        return np.concatenate(arrays)
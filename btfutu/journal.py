@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import os
+import struct
+import threading
+import time
+
+import futu as ft
+
+# Record header: kind, order ref, timestamp, payload length
+_HEADER = struct.Struct('<BIdH')
+# Submission: trade, acc_id, real, buy, exectype, size, price, pricelimit,
+# trailamount, trailpercent, followed by the code
+_SUBMIT = struct.Struct('<Bq??Bddddd')
+# Fill: cumulative dealt quantity and average price
+_FILL = struct.Struct('<dd')
+_MAGIC = b'BTFUTUJ1'
+
+
+class JournalEntry(object):
+    '''What the journal knows of an order: how to create it again, its
+    account ``key``, its futu ``oid`` once acknowledged and its fills'''
+    __slots__ = ('ref', 'key', 'isbuy', 'exectype', 'size', 'price',
+                 'pricelimit', 'trailamount', 'trailpercent', 'code', 'oid',
+                 'dealt', 'avgprice')
+
+    def __init__(self, ref, key, isbuy, exectype, size, price, pricelimit,
+                 trailamount, trailpercent, code):
+        self.ref = ref
+        self.key = key
+        self.isbuy = isbuy
+        self.exectype = exectype
+        self.size = size
+        self.price = price
+        self.pricelimit = pricelimit
+        self.trailamount = trailamount
+        self.trailpercent = trailpercent
+        self.code = code
+        self.oid = None
+        self.dealt = 0.0
+        self.avgprice = 0.0
+
+
+class OrderJournal(object):
+    '''Append-only log of the submissions, acknowledgements, fills and ends
+    of the orders of the store, for the orders alive when the process died
+    to be recovered on restart.
+
+    The calls only append a tuple to a deque, a thread packs the records
+    and writes them every ``sync`` seconds with one ``fsync`` per batch:
+    what is lost in a crash is at most the last ``sync`` seconds.
+
+    ``open`` replays the log, rewrites it with the orders not ended and
+    starts the writer. ``nextref`` is then above every ref ever journaled,
+    for the refs of new orders not to collide with the remarks of the old
+    ones at OpenD.
+    '''
+    SUBMIT, ACK, FILL, END, NEXTREF = range(5)
+
+    def __init__(self, path, sync=0.05):
+        self.path = path
+        self.sync = sync
+        self.nextref = 1
+        self._q = collections.deque()
+        self._f = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def submit(self, order, key):
+        created = order.created
+        self._q.append((self.SUBMIT, order.ref, time.time(), (
+            key, order.isbuy(), order.exectype, abs(created.size),
+            created.price or 0.0, created.pricelimit or 0.0,
+            created.trailamount or 0.0, created.trailpercent or 0.0,
+            order.data._dataname)))
+
+    def ack(self, oref, oid):
+        self._q.append((self.ACK, oref, time.time(), oid))
+
+    def fill(self, oref, dealt, avgprice):
+        self._q.append((self.FILL, oref, time.time(), (dealt, avgprice)))
+
+    def end(self, oref):
+        self._q.append((self.END, oref, time.time(), None))
+
+    def open(self):
+        '''Returns the ``JournalEntry`` of the orders not ended, by ref'''
+        entries = self._replay()
+        self._compact(entries)
+        self._f = open(self.path, 'ab')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._t_write)
+        self._thread.daemon = True
+        self._thread.start()
+        return entries
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._f is not None:
+            self._write()
+            self._f.close()
+            self._f = None
+
+    def _t_write(self):
+        while not self._stop.wait(self.sync):
+            self._write()
+
+    def _write(self):
+        q = self._q
+        if not q:
+            return
+
+        pack = self._pack
+        chunks = []
+        while q:
+            chunks.append(pack(*q.popleft()))
+
+        self._f.write(b''.join(chunks))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def _pack(self, kind, oref, ts, args):
+        if kind == self.SUBMIT:
+            (trade, acc_id, trd_env), isbuy, exectype, size, price, plimit, \
+                tamount, tpercent, code = args
+            code = code.encode('utf-8')
+            payload = _SUBMIT.pack(
+                trade, acc_id, trd_env == ft.TrdEnv.REAL, isbuy, exectype,
+                size, price, plimit, tamount, tpercent) + code
+        elif kind == self.ACK:
+            payload = str(args).encode('utf-8')
+        elif kind == self.FILL:
+            payload = _FILL.pack(*args)
+        else:
+            payload = b''
+
+        return _HEADER.pack(kind, oref, ts, len(payload)) + payload
+
+    def _replay(self):
+        entries = collections.OrderedDict()
+        if not os.path.exists(self.path):
+            return entries
+
+        with open(self.path, 'rb') as f:
+            buf = f.read()
+        if buf[:len(_MAGIC)] != _MAGIC:
+            raise ValueError('%s is not an order journal' % self.path)
+
+        nextref = 1
+        offset, end = len(_MAGIC), len(buf)
+        while offset + _HEADER.size <= end:
+            kind, oref, ts, size = _HEADER.unpack_from(buf, offset)
+            offset += _HEADER.size
+            if offset + size > end:
+                break  # torn last record
+            payload = buf[offset:offset + size]
+            offset += size
+
+            if kind == self.NEXTREF:
+                nextref = max(nextref, oref)
+                continue
+
+            nextref = max(nextref, oref + 1)
+            if kind == self.SUBMIT:
+                trade, acc_id, real, isbuy, exectype, osize, price, plimit, \
+                    tamount, tpercent = _SUBMIT.unpack_from(payload)
+                key = (trade, acc_id,
+                       ft.TrdEnv.REAL if real else ft.TrdEnv.SIMULATE)
+                code = payload[_SUBMIT.size:].decode('utf-8')
+                entry = entries.get(oref)
+                entries[oref] = e = JournalEntry(
+                    oref, key, isbuy, exectype, osize, price, plimit,
+                    tamount, tpercent, code)
+                if entry is not None:  # sent again, e.g. a rearmed stop
+                    e.oid, e.dealt, e.avgprice = \
+                        entry.oid, entry.dealt, entry.avgprice
+                continue
+
+            entry = entries.get(oref)
+            if entry is None:
+                continue
+            if kind == self.ACK:
+                entry.oid = payload.decode('utf-8')
+            elif kind == self.FILL:
+                entry.dealt, entry.avgprice = _FILL.unpack(payload)
+            elif kind == self.END:
+                del entries[oref]
+
+        self.nextref = nextref
+        return entries
+
+    def _compact(self, entries):
+        # The orders alive only, written to a new file put in place at once
+        records = [_HEADER.pack(self.NEXTREF, self.nextref, time.time(), 0)]
+        for e in entries.values():
+            ts = time.time()
+            records.append(self._pack(self.SUBMIT, e.ref, ts, (
+                e.key, e.isbuy, e.exectype, e.size, e.price, e.pricelimit,
+                e.trailamount, e.trailpercent, e.code)))
+            if e.oid is not None:
+                records.append(self._pack(self.ACK, e.ref, ts, e.oid))
+            if e.dealt:
+                records.append(self._pack(self.FILL, e.ref, ts,
+                                          (e.dealt, e.avgprice)))
+
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(b''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import json
+import threading
+import time
+
+_now = time.perf_counter_ns
+
+
+class Histogram(object):
+    '''Log-linear histogram of non-negative integers in the manner of
+    HdrHistogram: values below ``2 ** subbits`` are counted exactly and the
+    others in buckets no wider than ``1 / 2 ** (subbits - 1)`` of their
+    value, i.e. 0.8% with the default. Recording is a few integer operations
+    and the memory is fixed whatever the range of the values.
+
+    ``record`` takes no lock: two threads recording at the same instant may
+    lose a count, which statistics can live with.
+    '''
+
+    def __init__(self, subbits=8):
+        self._bits = subbits
+        self._counts = [0] * ((65 - subbits) << (subbits - 1))
+        self.reset()
+
+    def reset(self):
+        self._counts[:] = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0
+        self.min = 1 << 64
+        self.max = 0
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        e = value.bit_length() - self._bits
+        self._counts[value if e <= 0 else
+                     (e << (self._bits - 1)) + (value >> e)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value < self.min:
+            self.min = value
+
+    def _value(self, i):
+        # middle of the bucket at index i
+        bits = self._bits
+        if i < 1 << bits:
+            return i
+
+        e = (i >> (bits - 1)) - 1
+        return ((i - (e << (bits - 1))) << e) + (1 << e) // 2
+
+    def percentile(self, q):
+        '''Value below which ``q`` percent of the values are'''
+        if not self.count:
+            return None
+
+        rank = max(1, int(round(self.count * q / 100.0)))
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                return min(self._value(i), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self, scale=1e-3):
+        '''Count and statistics, multiplied by ``scale``: nanoseconds to
+        microseconds by default'''
+        out = dict(count=self.count)
+        if not self.count:
+            return out
+
+        out.update(min=self.min * scale, max=self.max * scale,
+                   mean=self.mean() * scale)
+        for name, q in (('p50', 50.0), ('p90', 90.0), ('p99', 99.0),
+                        ('p999', 99.9)):
+            out[name] = self.percentile(q) * scale
+        return out
+
+
+class LatencyRecorder(object):
+    '''Stamps the hot path from an OpenD push to the ``place_order`` it led
+    to and keeps a ``Histogram`` of nanoseconds per stage:
+
+      - ``decode``: receipt of the push to its bar array
+      - ``enqueue``: bar array to the put into the queue of the data
+      - ``queue``: put to ``_load`` of the bar
+      - ``next``: ``_load`` to the end of ``next`` of the strategy, stamped
+        by the ``FutuLatency`` analyzer
+      - ``submit``: ``_load`` to the submission of an order
+      - ``send``: submission (or trigger) to the ``place_order`` call, i.e.
+        the wait for an order worker and the rate limit
+      - ``ack``: ``place_order`` round trip
+      - ``tick2trade``: receipt of the push to the ``place_order`` return
+
+    The stamps of a push travel with its bars, orders get the stamps of the
+    last live bar loaded before them. Enabled with the ``latency`` param of
+    the store, which then holds the recorder as ``latency``.
+    '''
+    STAGES = ('decode', 'enqueue', 'queue', 'next', 'submit', 'send', 'ack',
+              'tick2trade')
+
+    def __init__(self, subbits=8):
+        self.hists = collections.OrderedDict(
+            (s, Histogram(subbits)) for s in self.STAGES)
+        self._local = threading.local()  # stamps of the push in the thread
+        self._origin = None  # receipt stamp of the last live bar loaded
+        self._loaded = None
+        self._orders = dict()  # oref -> [receipt, last stamp]
+
+    def received(self):
+        '''Start of the decoding of a push'''
+        self._local.recv = _now()
+
+    def decoded(self):
+        t = _now()
+        self._local.decoded = t
+        self.hists['decode'].record(t - self._local.recv)
+
+    def stamps(self):
+        '''Returns the ``[receipt, enqueue]`` stamps to append to a bar put
+        in a data queue. Bars not coming from a push, e.g. closed by the
+        timer of an aggregator, are stamped as received now'''
+        t = _now()
+        local = self._local
+        recv = getattr(local, 'recv', None)
+        if recv is None:
+            recv = t
+        else:
+            self.hists['enqueue'].record(t - local.decoded)
+        return [recv, t]
+
+    def loaded(self, stamps):
+        t = _now()
+        recv, enqueued = stamps
+        self.hists['queue'].record(t - enqueued)
+        self._origin = recv
+        self._loaded = t
+
+    def next(self):
+        if self._loaded is not None:
+            self.hists['next'].record(_now() - self._loaded)
+
+    def submitted(self, oref):
+        if self._loaded is None:
+            return
+
+        t = _now()
+        self.hists['submit'].record(t - self._loaded)
+        self._orders[oref] = [self._origin, t]
+
+    def triggered(self, oref):
+        '''A stop fired by the push being decoded in this thread'''
+        t = _now()
+        recv = getattr(self._local, 'recv', None)
+        self._orders[oref] = [t if recv is None else recv, t]
+
+    def sending(self, oref):
+        entry = self._orders.get(oref, None)
+        if entry is not None:
+            t = _now()
+            self.hists['send'].record(t - entry[1])
+            entry[1] = t
+
+    def acked(self, oref, ok=True):
+        entry = self._orders.pop(oref, None)
+        if entry is not None:
+            t = _now()
+            self.hists['ack'].record(t - entry[1])
+            if ok:
+                self.hists['tick2trade'].record(t - entry[0])
+
+    def discard(self, oref):
+        self._orders.pop(oref, None)
+
+    def reset(self):
+        for hist in self.hists.values():
+            hist.reset()
+
+    def dump(self, path=None):
+        '''Returns the statistics of the stages in microseconds, also
+        written as JSON to ``path`` if given'''
+        out = collections.OrderedDict(
+            (s, h.to_dict()) for s, h in self.hists.items())
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(out, f, indent=2)
+        return out
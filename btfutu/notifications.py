@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+import time
+
+from btfutu.latency import Histogram
+from btfutu.ringbuffer import RingBuffer
+
+_now = time.perf_counter_ns
+
+
+class OrderNotifications(object):
+    '''Order notifications from the futu callback threads to the cerebro
+    thread, queued by order and cloned on delivery.
+
+    An order is queued once until ``get`` delivers it: the transitions it
+    goes through meanwhile supersede one another and are counted in
+    ``coalesced``. The clone is taken by ``get``, with the status of the
+    order then and the executions since its previous delivery pending, for
+    the trades of the strategy to see every fill.
+
+    The executions are delivered in the order of the fills, which the
+    trades depend on. ``executing`` is called before a fill: an order
+    queued behind other orders is moved to the end of the queue, or, if
+    executions of it are pending already, cloned then for those and
+    queued again for the new one. Only such orders have more than one
+    entry, the queue is otherwise bounded by the number of orders and no
+    transition is dropped.
+
+    Changes of the executions of an order are made under ``lock`` for
+    ``get`` not to clone them halfway.
+
+    Metrics: ``depth``, its high-water mark ``maxdepth``, ``coalesced``,
+    ``delivered`` and the ``lag`` from the first queued transition of an
+    order to its delivery, a ``Histogram`` of nanoseconds.
+    '''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._queue = collections.deque()  # [order or clone, stamp, live]
+        self._live = dict()  # oref -> entry of the order itself
+        self._depth = 0  # entries not moved to the end
+        self.lag = Histogram()
+        self.reset()
+
+    def reset(self):
+        self.maxdepth = self._depth
+        self.coalesced = 0
+        self.delivered = 0
+        self.lag.reset()
+
+    def __len__(self):
+        return self._depth
+
+    def __bool__(self):
+        return bool(self._depth)
+
+    __nonzero__ = __bool__
+
+    def put(self, order):
+        with self.lock:
+            if order.ref in self._live:
+                self.coalesced += 1
+                return
+
+            entry = [order, _now(), True]
+            self._queue.append(entry)
+            self._live[order.ref] = entry
+            self._depth += 1
+            if self._depth > self.maxdepth:
+                self.maxdepth = self._depth
+
+    def executing(self, order):
+        '''Called under ``lock`` before ``order`` is executed'''
+        entry = self._live.get(order.ref)
+        if entry is None or entry is self._queue[-1]:
+            return  # the fill is queued last in any case
+
+        del self._live[order.ref]  # put queues it again at the end
+        executed = order.executed
+        if len(executed.exbits) > executed.p2:
+            entry[0] = order.clone()  # delivers the pending executions
+            entry[2] = False
+        else:
+            entry[0] = None
+            self._depth -= 1
+
+    def get(self):
+        '''Returns a clone of the next order or ``None``'''
+        if not self._depth:  # no lock for the common case
+            return None
+
+        with self.lock:
+            while self._queue:
+                order, stamp, live = self._queue.popleft()
+                if order is not None:
+                    break
+            else:
+                return None
+
+            self._depth -= 1
+            if live:
+                del self._live[order.ref]
+                order = order.clone()
+
+        self.lag.record(_now() - stamp)
+        self.delivered += 1
+        return order
+
+    def stats(self):
+        return dict(depth=self._depth, maxdepth=self.maxdepth,
+                    coalesced=self.coalesced, delivered=self.delivered,
+                    lag=self.lag.to_dict())
+
+
+class MessageQueue(object):
+    '''Store notifications from the futu callback threads to the cerebro
+    thread, in a ``RingBuffer`` of ``size`` which drops the oldest when
+    full, counted in ``dropped``.
+
+    ``drain`` returns what was queued when it was called, so that a
+    producer cannot keep the consumer in it, after ``marker(n)`` if ``n``
+    items were dropped since the previous ``drain``.
+
+    Metrics as ``OrderNotifications``, with ``dropped`` for ``coalesced``.
+    '''
+
+    def __init__(self, size=1000, marker=None):
+        self._buf = RingBuffer(size, RingBuffer.DropOldest)
+        self.marker = marker
+        self.lag = Histogram()
+        self.reset()
+
+    def reset(self):
+        self.maxdepth = len(self._buf)
+        self.delivered = 0
+        self._buf.dropped = self._reported = 0
+        self.lag.reset()
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __bool__(self):
+        return bool(self._buf)
+
+    __nonzero__ = __bool__
+
+    def put(self, item):
+        buf = self._buf
+        buf.put((item, _now()))
+        if len(buf) > self.maxdepth:
+            self.maxdepth = len(buf)
+
+    def drain(self):
+        buf = self._buf
+        if not buf:
+            return []
+
+        now, lag, out = _now(), self.lag, []
+        dropped = buf.dropped - self._reported
+        if dropped and self.marker is not None:
+            self._reported += dropped
+            out.append(self.marker(dropped))
+        for _ in range(len(buf)):
+            queued = buf.get()
+            if queued is None:
+                break
+            item, stamp = queued
+            lag.record(now - stamp)
+            out.append(item)
+
+        self.delivered += len(out)
+        return out
+
+    def stats(self):
+        return dict(depth=len(self._buf), maxdepth=self.maxdepth,
+                    dropped=self._buf.dropped, delivered=self.delivered,
+                    lag=self.lag.to_dict())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''Parameter sweeps over Futu history on a pool of processes.
+
+    history = SharedHistory.load('/tmp/sweep', ['HK.00700'], ft.KLType.K_DAY,
+                                 datetime(2018, 1, 1), datetime(2020, 1, 1))
+    sweep = ParamSweep(history)
+    for params, result in sweep.run(SmaCross, pfast=range(5, 20),
+                                    pslow=range(20, 60)):
+        print(params, result['value'])
+
+The history is downloaded once and written to a single ``.npy`` file which
+every worker memory-maps: the bars are read from disk once, shared through
+the page cache and never pickled, unlike with ``optstrategy`` which sends
+the datas to each process.
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import itertools
+import json
+import os
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                wait)
+
+import backtrader as bt
+import futu as ft
+import numpy as np
+from backtrader.utils.py3 import string_types
+
+from btfutu.decode import (CLOSE, DATETIME, HIGH, LOW, NCOLS, OPEN, VOLUME,
+                           fill_lines)
+from btfutu.history import HistoryCache, HistoryLoader
+
+# ktype -> (timeframe, compression) of the datas
+TIMEFRAMES = {
+    ft.KLType.K_1M: (bt.TimeFrame.Minutes, 1),
+    ft.KLType.K_3M: (bt.TimeFrame.Minutes, 3),
+    ft.KLType.K_5M: (bt.TimeFrame.Minutes, 5),
+    ft.KLType.K_15M: (bt.TimeFrame.Minutes, 15),
+    ft.KLType.K_30M: (bt.TimeFrame.Minutes, 30),
+    ft.KLType.K_60M: (bt.TimeFrame.Minutes, 60),
+    ft.KLType.K_DAY: (bt.TimeFrame.Days, 1),
+    ft.KLType.K_WEEK: (bt.TimeFrame.Weeks, 1),
+    ft.KLType.K_MON: (bt.TimeFrame.Months, 1),
+    ft.KLType.K_QUARTER: (bt.TimeFrame.Months, 3),
+    ft.KLType.K_YEAR: (bt.TimeFrame.Years, 1),
+}
+
+
+class ArrayFeed(bt.feed.DataBase):
+    '''Data over a bar array, e.g. a slice of a ``SharedHistory``.
+
+    Without filters ``preload`` bulk-loads the bars between ``fromdate`` and
+    ``todate`` into the lines, else they go through ``_load`` one by one.
+
+    Params:
+
+      - ``bars`` (default: ``None``)
+
+        The ``(n, NCOLS)`` bar array, sorted by datetime
+    '''
+    params = (
+        ('bars', None),
+    )
+
+    def start(self):
+        super(ArrayFeed, self).start()
+        self._idx = 0
+
+    def preload(self):
+        if self._filters or self._tzinput:
+            return super(ArrayFeed, self).preload()
+
+        bars = self.p.bars
+        dts = bars[:, DATETIME]
+        i0 = np.searchsorted(dts, self.fromdate, side='left')
+        i1 = np.searchsorted(dts, self.todate, side='right')
+        fill_lines(self, bars[i0:i1])
+        self._last()
+        self.home()
+
+    def _load(self):
+        bars = self.p.bars
+        if self._idx >= len(bars):
+            return False
+
+        bar = bars[self._idx]
+        self._idx += 1
+        lines = self.lines
+        lines.datetime[0] = bar[DATETIME]
+        lines.open[0] = bar[OPEN]
+        lines.high[0] = bar[HIGH]
+        lines.low[0] = bar[LOW]
+        lines.close[0] = bar[CLOSE]
+        lines.volume[0] = bar[VOLUME]
+        lines.openinterest[0] = 0.0
+        return True
+
+
+class SharedHistory(object):
+    '''The bars of many codes in one ``bars.npy`` file, with an
+    ``index.json`` of the rows of each code and the ``ktype``.
+
+    The file is memory-mapped on first use in each process. Pickling keeps
+    the path and the index only, which is all a worker receives.
+    '''
+    _BARS = 'bars.npy'
+    _INDEX = 'index.json'
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, self._INDEX)) as f:
+            meta = json.load(f)
+
+        self.ktype = meta['ktype']
+        self.index = collections.OrderedDict(
+            (code, tuple(rows)) for code, rows in meta['codes'])
+        self._bars = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_bars'] = None
+        return state
+
+    @property
+    def bars(self):
+        if self._bars is None:
+            self._bars = np.load(os.path.join(self.path, self._BARS),
+                                 mmap_mode='r')
+        return self._bars
+
+    @property
+    def codes(self):
+        return list(self.index)
+
+    def __getitem__(self, code):
+        i0, i1 = self.index[code]
+        return self.bars[i0:i1]
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def write(cls, path, arrays, ktype):
+        '''Writes ``arrays``, a mapping of code to bar array, to the
+        directory ``path`` and returns the ``SharedHistory`` of it'''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        codes, parts, i = [], [], 0
+        for code, arr in arrays.items():
+            codes.append((code, (i, i + len(arr))))
+            parts.append(arr)
+            i += len(arr)
+
+        bars = np.concatenate(parts) if parts else np.empty((0, NCOLS))
+        fname = os.path.join(path, cls._BARS)
+        with open(fname + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(bars, dtype=np.float64))
+        os.replace(fname + '.tmp', fname)
+
+        fname = os.path.join(path, cls._INDEX)
+        with open(fname + '.tmp', 'w') as f:
+            json.dump(dict(ktype=ktype, codes=codes), f)
+        os.replace(fname + '.tmp', fname)
+        return cls(path)
+
+    @classmethod
+    def load(cls, path, codes, ktype, start, end, host='127.0.0.1',
+             port=11111, histcache=None, autype=ft.AuType.QFQ, workers=4):
+        '''Downloads the K-lines of ``codes`` between the datetimes ``start``
+        and ``end`` with a ``HistoryLoader``, through ``histcache`` if not
+        ``None``, and writes them to ``path``'''
+        ctx = ft.OpenQuoteContext(host=host, port=int(port))
+        cache = None
+        if histcache is not None:
+            cache = HistoryCache(histcache, autype=autype)
+        loader = HistoryLoader(ctx, cache=cache, workers=workers,
+                               autype=autype)
+        try:
+            futures = [(code, loader.submit(code, ktype, start, end))
+                       for code in codes]
+            arrays = collections.OrderedDict()
+            for code, future in futures:
+                parts = future.result()
+                arrays[code] = (np.concatenate(parts) if parts
+                                else np.empty((0, NCOLS)))
+        finally:
+            loader.shutdown()
+            ctx.close()
+
+        return cls.write(path, arrays, ktype)
+
+
+def strategy_result(strategy):
+    '''Default result of a run: the final cash and value of the broker and
+    the analysis of each analyzer by name'''
+    analyzers = strategy.analyzers
+    return dict(
+        value=strategy.broker.getvalue(),
+        cash=strategy.broker.getcash(),
+        analyzers=dict((name, analyzers.getbyname(name).get_analysis())
+                       for name in analyzers.getnames()))
+
+
+_history = None  # SharedHistory of the worker process
+
+
+def _attach(history):
+    global _history
+    _history = history
+    history.bars  # mapped once per process
+
+
+def _runchunk(strategy, combos, setup, result, cerebroargs):
+    timeframe, compression = TIMEFRAMES.get(
+        _history.ktype, (bt.TimeFrame.Days, 1))
+    out = []
+    for kwargs in combos:
+        cerebro = bt.Cerebro(**cerebroargs)
+        for code in _history.codes:
+            cerebro.adddata(ArrayFeed(
+                dataname=code, bars=_history[code],
+                timeframe=timeframe, compression=compression), name=code)
+
+        cerebro.addstrategy(strategy, **kwargs)
+        if setup is not None:
+            setup(cerebro)
+        out.append((kwargs, result(cerebro.run()[0])))
+
+    return out
+
+
+class ParamSweep(object):
+    '''Runs a strategy over every combination of params on a pool of
+    ``workers`` processes, each attached to ``history``.
+
+    ``setup(cerebro)`` is called before each run to set the broker, sizers
+    or analyzers up and ``result(strategy)`` returns what is sent back of a
+    run, ``strategy_result`` by default. Both, like the strategy, must be
+    importable by the workers, i.e. defined at module level. ``cerebroargs``
+    are passed to each ``Cerebro``.
+
+    Runs are sent in chunks of ``chunksize`` and at most two chunks per
+    worker are pending at any time.
+    '''
+
+    def __init__(self, history, setup=None, result=strategy_result,
+                 workers=None, chunksize=1, **cerebroargs):
+        self.history = history
+        self.setup = setup
+        self.result = result
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        cerebroargs.setdefault('stdstats', False)
+        self.cerebroargs = cerebroargs
+
+    def run(self, strategy, **kwargs):
+        '''Yields ``(params, result)`` as the runs complete, in no
+        particular order. ``kwargs`` are iterables of values per param, as
+        for ``optstrategy``'''
+        names = list(kwargs)
+        values = [[v] if isinstance(v, string_types) or
+                  not hasattr(v, '__iter__') else v
+                  for v in kwargs.values()]
+        combos = (dict(zip(names, vals))
+                  for vals in itertools.product(*values))
+        chunks = iter(lambda: list(itertools.islice(combos, self.chunksize)),
+                      [])
+
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=_attach,
+                                 initargs=(self.history,)) as pool:
+            pending = set()
+            while True:
+                for chunk in itertools.islice(
+                        chunks, 2 * self.workers - len(pending)):
+                    pending.add(pool.submit(
+                        _runchunk, strategy, chunk, self.setup, self.result,
+                        self.cerebroargs))
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for item in future.result():
+                        yield item
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+from datetime import datetime
+
+import numpy as np
+from backtrader import date2num
+
+from btfutu.decode import dtstr_to_num1
+
+# Rows of the side arrays
+(PRICE, VOLUME, ORDERS) = range(3)
+
+
+class OrderBook(object):
+    '''Order book of one code kept in fixed-depth arrays.
+
+    ``bid`` and ``ask`` are ``(3, depth)`` float64 arrays with the price,
+    volume and order count of each level, best level first. ``nbid`` and
+    ``nask`` tell how many levels are filled.
+
+    ``update`` overwrites the arrays in place from the ``s2c`` part of a
+    ``Qot_UpdateOrderBook`` push without allocating new arrays. It runs in
+    the futu callback thread; use ``snapshot`` to get a consistent copy from
+    another thread.
+    '''
+
+    def __init__(self, depth=10):
+        self.depth = depth
+        self.bid = np.zeros((3, depth))
+        self.ask = np.zeros((3, depth))
+        self.nbid = self.nask = 0
+        self.dt = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, s2c):
+        with self._lock:
+            self.nbid = self._fill(self.bid, s2c.orderBookBidList)
+            self.nask = self._fill(self.ask, s2c.orderBookAskList)
+
+        dtstr = s2c.svrRecvTimeBid or s2c.svrRecvTimeAsk
+        self.dt = dtstr_to_num1(dtstr) if dtstr else date2num(datetime.now())
+
+    def _fill(self, side, levels):
+        n = min(len(levels), self.depth)
+        for i in range(n):
+            level = levels[i]
+            side[PRICE, i] = level.price
+            side[VOLUME, i] = level.volume
+            side[ORDERS, i] = level.orederCount  # sic, futu field name
+
+        side[:, n:] = 0.0
+        return n
+
+    def snapshot(self):
+        '''Returns copies of ``(bid, nbid, ask, nask)``'''
+        with self._lock:
+            return self.bid.copy(), self.nbid, self.ask.copy(), self.nask
+
+    def stats(self, levels=None):
+        '''Returns ``(bid, ask, spread, microprice, imbalance)`` with the
+        depth imbalance taken over the first ``levels`` levels (all if
+        ``None``). ``NaN`` is used for what an empty side does not define'''
+        with self._lock:
+            if not self.nbid or not self.nask:
+                bid = self.bid[PRICE, 0] if self.nbid else float('nan')
+                ask = self.ask[PRICE, 0] if self.nask else float('nan')
+                nan = float('nan')
+                return bid, ask, nan, nan, nan
+
+            bid, ask = self.bid[PRICE, 0], self.ask[PRICE, 0]
+            bidvol, askvol = self.bid[VOLUME, 0], self.ask[VOLUME, 0]
+            bidsum = self.bid[VOLUME, :levels].sum()
+            asksum = self.ask[VOLUME, :levels].sum()
+
+        top = bidvol + askvol
+        if top:
+            microprice = (bid * askvol + ask * bidvol) / top
+        else:
+            microprice = (bid + ask) / 2.0
+
+        total = bidsum + asksum
+        imbalance = (bidsum - asksum) / total if total else 0.0
+        return bid, ask, ask - bid, microprice, imbalance
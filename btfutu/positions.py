@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+import futu as ft
+from backtrader.position import Position
+
+from btfutu.account import AccountState
+
+
+class FutuPosition(object):
+    '''Position of a code in slots, with the interface and the average cost
+    accounting of backtrader's ``Position``, whose methods it borrows.
+
+    ``lot`` is the board lot of the code: ``lots`` whole lots are held and
+    ``oddlot`` shares more, which only trade on the odd lot market in Hong
+    Kong. ``clone`` returns a plain ``Position``.
+    '''
+    __slots__ = ('code', 'lot', 'size', 'price', 'price_orig', 'adjbase',
+                 'upopened', 'upclosed', 'updt', 'datetime')
+
+    def __init__(self, code, size=0.0, price=0.0, lot=1):
+        self.code = code
+        self.lot = lot
+        self.size = size
+        self.price = self.price_orig = price if size else 0.0
+        self.adjbase = None
+        self.upopened = size
+        self.upclosed = 0
+        self.updt = self.datetime = None
+
+    __str__ = Position.__str__
+    __bool__ = __nonzero__ = Position.__bool__
+    fix = Position.fix
+    set = Position.set
+    update = Position.update
+    pseudoupdate = Position.pseudoupdate
+    clone = Position.clone
+
+    def __len__(self):
+        return int(abs(self.size))  # futu quantities are floats
+
+    @property
+    def lots(self):
+        return int(abs(self.size) // self.lot)
+
+    @property
+    def oddlot(self):
+        return abs(self.size) % self.lot
+
+    @property
+    def cost(self):
+        return self.size * self.price
+
+
+class PositionBook(object):
+    '''The ``FutuPosition`` of each code, seeded from ``position_list_query``
+    with the average cost of OpenD and then updated incrementally: by the
+    broker from the fills of its orders and by ``deal`` from the deal pushes
+    of the other orders, e.g. placed by hand.
+
+    ``get`` is a dict lookup and creates the position of a code only the
+    first time. The updates are locked, the reads are not.
+    '''
+
+    def __init__(self):
+        self._positions = dict()  # code -> FutuPosition
+        self._lots = dict()  # code -> board lot
+        self._setlots = dict()  # code -> board lot set by hand, first
+        self._deals = set()
+        self._lock = threading.Lock()
+
+    def get(self, code):
+        pos = self._positions.get(code)
+        if pos is None:
+            with self._lock:
+                pos = self._positions.get(code)
+                if pos is None:
+                    pos = FutuPosition(code, lot=self.lot(code))
+                    self._positions[code] = pos
+        return pos
+
+    __getitem__ = get
+
+    def __contains__(self, code):
+        return code in self._positions
+
+    def __iter__(self):
+        return iter(list(self._positions.values()))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def lot(self, code, default=1):
+        lot = self._setlots.get(code)
+        return lot if lot is not None else self._lots.get(code, default)
+
+    def uselots(self, lots):
+        '''Looks the board lots up in ``lots`` from now on, e.g. the
+        ``StaticData.lots`` updated in place by its refreshes, after those
+        of ``setlot``'''
+        with self._lock:
+            self._lots = lots
+            for code, pos in self._positions.items():
+                pos.lot = self.lot(code)
+
+    def setlot(self, code, lot):
+        '''Sets the board lot of ``code``, over the one of ``uselots``'''
+        self._setlots[code] = lot
+        pos = self._positions.get(code)
+        if pos is not None:
+            pos.lot = lot
+
+    def seed(self, positions):
+        '''Adds the positions of a ``position_list_query`` frame, of one
+        account: a code held in several accounts gets the sum of their
+        quantities at the average of their costs'''
+        cols = [positions['code'].values, positions['qty'].values]
+        for name in ('average_cost', 'cost_price', 'nominal_price'):
+            if name in positions:  # the older versions have no average
+                cols.append(positions[name].values)
+                break
+        if 'position_side' in positions:
+            cols.append(positions['position_side'].values)
+
+        with self._lock:
+            for row in zip(*cols):
+                code, qty, price = row[0], float(row[1]), float(row[2])
+                if len(row) > 3 and row[3] == ft.PositionSide.SHORT:
+                    qty = -abs(qty)
+                pos = self._positions.get(code)
+                if pos is None:
+                    pos = FutuPosition(code, lot=self.lot(code))
+                    self._positions[code] = pos
+                size = pos.size + qty
+                if size and pos.size:
+                    price = (pos.size * pos.price + qty * price) / size
+                pos.fix(size, price if size else 0.0)
+
+    def update(self, code, size, price, dt=None):
+        '''Applies a fill of ``size`` (negative to sell) at ``price`` and
+        returns what ``Position.update`` does'''
+        pos = self.get(code)
+        with self._lock:
+            return pos.update(size, price, dt)
+
+    def deal(self, dealid, code, side, qty, price, status=None):
+        '''Applies a deal pushed by OpenD, once'''
+        sign = AccountState._SIGNS.get(side)
+        if sign is None or status in AccountState._SKIPDEALS:
+            return
+
+        pos = self.get(code)
+        with self._lock:
+            if dealid in self._deals:
+                return
+            self._deals.add(dealid)
+            pos.update(sign * qty, price)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import bisect
+import struct
+import threading
+import time
+
+import futu as ft
+from futu.common.utils import binary2pb
+
+# Record header: payload length, receipt timestamp, futu proto id
+_HEADER = struct.Struct('<IdH')
+# Index entry: file offset of the record and its timestamp
+_INDEX = struct.Struct('<Qd')
+_MAGIC = b'BTFUTUP1'
+
+
+class PushLogWriter(object):
+    '''Appends the raw protobuf pushes received from OpenD to ``path`` as
+    length-prefixed records stamped with the receipt time. An index of
+    ``(offset, timestamp)`` entries is kept in ``path + '.idx'``.
+
+    ``write`` is called from the futu callback threads.
+    '''
+
+    def __init__(self, path):
+        self._f = open(path, 'ab')
+        self._fidx = open(path + '.idx', 'ab')
+        if not self._f.tell():
+            self._f.write(_MAGIC)
+        self._lock = threading.Lock()
+
+    def write(self, proto_id, rsp_pb):
+        payload = rsp_pb.SerializeToString()
+        ts = time.time()
+        with self._lock:
+            offset = self._f.tell()
+            self._f.write(_HEADER.pack(len(payload), ts, proto_id))
+            self._f.write(payload)
+            self._fidx.write(_INDEX.pack(offset, ts))
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+            self._fidx.close()
+
+
+class PushLogReader(object):
+    '''Iterates over the ``(timestamp, proto_id, rsp_pb)`` records of a log
+    written by ``PushLogWriter``, optionally starting at ``fromtime`` which
+    is located with the index'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + '.idx', 'rb') as f:
+            idx = f.read()
+
+        n = len(idx) // _INDEX.size
+        entries = [_INDEX.unpack_from(idx, i * _INDEX.size) for i in range(n)]
+        self._offsets = [x[0] for x in entries]
+        self._stamps = [x[1] for x in entries]
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def records(self, fromtime=None):
+        i = 0
+        if fromtime is not None:
+            i = bisect.bisect_left(self._stamps, fromtime)
+        if i >= len(self._offsets):
+            return
+
+        with open(self.path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError('%s is not a push log' % self.path)
+
+            f.seek(self._offsets[i])
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break  # end of log or torn last record
+
+                size, ts, proto_id = _HEADER.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size:
+                    break
+
+                rsp_pb = binary2pb(payload, proto_id, ft.ProtoFMT.Protobuf)
+                yield ts, proto_id, rsp_pb
+
+
+class PushReplayContext(object):
+    '''Stands in for ``OpenQuoteContext`` and plays a push log back through
+    the handlers set on it, i.e. through the same decode path as live
+    pushes.
+
+    Playback starts with the first ``subscribe`` call and runs in its own
+    thread like the futu callbacks do. With ``speed`` set to ``None`` the
+    records are played as fast as possible, otherwise at ``speed`` times the
+    recorded pace.
+
+    ``nrecords`` and ``elapsed`` give the throughput of the last playback
+    and ``done`` is set once it is over.
+    '''
+    _PROTOS = (
+        (ft.ProtoId.Qot_UpdateKL, ft.CurKlineHandlerBase),
+        (ft.ProtoId.Qot_UpdateTicker, ft.TickerHandlerBase),
+        (ft.ProtoId.Qot_UpdateBasicQot, ft.StockQuoteHandlerBase),
+        (ft.ProtoId.Qot_UpdateOrderBook, ft.OrderBookHandlerBase),
+    )
+
+    def __init__(self, path, speed=None, fromtime=None):
+        self.reader = PushLogReader(path)
+        self.speed = speed
+        self.fromtime = fromtime
+        self.nrecords = 0
+        self.elapsed = 0.0
+        self.done = threading.Event()
+        self._handlers = dict()
+        self._thread = None
+        self._stop = False
+
+    def set_handler(self, handler):
+        for proto_id, cls in self._PROTOS:
+            if isinstance(handler, cls):
+                self._handlers[proto_id] = handler
+                return ft.RET_OK
+
+        return ft.RET_ERROR
+
+    def subscribe(self, code_list, subtype_list, **kwargs):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._play)
+            self._thread.daemon = True
+            self._thread.start()
+
+        return ft.RET_OK, None
+
+    def unsubscribe(self, code_list, subtype_list, **kwargs):
+        return ft.RET_OK, None
+
+    def request_history_kline(self, code, **kwargs):
+        return ft.RET_ERROR, 'no history in replay mode', None
+
+    def close(self):
+        self._stop = True
+
+    def _play(self):
+        t0 = ts0 = None
+        start = time.time()
+        for ts, proto_id, rsp_pb in self.reader.records(self.fromtime):
+            if self._stop:
+                break
+
+            if self.speed:
+                if t0 is None:
+                    t0, ts0 = time.time(), ts
+                else:
+                    wait = (ts - ts0) / self.speed - (time.time() - t0)
+                    if wait > 0.0:
+                        time.sleep(wait)
+
+            handler = self._handlers.get(proto_id)
+            if handler is not None:
+                handler.on_recv_rsp(rsp_pb)
+            self.nrecords += 1
+
+        self.elapsed = time.time() - start
+        self.done.set()
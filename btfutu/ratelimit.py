@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+import time
+
+
+class RateLimiter(object):
+    '''Allows at most ``calls`` acquisitions in any window of ``period``
+    seconds, which is how OpenD counts its per-interface limits, and
+    optionally no two acquisitions less than ``spacing`` seconds apart.
+
+    A token bucket would let a full bucket burst on top of the calls of the
+    previous window, which a fixed count per window does not allow.
+
+    ``acquire`` is thread-safe and sleeps outside the lock until a slot in
+    the window frees up.
+    '''
+
+    def __init__(self, calls, period, spacing=0.0):
+        self.calls = calls
+        self.period = period
+        self.spacing = spacing
+        self._stamps = collections.deque()
+        self._lock = threading.Lock()
+
+    def _delay(self, now):
+        stamps = self._stamps
+        while stamps and stamps[0] <= now - self.period:
+            stamps.popleft()
+
+        wait = 0.0
+        if len(stamps) >= self.calls:
+            wait = stamps[0] + self.period - now
+        if stamps and self.spacing:
+            wait = max(wait, stamps[-1] + self.spacing - now)
+        return wait
+
+    def _reserve(self, now):
+        # Returns the time to wait, or 0.0 after taking a slot at ``now``
+        wait = self._delay(now)
+        if wait <= 0.0:
+            self._stamps.append(now)
+            return 0.0
+
+        return wait
+
+    def delay(self):
+        '''Returns the seconds until a slot is free, without taking it'''
+        with self._lock:
+            return max(self._delay(time.monotonic()), 0.0)
+
+    def acquire(self, block=True):
+        while True:
+            with self._lock:
+                wait = self._reserve(time.monotonic())
+
+            if not wait:
+                return True
+
+            if not block:
+                return False
+
+            time.sleep(wait)
+
+
+class Coalescer(object):
+    '''Runs concurrent identical calls once.
+
+    ``call(key, func, *args, **kwargs)`` runs ``func`` unless a call with the
+    same ``key`` is in flight, in which case it waits for and returns the
+    result of that call. With ``maxage`` the result is also returned to the
+    calls made in the following ``maxage`` seconds.
+
+    ``forget`` drops a result which should not be reused, e.g. an error.
+    '''
+
+    def __init__(self, maxage=0.0):
+        self.maxage = maxage
+        # key -> [event, result, exception, time of the result]
+        self._calls = dict()
+        self._lock = threading.Lock()
+
+    def call(self, key, func, *args, **kwargs):
+        with self._lock:
+            entry = self._calls.get(key)
+            if entry is not None and entry[0].is_set() and \
+                    time.monotonic() - entry[3] > self.maxage:
+                entry = None
+
+            leader = entry is None
+            if leader:
+                entry = [threading.Event(), None, None, 0.0]
+                self._calls[key] = entry
+
+        if leader:
+            try:
+                entry[1] = func(*args, **kwargs)
+            except Exception as e:
+                entry[2] = e
+                self.forget(key)
+            finally:
+                entry[3] = time.monotonic()
+                entry[0].set()
+        else:
+            entry[0].wait()
+
+        if entry[2] is not None:
+            raise entry[2]
+
+        return entry[1]
+
+    def forget(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+
+class WriteQueue(object):
+    '''Priority queue of writes feeding a pool of worker threads.
+
+    ``lanes`` is a sequence of ``(limiter, maxsize)`` pairs, lane ``0``
+    having the highest priority. ``get`` returns the oldest item of the
+    first lane which has items and a free slot in its limiter, taking the
+    slot, so that no worker sleeps on the limit of one interface while
+    another lane could go ahead. Several lanes may share a limiter.
+
+    ``put`` blocks while a lane with a ``maxsize`` is full.
+    '''
+
+    def __init__(self, lanes):
+        self._lanes = [(collections.deque(), limiter, maxsize)
+                       for limiter, maxsize in lanes]
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return sum(len(lane[0]) for lane in self._lanes)
+
+    def put(self, lane, item):
+        items, _, maxsize = self._lanes[lane]
+        with self._cond:
+            while maxsize and len(items) >= maxsize and not self._closed:
+                self._cond.wait()
+
+            items.append(item)
+            self._cond.notify_all()
+
+    def get(self):
+        '''Returns the next item, or ``None`` once ``close`` was called'''
+        with self._cond:
+            while not self._closed:
+                wait = None
+                for items, limiter, maxsize in self._lanes:
+                    if not items:
+                        continue
+
+                    if limiter is None or limiter.acquire(block=False):
+                        item = items.popleft()
+                        if maxsize:
+                            self._cond.notify_all()  # room for put
+                        return item
+
+                    delay = limiter.delay()
+                    wait = delay if wait is None else min(wait, delay)
+
+                self._cond.wait(wait)
+
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
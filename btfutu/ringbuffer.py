@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+
+
+class RingBuffer(object):
+    '''Bounded handoff between the futu callback threads (producers) and the
+    cerebro thread (single consumer).
+
+    ``collections.deque`` appends and pops are atomic, so the consumer side
+    never takes a lock. The producer only pays for synchronization when the
+    ``Coalesce`` or ``Block`` policies need it.
+
+    Params:
+
+      - ``size`` (default: ``4096``)
+
+        Maximum number of items held in the buffer
+
+      - ``policy`` (default: ``DropOldest``)
+
+        What to do when a producer finds the buffer full:
+
+          - ``DropOldest``: discard the oldest item and keep the new one
+          - ``Coalesce``: replace the newest queued item with the new one
+          - ``Block``: wait until the consumer frees a slot
+
+    The ``dropped`` and ``coalesced`` counters report how many items were
+    lost to each policy.
+    '''
+    (DropOldest, Coalesce, Block) = range(3)
+
+    def __init__(self, size=4096, policy=DropOldest):
+        if size < 2:
+            raise ValueError('RingBuffer size must be at least 2')
+
+        self.size = size
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._buf = collections.deque(maxlen=size)
+        self._plock = threading.Lock()  # producer side only
+        self._slots = (threading.Semaphore(size) if policy == self.Block
+                       else None)
+        self._evt = threading.Event()
+        self._waiting = False
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __bool__(self):
+        return bool(self._buf)
+
+    __nonzero__ = __bool__
+
+    def put(self, item):
+        buf = self._buf
+        if self.policy == self.DropOldest:
+            if len(buf) == self.size:
+                self.dropped += 1
+            buf.append(item)  # deque drops the left end by itself
+
+        elif self.policy == self.Coalesce:
+            with self._plock:
+                if len(buf) == self.size:
+                    try:
+                        buf[-1] = item
+                        self.coalesced += 1
+                    except IndexError:  # drained in between
+                        buf.append(item)
+                else:
+                    buf.append(item)
+
+        else:
+            self._slots.acquire()
+            buf.append(item)
+
+        if self._waiting:
+            self._evt.set()
+
+    def get(self, timeout=0.0):
+        '''Returns the oldest item or ``None`` if nothing arrived within
+        ``timeout`` seconds. A ``timeout`` of ``0`` never blocks'''
+        try:
+            item = self._buf.popleft()
+        except IndexError:
+            if not timeout:
+                return None
+
+            self._evt.clear()
+            self._waiting = True
+            try:
+                if not self._buf:
+                    self._evt.wait(timeout)
+                item = self._buf.popleft()
+            except IndexError:
+                return None
+            finally:
+                self._waiting = False
+
+        if self._slots is not None:
+            self._slots.release()
+
+        return item
+
+    def clear(self):
+        while self.get() is not None:
+            pass
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+
+import numpy as np
+from backtrader import Order
+
+from btfutu.positions import PositionBook
+from btfutu.spreads import spread_table
+
+_NAN = float('nan')
+_INF = float('inf')
+
+_STOPS = (Order.Stop, Order.StopTrail)
+_STOPLIMITS = (Order.StopLimit, Order.StopTrailLimit)
+_TRAILS = (Order.StopTrail, Order.StopTrailLimit)
+
+
+class FutuSimulator(object):
+    '''Exchange simulator standing in for the order side of ``FutuStore``
+    when ``FutuBroker`` runs with ``simulate=True``: the broker submits,
+    cancels and is notified of its orders through the same calls, which
+    the simulator answers on the bars of the datas instead of OpenD.
+
+    Orders are checked when sent: sizes must be multiples of the board lot
+    of the code, from ``positions.setlot`` or else the static data cache of
+    the store, and limit prices on its tick ladder, from ``spread_table``.
+    They are accepted at once and matched from the next bar of their data
+    on, all the orders waiting in one vectorized pass per ``next``:
+
+      - ``Market`` at the open, ``Close`` at the close of the session, or
+        the last close before it if no bar ended it
+      - ``Limit`` at the open or better, else at the limit if the bar
+        reached it
+      - ``Stop`` and ``StopTrail`` at the open or the stop, whichever is
+        worse, once the bar reached the stop, after which the ``StopLimit``
+        ones work as a limit. Trailing stops follow the closes
+
+    The datas of order book feeds, with ``bid`` and ``ask`` lines, are
+    matched against the best price of the other side instead of the bar.
+    Buys above the cash are rejected with ``Margin``. Fills are whole and
+    their commissions those of the comminfo of the broker, ``FutuCommInfo``
+    by default.
+
+    Notifications go to ``store``, the ``FutuStore`` of the datas.
+    '''
+
+    def __init__(self, store, cash=1000000.0):
+        self.store = store
+        self.broker = None
+        self.positions = PositionBook()
+        self.startingcash = self.cash = cash
+        self._pending = collections.OrderedDict()  # oref -> order
+        self._marks = dict()  # oref -> length of its data last matched
+        self._datas = dict()  # code -> data, for the value of the positions
+
+    def start(self, data=None, broker=None):
+        if broker is not None:
+            self.broker = broker
+            # the lots of the static data cache of the store, if any, as
+            # they are: no OpenD in a backtest
+            static = self.store.static
+            for market in self.store.staticmarkets():
+                static.load(market)
+            self.positions.uselots(static.lots)
+
+    def stop(self):
+        pass
+
+    def put_notification(self, msg, *args, **kwargs):
+        self.store.put_notification(msg, *args, **kwargs)
+
+    def recovered(self):
+        return ()
+
+    def set_cash(self, cash):
+        self.startingcash = self.cash = cash
+
+    def get_cash(self):
+        return self.cash
+
+    def get_power(self):
+        return self.cash
+
+    def get_value(self):
+        value = self.cash
+        for pos in self.positions:
+            if pos.size:
+                data = self._datas.get(pos.code)
+                price = data.close[0] if data is not None else pos.price
+                value += pos.size * price
+        return value
+
+    def get_positions(self):
+        return self.positions
+
+    def checkorder(self, order):
+        '''Returns why ``order`` would be rejected or ``None``'''
+        code = order.data._dataname
+        lot = self.positions.lot(code)
+        if abs(order.created.size) % lot:
+            return 'size not a multiple of lot %d' % lot
+
+        limit = None
+        if order.exectype == Order.Limit:
+            limit = order.created.price
+        elif order.exectype == Order.StopLimit:
+            limit = order.created.pricelimit
+        if limit is not None and not spread_table(code).valid(limit):
+            return 'price %s not on the spread table' % limit
+        return None
+
+    def supports(self, order):
+        return order.exectype in (
+            Order.Market, Order.Close, Order.Limit, Order.Stop,
+            Order.StopLimit, Order.StopTrail, Order.StopTrailLimit)
+
+    def order_create(self, order, stopside=None, takeside=None, **kwargs):
+        orders = [o for o in (order, stopside, takeside) if o is not None]
+        for o in orders:
+            self.broker._submit(o.ref)
+
+        self.order_send(order)
+        return order
+
+    def order_send(self, order, **kwargs):
+        if not self.supports(order):
+            self.store.put_notification('exectype not supported',
+                                        oref=order.ref)
+            return self.broker._reject(order.ref)
+
+        code = order.data._dataname
+        msg = self.checkorder(order)
+        if msg is not None:
+            self.store.put_notification(msg, oref=order.ref)
+            return self.broker._reject(order.ref)
+
+        self._datas[code] = order.data
+        self._pending[order.ref] = order
+        self._marks[order.ref] = len(order.data)
+        self.broker._accept(order.ref)
+
+    def order_cancel(self, order):
+        if self._pending.pop(order.ref, None) is not None:
+            del self._marks[order.ref]
+            self.broker._cancel(order.ref)
+
+    def next(self):
+        '''Matches the orders whose data has a new bar'''
+        marks = self._marks
+        orders = []
+        for oref, order in self._pending.items():
+            n = len(order.data)
+            if n > marks[oref]:
+                marks[oref] = n
+                orders.append(order)
+
+        if not orders:
+            return
+
+        fills, prices, expired = self._match(orders)
+        broker = self.broker
+        for i in np.flatnonzero(expired):
+            order = orders[i]
+            self._pop(order.ref)
+            broker._expire(order.ref)
+
+        for i in np.flatnonzero(fills):
+            order = orders[i]
+            size, price = abs(order.executed.remsize), float(prices[i])
+            self._pop(order.ref)
+            if order.isbuy():
+                cost = size * price + order.comminfo.getcommission(size, price)
+                if cost > self.cash:
+                    broker._margin(order.ref)
+                    continue
+
+            broker._fill(order.ref, size, price)
+            bit = order.executed.exbits[-1]
+            self.cash -= bit.size * price + bit.closedcomm + bit.openedcomm
+
+        for i in np.flatnonzero(~fills & ~expired):
+            order = orders[i]
+            if order.exectype in _TRAILS:
+                order.trailadjust(order.data.close[0])
+
+    def _pop(self, oref):
+        del self._pending[oref]
+        del self._marks[oref]
+
+    def _match(self, orders):
+        n = len(orders)
+        bars = dict()  # data -> (datetime, open, high, low, close, bid, ask)
+        rows = np.empty((n, 5))
+        cols = np.empty((n, 8))
+        for i, order in enumerate(orders):
+            data = order.data
+            bar = bars.get(data)
+            if bar is None:
+                lines = data.lines
+                bid = getattr(lines, 'bid', None)
+                ask = getattr(lines, 'ask', None)
+                bar = bars[data] = (
+                    data.datetime[0], data.open[0], data.high[0],
+                    data.low[0], data.close[0],
+                    bid[0] if bid is not None else _NAN,
+                    ask[0] if ask is not None else _NAN)
+
+            created = order.created
+            rows[i] = bar[:5]
+            cols[i] = (order.isbuy(), order.exectype, order.triggered,
+                       created.price or _NAN, created.pricelimit or _NAN,
+                       order.valid or _INF, order.dteos,
+                       getattr(order, 'pannotated', None) or _NAN)
+            # book feeds: the best price of the other side, all bar long
+            quote = bar[6] if order.isbuy() else bar[5]
+            if quote == quote:
+                rows[i, 1:] = quote
+
+        dt, o, h, l, c = rows.T
+        buy = cols[:, 0].astype(bool)
+        ex = cols[:, 1]
+        triggered = cols[:, 2].astype(bool)
+        stop, limit, valid = cols[:, 3], cols[:, 4], cols[:, 5]
+        dteos, pannotated = cols[:, 6], cols[:, 7]
+        limit = np.where(ex == Order.Limit, stop, limit)
+
+        # past their validity before anything else, as in backtrader
+        expired = (dt > valid) & (ex != Order.Market)
+
+        fills = np.zeros(n, dtype=bool)
+        prices = np.full(n, np.nan)
+
+        market = ex == Order.Market
+        fills |= market
+        prices[market] = o[market]
+
+        close = ex == Order.Close
+        closed = close & (dt >= dteos)
+        fills |= closed
+        prices[closed] = np.where(
+            (dt > dteos) & (pannotated == pannotated), pannotated, c)[closed]
+        for i in np.flatnonzero(close & ~closed & ~expired):
+            orders[i].pannotated = c[i]
+
+        # the stops reached in this bar, at the open or the stop if worse
+        isstop = np.isin(ex, _STOPS)
+        isstoplimit = np.isin(ex, _STOPLIMITS)
+        reached = (isstop | (isstoplimit & ~triggered)) & np.where(
+            buy, h >= stop, l <= stop)
+        trigprice = np.where(buy, np.maximum(o, stop), np.minimum(o, stop))
+
+        stopped = isstop & reached
+        fills |= stopped
+        prices[stopped] = trigprice[stopped]
+
+        # the limits, from the open or from the price the stop triggered at
+        islimit = (ex == Order.Limit) | (isstoplimit & (triggered | reached))
+        start = np.where(isstoplimit & reached, trigprice, o)
+        atstart = np.where(buy, start <= limit, start >= limit)
+        inbar = np.where(buy, l <= limit, h >= limit)
+        limited = islimit & (atstart | inbar)
+        fills |= limited
+        prices[limited] = np.where(atstart, start, limit)[limited]
+
+        for i in np.flatnonzero(isstoplimit & reached & ~fills & ~expired):
+            orders[i].triggered = True
+
+        return fills & ~expired, prices, expired
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+import time
+
+import numpy as np
+
+import futu as ft
+
+from btfutu.decode import DATETIME, snapshot_to_array
+
+
+class SnapshotPoller(object):
+    '''Polls ``get_market_snapshot`` for codes beyond the subscription
+    quota of OpenD.
+
+    The codes are sorted and cut in batches of ``batchsize``, the most a
+    call takes, which are spread evenly over ``interval`` seconds within
+    the rate ``limiter``. The last price and volume of each code are kept in
+    arrays and every result is diffed against them in one vectorized pass:
+    ``push(code, bars)`` is called for the codes which changed only, with
+    one single price bar.
+
+    ``add`` and ``remove`` maintain ``index``, a dict mapping each code to
+    the tuple of its subscribers, replaced and never mutated like the one
+    of ``SubscriptionRegistry``.
+    '''
+
+    def __init__(self, ctx, push, interval=5.0, batchsize=400, limiter=None,
+                 notify=None):
+        self.ctx = ctx
+        self.push = push
+        self.interval = interval
+        self.batchsize = batchsize
+        self.limiter = limiter
+        self.notify = notify
+        self.index = dict()
+        self.npolls = 0
+        self.nbars = 0
+        self._codes = np.array([], dtype=object)
+        self._price = np.empty(0)
+        self._volume = np.empty(0)
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, code, subscriber):
+        with self._lock:
+            subs = self.index.get(code, ())
+            if subscriber not in subs:
+                self.index[code] = subs + (subscriber,)
+                self._dirty = not subs or self._dirty
+
+    def remove(self, code, subscriber):
+        with self._lock:
+            subs = tuple(x for x in self.index.get(code, ())
+                         if x is not subscriber)
+            if subs:
+                self.index[code] = subs
+            elif self.index.pop(code, None) is not None:
+                self._dirty = True
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._t_poll)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _rebatch(self):
+        # Sorted codes with the last values of those polled before
+        with self._lock:
+            codes = np.array(sorted(self.index), dtype=object)
+            self._dirty = False
+
+        price = np.full(len(codes), np.nan)
+        volume = np.full(len(codes), np.nan)
+        old = self._codes
+        if len(old) and len(codes):
+            pos = np.minimum(np.searchsorted(old, codes), len(old) - 1)
+            hit = old[pos] == codes
+            price[hit] = self._price[pos[hit]]
+            volume[hit] = self._volume[pos[hit]]
+
+        self._codes, self._price, self._volume = codes, price, volume
+        size = self.batchsize
+        return [codes[i:i + size] for i in range(0, len(codes), size)]
+
+    def _t_poll(self):
+        batches = []
+        while not self._stop.is_set():
+            if self._dirty or not batches:
+                batches = self._rebatch()
+            if not batches:
+                self._stop.wait(self.interval)
+                continue
+
+            spacing = self.interval / len(batches)
+            t = time.monotonic()
+            for batch in batches:
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                if self._stop.is_set():
+                    return
+
+                ret, df = self.ctx.get_market_snapshot(list(batch))
+                if ret != ft.RET_OK:
+                    if self.notify is not None:
+                        self.notify(df)
+                else:
+                    self._diff(df)
+
+                t += spacing
+                wait = t - time.monotonic()
+                if wait > 0.0:
+                    self._stop.wait(wait)
+
+    def _diff(self, df):
+        self.npolls += 1
+        if not len(df):
+            return
+
+        codes = np.asarray(df['code'].values, dtype=object)
+        idx = np.searchsorted(self._codes, codes)
+        price = np.asarray(df['last_price'].values, dtype=float)
+        volume = np.asarray(df['volume'].values, dtype=float)
+        changed = (price != self._price[idx]) | (volume != self._volume[idx])
+        self._price[idx] = price
+        self._volume[idx] = volume
+
+        rows = np.flatnonzero(changed)
+        if not len(rows):
+            return
+
+        bars = snapshot_to_array(df.iloc[rows])
+        valid = ~np.isnan(bars[:, DATETIME])  # never traded, no update time
+        push = self.push
+        for i, code in enumerate(codes[rows]):
+            if valid[i]:
+                push(code, bars[i:i + 1])
+        self.nbars += int(valid.sum())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+
+
+class SpreadTable(object):
+    '''Tick size ladder: ``steps`` is a list of ``(upto, tick)``, the tick
+    of the prices up to and including ``upto``, in increasing order.
+
+    The methods take a price or an array of prices.
+    '''
+
+    def __init__(self, steps):
+        self.steps = steps
+        self._upto = np.array([upto for upto, _ in steps])
+        self._ticks = np.array([tick for _, tick in steps])
+
+    def tick(self, price):
+        i = np.searchsorted(self._upto, price, side='left')
+        return self._ticks[np.minimum(i, len(self._ticks) - 1)]
+
+    def valid(self, price):
+        '''Whether ``price`` is on the ladder'''
+        ticks = price / self.tick(price)
+        return np.abs(ticks - np.round(ticks)) < 1e-6
+
+    def round(self, price, up=False):
+        '''Rounds ``price`` down, or up, to the ladder'''
+        tick = self.tick(price)
+        if up:
+            return np.ceil(price / tick - 1e-6) * tick
+        return np.floor(price / tick + 1e-6) * tick
+
+
+# Spread table of the HKEX for stocks (part A)
+HK_STOCKS = SpreadTable([
+    (0.25, 0.001), (0.5, 0.005), (10.0, 0.01), (20.0, 0.02), (100.0, 0.05),
+    (200.0, 0.1), (500.0, 0.2), (1000.0, 0.5), (2000.0, 1.0), (5000.0, 2.0),
+    (float('inf'), 5.0),
+])
+
+# Sub-penny prices below one dollar only
+US_STOCKS = SpreadTable([(1.0, 0.0001), (float('inf'), 0.01)])
+
+CN_STOCKS = SpreadTable([(float('inf'), 0.01)])
+
+# market prefix of the code -> SpreadTable
+SPREADS = {
+    'HK': HK_STOCKS,
+    'US': US_STOCKS,
+    'SH': CN_STOCKS,
+    'SZ': CN_STOCKS,
+}
+
+
+def spread_table(code):
+    '''Returns the ``SpreadTable`` of the market of ``code``'''
+    return SPREADS.get(code.split('.', 1)[0], CN_STOCKS)
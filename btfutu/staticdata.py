@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import futu as ft
+
+from btfutu.exceptions import FutuRequestError
+from btfutu.spreads import spread_table
+
+# market prefix of the codes -> market of request_trading_days
+_DAYMARKETS = {
+    'HK': ft.TradeDateMarket.HK,
+    'US': ft.TradeDateMarket.US,
+    'SH': ft.TradeDateMarket.CN,
+    'SZ': ft.TradeDateMarket.CN,
+}
+
+
+class StaticData(object):
+    '''Lot sizes, names and trading days of whole markets, for lookups
+    without a call to OpenD in the order path.
+
+    ``refresh`` pulls each market with one ``get_stock_basicinfo`` per
+    security type of ``TYPES`` and one ``request_trading_days`` for a year
+    back and one ahead. With a ``path``, a market is written to a
+    ``<market>.json`` file and ``load`` reads it back at the next start:
+    the file is used as is on the day it was written, within ``ttl``
+    seconds, else refreshed. Files of another ``VERSION`` are ignored.
+
+    Lookups are dict reads. ``lots`` is updated in place, it may be shared,
+    e.g. by a ``PositionBook``.
+    '''
+    VERSION = 1
+    TYPES = (ft.SecurityType.STOCK, ft.SecurityType.ETF,
+             ft.SecurityType.WARRANT)
+
+    def __init__(self, path=None, ttl=86400.0):
+        self.path = path
+        self.ttl = ttl
+        self.lots = dict()  # code -> board lot
+        self.names = dict()  # code -> name
+        self._days = dict()  # (day market, 'YYYY-MM-DD') -> trade date type
+        self._calendars = set()  # day markets with their days
+        self._fetched = dict()  # market -> time of the data
+        self._lock = threading.Lock()
+
+    def _file(self, market):
+        return os.path.join(self.path, '%s.json' % market)
+
+    def has(self, market):
+        '''Whether ``market`` was loaded or pulled, fresh or not'''
+        return market in self._fetched
+
+    def fresh(self, market):
+        fetched = self._fetched.get(market)
+        return (fetched is not None and time.time() - fetched < self.ttl and
+                date.fromtimestamp(fetched) == date.today())
+
+    def load(self, market):
+        '''Reads the file of ``market``, returns whether it is fresh'''
+        if self.path is None or market in self._fetched:
+            return self.fresh(market)
+
+        try:
+            with open(self._file(market)) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return False
+        if meta.get('version') != self.VERSION:
+            return False
+
+        self._set(market, meta)
+        return self.fresh(market)
+
+    def refresh(self, quote_ctx, market):
+        '''Pulls ``market`` from OpenD, raises ``FutuRequestError``'''
+        lots, names = dict(), dict()
+        for sectype in self.TYPES:
+            ret, df = quote_ctx.get_stock_basicinfo(market, sectype)
+            if ret != ft.RET_OK:
+                raise FutuRequestError(df)
+            lots.update(zip(df['code'].values,
+                            df['lot_size'].values.astype(int).tolist()))
+            names.update(zip(df['code'].values, df['name'].values))
+
+        days = dict()
+        daymarket = _DAYMARKETS.get(market)
+        if daymarket is not None:
+            today = date.today()
+            ret, rows = quote_ctx.request_trading_days(
+                daymarket, start=(today - timedelta(days=365)).isoformat(),
+                end=(today + timedelta(days=365)).isoformat())
+            if ret != ft.RET_OK:
+                raise FutuRequestError(rows)
+            days = dict((row['time'], row['trade_date_type']) for row in rows)
+
+        meta = dict(version=self.VERSION, fetched=time.time(), lots=lots,
+                    names=names, days=days)
+        self._set(market, meta)
+        if self.path is not None:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fname = self._file(market)
+            with open(fname + '.tmp', 'w') as f:
+                json.dump(meta, f)
+            os.replace(fname + '.tmp', fname)
+
+    def _set(self, market, meta):
+        daymarket = _DAYMARKETS.get(market)
+        with self._lock:
+            self.lots.update(meta['lots'])
+            self.names.update(meta['names'])
+            self._days.update(((daymarket, d), t)
+                              for d, t in meta['days'].items())
+            if meta['days']:
+                self._calendars.add(daymarket)
+            self._fetched[market] = meta['fetched']
+
+    def lot(self, code):
+        return self.lots.get(code, 1)
+
+    def roundprice(self, code, price, up=False):
+        '''Rounds ``price`` down, or up, to the tick ladder of ``code``'''
+        table = spread_table(code)
+        if table.valid(price):
+            return price
+        return float(table.round(price, up=up))
+
+    def tradingday(self, code, day=None):
+        '''Returns the ``TradeDateType`` of ``day``, today by default, in the
+        market of ``code``, ``None`` if the market is closed or unknown'''
+        daymarket = _DAYMARKETS.get(code.split('.', 1)[0])
+        day = (day or date.today()).isoformat()
+        return self._days.get((daymarket, day))
+
+    def isopen(self, code, day=None):
+        '''Whether the market of ``code`` trades on ``day``, today by
+        default, ``True`` if its calendar is unknown'''
+        return (_DAYMARKETS.get(code.split('.', 1)[0]) not in self._calendars
+                or self.tradingday(code, day) is not None)
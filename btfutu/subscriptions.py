@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+
+import futu as ft
+
+
+class SubscriptionRegistry(object):
+    '''Reference counted ``(code, subtype)`` subscriptions shared by all the
+    feeds of a store over a single quote context.
+
+    ``add`` and ``remove`` only record the change. ``flush`` sends the
+    pending changes with one ``subscribe``/``unsubscribe`` call per subtype
+    and ``batchsize`` codes, so starting hundreds of feeds costs a handful of
+    round trips to OpenD.
+
+    Pushes are fanned out through ``index``, a dict mapping each
+    ``(code, subtype)`` to the tuple of subscribers. The tuples are replaced,
+    never mutated, which lets the callback threads read them without a lock.
+    '''
+
+    def __init__(self, batchsize=200):
+        self.batchsize = batchsize
+        self.index = dict()
+        self._lock = threading.Lock()
+        self._pendsub = collections.OrderedDict()  # key -> None (ordered set)
+        self._pendunsub = collections.OrderedDict()
+
+    def add(self, code, subtype, subscriber):
+        key = (code, subtype)
+        with self._lock:
+            subs = self.index.get(key, ())
+            if subscriber in subs:
+                return
+
+            if not subs and key not in self._pendunsub:
+                self._pendsub[key] = None
+
+            self._pendunsub.pop(key, None)  # still live on the OpenD side
+            self.index[key] = subs + (subscriber,)
+
+    def remove(self, code, subtype, subscriber):
+        key = (code, subtype)
+        with self._lock:
+            subs = self.index.get(key, ())
+            if subscriber not in subs:
+                return
+
+            subs = tuple(x for x in subs if x is not subscriber)
+            if subs:
+                self.index[key] = subs
+                return
+
+            self.index.pop(key, None)
+            if key in self._pendsub:
+                del self._pendsub[key]  # never reached OpenD
+            else:
+                self._pendunsub[key] = None
+
+    def pending(self):
+        return bool(self._pendsub or self._pendunsub)
+
+    def flush(self, quote_ctx):
+        '''Sends pending changes. Returns a list of ``(subscribers, msg)``
+        for the subscribe batches OpenD rejected'''
+        with self._lock:
+            pendsub, self._pendsub = self._pendsub, collections.OrderedDict()
+            pendunsub, self._pendunsub = (self._pendunsub,
+                                          collections.OrderedDict())
+
+        for codes, subtype in self._batches(pendunsub):
+            quote_ctx.unsubscribe(codes, [subtype])
+
+        failed = []
+        for codes, subtype in self._batches(pendsub):
+            ret, msg = quote_ctx.subscribe(codes, [subtype])
+            if ret != ft.RET_OK:
+                subs = []
+                with self._lock:
+                    for code in codes:
+                        subs.extend(self.index.pop((code, subtype), ()))
+                failed.append((subs, msg))
+
+        return failed
+
+    def _batches(self, keys):
+        bysubtype = collections.OrderedDict()
+        for code, subtype in keys:
+            bysubtype.setdefault(subtype, []).append(code)
+
+        for subtype, codes in bysubtype.items():
+            for i in range(0, len(codes), self.batchsize):
+                yield codes[i:i + self.batchsize], subtype
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import heapq
+import itertools
+import threading
+
+import backtrader as bt
+
+
+class _Book(object):
+    # Triggers of one code. Buy stops fire at or above their price and sit
+    # in a min-heap, sell stops fire at or below it and sit in a max-heap.
+    # Cancelled entries are left in the heaps and skipped when they surface
+    def __init__(self):
+        self.buys = []  # (stop, seq, oref)
+        self.sells = []  # (-stop, seq, oref)
+        self.trails = dict()  # oref -> order
+        self.nlive = 0
+
+
+class TriggerEngine(object):
+    '''Client-side triggers of the stop orders futu does not take: ``Stop``,
+    ``StopLimit``, ``StopTrail`` and ``StopTrailLimit``.
+
+    ``price`` is called from the futu callback threads with the lowest and
+    highest price of each push of a code. Fixed stops are kept in heaps per
+    code and side so that only the triggers the prices cross are looked at,
+    i.e. ``O(log n)`` per fired trigger. Trailing stops move with every new
+    extreme (``Order.trailadjust``) and are checked one by one, they are few
+    per code.
+
+    ``fire`` is called, outside of any lock, with each triggered order and
+    the price which triggered it.
+    '''
+    TRAILS = (bt.Order.StopTrail, bt.Order.StopTrailLimit)
+
+    def __init__(self, fire):
+        self._fire = fire
+        self._books = dict()  # code -> _Book
+        self._live = dict()  # oref -> (code, order)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __contains__(self, code):
+        return code in self._books
+
+    def add(self, order):
+        '''Arms ``order`` at its ``created.price``'''
+        code = order.data._dataname
+        with self._lock:
+            book = self._books.get(code)
+            if book is None:
+                self._books[code] = book = _Book()
+
+            self._live[order.ref] = (code, order)
+            book.nlive += 1
+            if order.exectype in self.TRAILS:
+                book.trails[order.ref] = order
+            elif order.isbuy():
+                entry = (order.created.price, next(self._seq), order.ref)
+                heapq.heappush(book.buys, entry)
+            else:
+                entry = (-order.created.price, next(self._seq), order.ref)
+                heapq.heappush(book.sells, entry)
+
+    def remove(self, oref):
+        '''Disarms the order of ``oref``. Returns ``False`` if it was not
+        armed, e.g. because it already fired'''
+        with self._lock:
+            entry = self._live.pop(oref, None)
+            if entry is None:
+                return False
+
+            code = entry[0]
+            book = self._books[code]
+            book.trails.pop(oref, None)
+            book.nlive -= 1
+            if not book.nlive:  # drops the disarmed entries too
+                del self._books[code]
+            return True
+
+    def price(self, code, lo, hi):
+        fired = []
+        with self._lock:
+            book = self._books.get(code)
+            if book is None:
+                return
+
+            live = self._live
+            buys, sells = book.buys, book.sells
+            while buys and buys[0][0] <= hi:
+                oref = heapq.heappop(buys)[2]
+                if oref in live:
+                    fired.append((live.pop(oref)[1], hi))
+
+            while sells and -sells[0][0] >= lo:
+                oref = heapq.heappop(sells)[2]
+                if oref in live:
+                    fired.append((live.pop(oref)[1], lo))
+
+            # The order of the prices of a push is not known: the stops are
+            # checked before being moved by the push
+            for oref, order in list(book.trails.items()):
+                if order.isbuy():
+                    hit, px = hi >= order.created.price, hi
+                    order.trailadjust(lo)
+                else:
+                    hit, px = lo <= order.created.price, lo
+                    order.trailadjust(hi)
+
+                if hit:
+                    del book.trails[oref]
+                    fired.append((live.pop(oref)[1], px))
+
+            book.nlive -= len(fired)
+            if not book.nlive:
+                del self._books[code]
+
+        for order, px in fired:
+            self._fire(order, px)
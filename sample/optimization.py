@@ -0,0 +1,50 @@
+from datetime import datetime
+import backtrader as bt
+import futu as ft
+
+from btfutu import ParamSweep, SharedHistory
+
+# Same strategy as backtesting.py, swept over its two periods on all cores
+
+
+class SmaCross(bt.Strategy):
+    params = dict(
+        pfast=10,  # period for the fast moving average
+        pslow=30   # period for the slow moving average
+    )
+
+    def __init__(self):
+        sma1 = bt.ind.SMA(period=self.p.pfast)
+        sma2 = bt.ind.SMA(period=self.p.pslow)
+        self.crossover = bt.ind.CrossOver(sma1, sma2)
+
+    def next(self):
+        if not self.position:
+            if self.crossover > 0:
+                self.buy()
+
+        elif self.crossover < 0:
+            self.close()
+
+
+def setup(cerebro):
+    # called in the workers, before each run
+    cerebro.broker.setcash(100000.0)
+    cerebro.addsizer(bt.sizers.FixedSize, stake=100)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
+
+
+if __name__ == '__main__':
+    # Downloaded once from OpenD, then memory-mapped by every worker
+    history = SharedHistory.load('sweep', ['HK.00700'], ft.KLType.K_DAY,
+                                 datetime(2016, 1, 1), datetime(2019, 12, 31),
+                                 histcache='histcache')
+
+    sweep = ParamSweep(history, setup=setup)
+    results = []
+    for params, result in sweep.run(SmaCross, pfast=range(5, 20),
+                                    pslow=range(20, 60, 5)):
+        print(params, result['value'])  # as the runs complete
+        results.append((result['value'], params))
+
+    print('best', max(results, key=lambda x: x[0]))
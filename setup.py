@@ -9,5 +9,5 @@ setup(
    author_email='damon.yuan.dev@gmail.com',
    license='MIT',
    packages=['btfutu'],
-   install_requires=['backtrader', 'futu-api'],
+   install_requires=['backtrader', 'futu-api', 'numpy'],
 )
\ No newline at end of file
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''Throughput benchmarks of the store against ``MockOpenD``, no OpenD
+needed:
+
+  - ``feed_events_per_sec``: ticker pushes through ``FutuFeed`` to ``next``
+  - ``orders_per_sec``: orders through ``FutuBroker`` from submission to
+    their completion pushed back
+  - ``startup_secs``: from ``run`` to the first ``next`` with the history of
+    N symbols to backfill and an account to open, the phases of the startup
+    of the store are printed
+
+The OpenD rate limits are lifted, the numbers are those of the store.
+
+    python test/benchmark.py --json results.json
+    python test/benchmark.py --baseline results.json --tolerance 0.2
+
+With ``--baseline`` the exit status is 1 if a result is worse than the one
+of the baseline by more than ``tolerance``.
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import backtrader as bt
+import futu as ft
+
+import btfutu
+from mockopend import MockOpenD
+
+_NOLIMITS = dict(
+    (name, (1000000, 1.0, 0.0)) for name in (
+        'place_order', 'modify_order', 'accinfo_query',
+        'position_list_query', 'order_list_query', 'deal_list_query'))
+
+
+def _store(**kwargs):
+    btfutu.FutuStore._singleton = None  # a fresh store per benchmark
+    kwargs.setdefault('histrate', (1000000, 1.0))
+    kwargs.setdefault('ratelimits', _NOLIMITS)
+    return btfutu.FutuStore(**kwargs)
+
+
+class _Counter(bt.Strategy):
+    params = (
+        ('target', 0),
+        ('timeout', 60.0),
+    )
+
+    def start(self):
+        self.t0 = time.time()
+        self.tfirst = self.tlast = None
+        self.events = 0
+
+    def next(self):
+        now = time.time()
+        if self.tfirst is None:
+            self.tfirst = now
+        self.tlast = now
+        self.events = sum(len(d) for d in self.datas)
+        if self.events >= self.p.target or now - self.t0 > self.p.timeout:
+            self.env.runstop()
+
+
+def bench_feed(nsymbols, npushes):
+    with MockOpenD(npushes=npushes):
+        _store()
+        cerebro = bt.Cerebro(stdstats=False)
+        for i in range(nsymbols):
+            cerebro.adddata(btfutu.FutuFeed(
+                dataname='HK.%05d' % i, subtype=ft.SubType.TICKER,
+                backfill_start=False,
+                backpressure=btfutu.RingBuffer.Block))
+
+        cerebro.addstrategy(_Counter, target=nsymbols * npushes)
+        t0 = time.time()
+        strat = cerebro.run()[0]
+        elapsed = time.time() - t0
+
+    return dict(feed_events=strat.events,
+                feed_events_per_sec=strat.events / elapsed)
+
+
+class _Orders(_Counter):
+    params = (
+        ('norders', 0),
+    )
+
+    def start(self):
+        super(_Orders, self).start()
+        self.ts = None
+        self.completed = 0
+
+    def next(self):
+        if self.ts is None:
+            self.ts = time.time()
+            for i in range(self.p.norders):
+                self.buy(size=100)
+            self.tsent = time.time()
+
+        if self.completed >= self.p.norders or \
+           time.time() - self.t0 > self.p.timeout:
+            self.env.runstop()
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.completed += 1
+            self.tdone = time.time()
+
+
+def bench_orders(norders):
+    with MockOpenD(rate=1000.0):
+        _store(orderqsize=norders)
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(btfutu.FutuFeed(
+            dataname='HK.00700', subtype=ft.SubType.TICKER,
+            backfill_start=False))
+        cerebro.setbroker(btfutu.FutuBroker())
+        cerebro.addstrategy(_Orders, norders=norders)
+        strat = cerebro.run()[0]
+
+    return dict(orders=strat.completed,
+                orders_submit_secs=strat.tsent - strat.ts,
+                orders_per_sec=strat.completed / (strat.tdone - strat.ts))
+
+
+def bench_startup(nsymbols, days, connect=0.1, latency=0.05):
+    # OpenD takes connect seconds to open a context, latency to answer a
+    # trade call
+    with MockOpenD(rate=10.0, connect=connect, latency=latency):
+        store = _store(trd_env=ft.TrdEnv.REAL)
+        cerebro = bt.Cerebro(stdstats=False)
+        fromdate = datetime.now() - timedelta(days=days)
+        for i in range(nsymbols):
+            cerebro.adddata(btfutu.FutuFeed(
+                dataname='HK.%05d' % i, fromdate=fromdate))
+
+        cerebro.setbroker(btfutu.FutuBroker())
+        cerebro.addstrategy(_Counter, target=0)
+        t0 = time.time()
+        strat = cerebro.run()[0]
+        print(store.startup_report())
+
+    return dict(startup_symbols=nsymbols, startup_secs=strat.tfirst - t0)
+
+
+def compare(results, baseline, tolerance):
+    '''Returns the names of the results worse than the baseline'''
+    worse = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if name.endswith('_per_sec'):
+            if value < base * (1.0 - tolerance):
+                worse.append(name)
+        elif name.endswith('_secs'):
+            if value > base * (1.0 + tolerance):
+                worse.append(name)
+    return worse
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks btfutu against a mock OpenD')
+    parser.add_argument('--symbols', type=int, default=10,
+                        help='symbols of the feed benchmark')
+    parser.add_argument('--pushes', type=int, default=2000,
+                        help='pushes per symbol of the feed benchmark')
+    parser.add_argument('--orders', type=int, default=1000,
+                        help='orders of the broker benchmark')
+    parser.add_argument('--startup-symbols', type=int, default=100,
+                        help='symbols of the startup benchmark')
+    parser.add_argument('--startup-days', type=int, default=5,
+                        help='days of history backfilled per symbol')
+    parser.add_argument('--json', help='file to write the results to')
+    parser.add_argument('--baseline', help='results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative regression allowed')
+    args = parser.parse_args(args)
+
+    results = dict()
+    results.update(bench_feed(args.symbols, args.pushes))
+    results.update(bench_orders(args.orders))
+    results.update(bench_startup(args.startup_symbols, args.startup_days))
+
+    for name in sorted(results):
+        print('%-24s %14.3f' % (name, results[name]))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = compare(results, json.load(f), args.tolerance)
+        if worse:
+            print('regressions: %s' % ', '.join(worse))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
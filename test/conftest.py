@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''Fixtures of the behaviour tests, run against ``MockOpenD``:
+
+    python -m pytest -q test
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [_HERE, os.path.join(_HERE, '..')]
+
+import backtrader as bt
+import pytest
+
+import btfutu
+from benchmark import _NOLIMITS
+from mockopend import MockOpenD
+
+
+_ENDED = ('Completed', 'Canceled', 'Expired', 'Margin', 'Rejected')
+
+
+def _reset():
+    btfutu.FutuStore._singleton = None
+
+
+@pytest.fixture
+def opend():
+    '''A ``MockOpenD`` installed for the test, with a fresh store'''
+    _reset()
+    with MockOpenD(rate=1000.0) as mock:
+        yield mock
+    _reset()
+
+
+@pytest.fixture
+def fresh():
+    '''Builds the store of the test, a fresh one'''
+    def store(**kwargs):
+        _reset()
+        kwargs.setdefault('histrate', (1000000, 1.0))
+        kwargs.setdefault('ratelimits', _NOLIMITS)
+        return btfutu.FutuStore(**kwargs)
+
+    yield store
+    _reset()
+
+
+class Recorder(bt.Strategy):
+    '''Runs ``script(strategy)`` on each ``next`` and records the order
+    statuses and the store notifications. Stops once ``done(strategy)`` or
+    after ``maxbars`` bars'''
+    params = (
+        ('script', None),
+        ('done', None),
+        ('maxbars', 2000),
+    )
+
+    def start(self):
+        self.orders = []  # (ref, status name), in notification order
+        self.store = []  # store messages
+        self.trades = []
+
+    def notify_order(self, order):
+        self.orders.append((order.ref, order.getstatusname()))
+
+    def notify_trade(self, trade):
+        self.trades.append(trade)
+
+    def notify_store(self, msg, *args, **kwargs):
+        self.store.append(msg)
+
+    def next(self):
+        if self.p.script is not None:
+            self.p.script(self)
+        if (self.p.done is not None and self.p.done(self)) or \
+           len(self) >= self.p.maxbars:
+            self.env.runstop()
+
+    def status(self, order):
+        '''Last status notified of ``order``'''
+        names = [name for ref, name in self.orders if ref == order.ref]
+        return names[-1] if names else None
+
+    def settled(self, *orders):
+        '''Whether the end of each of ``orders`` was notified'''
+        return all(self.status(order) in _ENDED for order in orders)
@@ -0,0 +1,559 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''Stand-in for OpenD which patches the futu context classes.
+
+    with MockOpenD(rate=1000, npushes=10000) as opend:
+        cerebro.run()
+
+Quote contexts serve synthetic history K-lines and play synthetic quote,
+ticker, K-line and order book pushes through the handlers set on them, as
+protobufs, i.e. through the same decode path as OpenD pushes. Trade
+contexts serve account queries, acknowledge orders after ``latency``
+seconds and push their fills.
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import itertools
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import futu as ft
+import pandas as pd
+from futu.common.pb import (Qot_UpdateBasicQot_pb2, Qot_UpdateKL_pb2,
+                            Qot_UpdateOrderBook_pb2, Qot_UpdateTicker_pb2,
+                            Trd_UpdateOrder_pb2, Trd_UpdateOrderFill_pb2)
+from futu.common.utils import split_stock_str
+
+_TRADECTXS = ('OpenSecTradeContext', 'OpenFutureTradeContext')
+
+_TRDSECMARKETS = {'HK': 1, 'US': 2, 'SH': 31, 'SZ': 32}
+
+_DTFMT = '%Y-%m-%d %H:%M:%S'
+
+
+def _number(enum, value):
+    return enum.to_number(value)[1]
+
+
+class MockOpenD(object):
+    '''Patches ``ft.OpenQuoteContext`` and the trade contexts with the mock
+    ones while installed.
+
+    Params:
+
+      - ``rate``: pushes per second of each subscription, ``None`` for as
+        fast as possible
+      - ``npushes``: pushes per subscription before ``done`` is set on the
+        quote context, ``None`` for no end
+      - ``latency``: seconds each trade call takes
+      - ``connect``: seconds each context takes to open
+      - ``fill``: fill the orders at once at their price, or the last price
+        for market orders, else leave them submitted
+      - ``price``: first price of every code
+      - ``cash``: cash of the account
+      - ``holdings``: code -> (qty, average cost) held at start
+      - ``lot``: board lot of the stocks ``HK.00000`` to ``HK.09999``
+      - ``start``: exchange time of the first push
+    '''
+
+    def __init__(self, rate=None, npushes=None, latency=0.0, connect=0.0,
+                 fill=True, price=100.0, cash=1e6, holdings=None, lot=100,
+                 start=None):
+        self.rate = rate
+        self.npushes = npushes
+        self.latency = latency
+        self.connect = connect
+        self.fill = fill
+        self.price = price
+        self.cash = cash
+        self.holdings = holdings or dict()
+        self.lot = lot
+        self.start = start or datetime.now().replace(
+            hour=9, minute=30, second=0, microsecond=0)
+
+        self.prices = dict()  # code -> last pushed price
+        self.orders = dict()  # order_id -> dict, kept across trade contexts
+        self.ids = itertools.count(1000)
+        self.quote_ctxs = []
+        self.trade_ctxs = []
+        self._saved = None
+
+    def install(self):
+        self._saved = dict((name, getattr(ft, name, None))
+                           for name in ('OpenQuoteContext',) + _TRADECTXS)
+
+        ft.OpenQuoteContext = self._quote_ctx
+        for name in _TRADECTXS:
+            setattr(ft, name, self._trade_ctx)
+        return self
+
+    def uninstall(self):
+        for name, cls in self._saved.items():
+            if cls is None:
+                delattr(ft, name)
+            else:
+                setattr(ft, name, cls)
+        for ctx in self.quote_ctxs:
+            ctx.close()
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+    def _quote_ctx(self, **kwargs):
+        time.sleep(self.connect)
+        ctx = MockQuoteContext(self)
+        self.quote_ctxs.append(ctx)
+        return ctx
+
+    def _trade_ctx(self, **kwargs):
+        time.sleep(self.connect)
+        ctx = MockTradeContext(self)
+        self.trade_ctxs.append(ctx)
+        return ctx
+
+    def lastprice(self, code):
+        return self.prices.get(code, self.price)
+
+
+class MockQuoteContext(object):
+    _PROTOS = (
+        (ft.SubType.TICKER, ft.TickerHandlerBase),
+        (ft.SubType.QUOTE, ft.StockQuoteHandlerBase),
+        (ft.SubType.ORDER_BOOK, ft.OrderBookHandlerBase),
+        ('KLINE', ft.CurKlineHandlerBase),
+    )
+
+    _KTYPES = {
+        ft.SubType.K_1M: 1, ft.SubType.K_5M: 5, ft.SubType.K_15M: 15,
+        ft.SubType.K_30M: 30, ft.SubType.K_60M: 60,
+    }
+
+    def __init__(self, opend):
+        self.opend = opend
+        self.done = threading.Event()
+        self.npushed = 0
+        self._handlers = dict()
+        self._subs = []  # [code, subtype, pushes made]
+        self._snaps = dict()  # code -> [last price, day volume]
+        self._rnd = random.Random(0)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = False
+
+    def set_handler(self, handler):
+        for key, cls in self._PROTOS:
+            if isinstance(handler, cls):
+                self._handlers[key] = handler
+                return ft.RET_OK
+
+        return ft.RET_ERROR
+
+    def subscribe(self, code_list, subtype_list, **kwargs):
+        with self._lock:
+            for code, subtype in itertools.product(code_list, subtype_list):
+                self._subs.append([code, subtype, 0])
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._play)
+            self._thread.daemon = True
+            self._thread.start()
+
+        return ft.RET_OK, None
+
+    def unsubscribe(self, code_list, subtype_list, **kwargs):
+        with self._lock:
+            self._subs = [s for s in self._subs
+                          if s[0] not in code_list or
+                          s[1] not in subtype_list]
+        return ft.RET_OK, None
+
+    def close(self):
+        self._stop = True
+
+    def request_history_kline(self, code, start=None, end=None,
+                              ktype=ft.KLType.K_1M, autype=None, fields=None,
+                              max_count=1000, page_req_key=None, **kwargs):
+        '''One bar per minute from 09:31 to 16:00 on weekdays'''
+        d0 = datetime.strptime(start[:10], '%Y-%m-%d')
+        d1 = datetime.strptime(end[:10], '%Y-%m-%d')
+        minutes = pd.timedelta_range(start='9:31:00', end='16:00:00',
+                                     freq='min')
+        days = pd.bdate_range(d0, d1)
+        stamps = (days.values[:, None] + minutes.values[None, :]).ravel()
+
+        offset = page_req_key or 0
+        stamps = stamps[offset:offset + max_count]
+        n = len(stamps)
+        rnd = random.Random(code)
+        close = [self.opend.price + rnd.uniform(-1.0, 1.0) for _ in range(n)]
+        df = pd.DataFrame({
+            'code': code,
+            'time_key': pd.DatetimeIndex(stamps).strftime(_DTFMT),
+            'open': close, 'high': [c + 0.5 for c in close],
+            'low': [c - 0.5 for c in close], 'close': close,
+            'volume': 1000,
+        })
+
+        total = len(days) * len(minutes)
+        nxt = offset + max_count if offset + max_count < total else None
+        return ft.RET_OK, df, nxt
+
+    def get_stock_basicinfo(self, market, stock_type=ft.SecurityType.STOCK,
+                            code_list=None):
+        time.sleep(self.opend.latency)
+        codes = []
+        if market == ft.Market.HK and stock_type == ft.SecurityType.STOCK:
+            codes = ['HK.%05d' % i for i in range(10000)]
+        return ft.RET_OK, pd.DataFrame({
+            'code': codes, 'name': ['Stock %s' % c for c in codes],
+            'lot_size': self.opend.lot, 'stock_type': stock_type})
+
+    def request_trading_days(self, market=None, start=None, end=None,
+                             code=None):
+        '''Every day, for the orders at market to be sent on any day'''
+        time.sleep(self.opend.latency)
+        days = pd.date_range(start, end).strftime('%Y-%m-%d')
+        return ft.RET_OK, [dict(time=d, trade_date_type='WHOLE')
+                           for d in days]
+
+    def get_market_snapshot(self, code_list):
+        '''About a fifth of the codes trade between two snapshots'''
+        if len(code_list) > 400:
+            return ft.RET_ERROR, 'too many codes'
+
+        now = datetime.now().strftime(_DTFMT)
+        rnd = self._rnd
+        rows = []
+        for code in code_list:
+            snap = self._snaps.get(code)
+            if snap is None:
+                snap = self._snaps[code] = [self.opend.lastprice(code),
+                                            100 * rnd.randint(1, 100)]
+            if rnd.random() < 0.2:
+                snap[0] = round(snap[0] + rnd.choice((-0.1, 0.1)), 2)
+                snap[1] += 100 * rnd.randint(1, 10)
+            rows.append((code, now if snap[1] else '', snap[0], snap[1]))
+
+        df = pd.DataFrame(rows, columns=['code', 'update_time', 'last_price',
+                                         'volume'])
+        df['open_price'] = df['high_price'] = df['low_price'] = \
+            df['last_price']
+        return ft.RET_OK, df
+
+    def _play(self):
+        opend = self.opend
+        rate = opend.rate
+        rnd = random.Random(0)
+        t0 = time.time()
+        i = 0
+        while not self._stop:
+            with self._lock:
+                subs = [s for s in self._subs
+                        if opend.npushes is None or s[2] < opend.npushes]
+
+            if not subs:
+                if self._subs and not self._stop:
+                    self.done.set()
+                time.sleep(0.01)
+                continue
+
+            dt = opend.start + timedelta(seconds=i / (rate or 1000.0))
+            for sub in subs:
+                code, subtype = sub[0], sub[1]
+                price = round(opend.lastprice(code) +
+                              rnd.choice((-0.1, 0.0, 0.1)), 2)
+                opend.prices[code] = price
+                self._push(code, subtype, dt, price)
+                sub[2] += 1
+                self.npushed += 1
+
+            i += 1
+            if rate:
+                wait = t0 + i / rate - time.time()
+                if wait > 0.0:
+                    time.sleep(wait)
+
+    def _push(self, code, subtype, dt, price):
+        market, stock = split_stock_str(code)[1]
+        if subtype in self._KTYPES:
+            handler = self._handlers.get('KLINE')
+            rsp = Qot_UpdateKL_pb2.Response()
+            rsp.s2c.rehabType = 1
+            rsp.s2c.klType = ft.KLType.to_number(subtype)[1]
+            kl = rsp.s2c.klList.add()
+            kl.isBlank = False
+            mins = self._KTYPES[subtype]
+            tk = dt.replace(second=0, microsecond=0) + timedelta(
+                minutes=mins - dt.minute % mins)
+            kl.time = tk.strftime(_DTFMT)
+            kl.openPrice = kl.closePrice = price
+            kl.highPrice = price + 0.1
+            kl.lowPrice = price - 0.1
+            kl.volume = 100
+        elif subtype == ft.SubType.TICKER:
+            handler = self._handlers.get(subtype)
+            rsp = Qot_UpdateTicker_pb2.Response()
+            x = rsp.s2c.tickerList.add()
+            x.time = dt.strftime(_DTFMT + '.%f')[:-3]
+            x.sequence = self.npushed
+            x.dir = 1
+            x.price = price
+            x.volume = 100
+            x.turnover = price * 100
+        elif subtype == ft.SubType.QUOTE:
+            handler = self._handlers.get(subtype)
+            rsp = Qot_UpdateBasicQot_pb2.Response()
+            q = rsp.s2c.basicQotList.add()
+            q.security.market = market
+            q.security.code = stock
+            q.isSuspended = False
+            q.listTime = '2004-06-16'
+            q.priceSpread = 0.1
+            q.updateTime = dt.strftime(_DTFMT)
+            q.curPrice = q.openPrice = q.lastClosePrice = price
+            q.highPrice = price + 0.1
+            q.lowPrice = price - 0.1
+            q.volume = 100 * self.npushed
+            q.turnover = q.turnoverRate = q.amplitude = 0.0
+        elif subtype == ft.SubType.ORDER_BOOK:
+            handler = self._handlers.get(subtype)
+            rsp = Qot_UpdateOrderBook_pb2.Response()
+            rsp.s2c.svrRecvTimeBid = dt.strftime(_DTFMT + '.%f')[:-3]
+            for side, sign in ((rsp.s2c.orderBookBidList, -1),
+                               (rsp.s2c.orderBookAskList, 1)):
+                for level in range(10):
+                    x = side.add()
+                    x.price = round(price + sign * 0.1 * (level + 1), 2)
+                    x.volume = 1000 * (level + 1)
+                    x.orederCount = level + 1
+        else:
+            return
+
+        if handler is None:
+            return
+
+        rsp.retType = ft.RET_OK
+        if subtype != ft.SubType.QUOTE:
+            rsp.s2c.security.market = market
+            rsp.s2c.security.code = stock
+        handler.on_recv_rsp(rsp)
+
+
+class MockTradeContext(object):
+    '''Orders are acknowledged by ``place_order`` and their status and fills
+    pushed in a thread of their own, like OpenD does'''
+
+    def __init__(self, opend):
+        self.opend = opend
+        self.orders = opend.orders
+        self.positions = dict()  # code -> qty
+        self.costs = dict()  # code -> average cost
+        for code, (qty, cost) in opend.holdings.items():
+            self.positions[code] = qty
+            self.costs[code] = cost
+        self.cash = opend.cash
+        self.calls = []  # (name, time)
+        self._handlers = []
+        self._pushes = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._t_push)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def set_handler(self, handler):
+        self._handlers.append(handler)
+        return ft.RET_OK
+
+    def close(self):
+        with self._cond:
+            self._pushes.append(None)
+            self._cond.notify()
+
+    def _call(self, name):
+        self.calls.append((name, time.time()))
+        if self.opend.latency:
+            time.sleep(self.opend.latency)
+
+    def unlock_trade(self, **kwargs):
+        self._call('unlock_trade')
+        return ft.RET_OK, None
+
+    def accinfo_query(self, **kwargs):
+        self._call('accinfo_query')
+        mktval = sum(qty * self.opend.lastprice(code)
+                     for code, qty in self.positions.items())
+        return ft.RET_OK, pd.DataFrame([dict(
+            cash=self.cash, total_assets=self.cash + mktval,
+            market_val=mktval, power=self.cash)])
+
+    def position_list_query(self, **kwargs):
+        self._call('position_list_query')
+        rows = [dict(code=code, qty=qty,
+                     average_cost=self.costs.get(code, 0.0),
+                     nominal_price=self.opend.lastprice(code))
+                for code, qty in self.positions.items()]
+        return ft.RET_OK, pd.DataFrame(
+            rows, columns=['code', 'qty', 'average_cost', 'nominal_price'])
+
+    _ORDERCOLS = ['order_id', 'code', 'trd_side', 'order_type',
+                  'order_status', 'qty', 'price', 'dealt_qty',
+                  'dealt_avg_price', 'remark', 'create_time', 'updated_time']
+
+    def order_list_query(self, **kwargs):
+        self._call('order_list_query')
+        return ft.RET_OK, pd.DataFrame(list(self.orders.values()),
+                                       columns=self._ORDERCOLS)
+
+    def place_order(self, price, qty, code, trd_side, order_type=None,
+                    trd_env=ft.TrdEnv.REAL, acc_id=0, remark=None, **kwargs):
+        self._call('place_order')
+        if qty <= 0:
+            return ft.RET_ERROR, 'qty must be positive'
+
+        now = datetime.now().strftime(_DTFMT)
+        oid = str(next(self.opend.ids))
+        order = dict(order_id=oid, code=code, trd_side=trd_side,
+                     order_type=order_type or ft.OrderType.NORMAL,
+                     order_status=ft.OrderStatus.SUBMITTED, qty=qty,
+                     price=price, dealt_qty=0.0, dealt_avg_price=0.0,
+                     remark=remark or '', create_time=now, updated_time=now,
+                     trd_env=trd_env, acc_id=acc_id)
+        self.orders[oid] = order
+
+        fills = []
+        if self.opend.fill:
+            fill = price if order['order_type'] == ft.OrderType.NORMAL \
+                else self.opend.lastprice(code)
+            fills.append((oid, qty, fill))
+
+        with self._cond:
+            self._pushes.append((oid, ft.OrderStatus.SUBMITTED, None))
+            for fill in fills:
+                self._pushes.append((oid, ft.OrderStatus.FILLED_ALL, fill))
+            self._cond.notify()
+
+        return ft.RET_OK, pd.DataFrame([order], columns=self._ORDERCOLS)
+
+    def modify_order(self, modify_order_op, order_id, qty, price, **kwargs):
+        self._call('modify_order')
+        order = self.orders.get(order_id)
+        if order is None:
+            return ft.RET_ERROR, 'unknown order %s' % order_id
+
+        if modify_order_op == ft.ModifyOrderOp.CANCEL:
+            with self._cond:
+                self._pushes.append(
+                    (order_id, ft.OrderStatus.CANCELLED_ALL, None))
+                self._cond.notify()
+
+        return ft.RET_OK, pd.DataFrame([dict(order_id=order_id)])
+
+    def _t_push(self):
+        while True:
+            with self._cond:
+                while not self._pushes:
+                    self._cond.wait()
+                msg = self._pushes.popleft()
+
+            if msg is None:
+                break
+
+            oid, status, fill = msg
+            order = self.orders[oid]
+            if order['order_status'] in (ft.OrderStatus.FILLED_ALL,
+                                         ft.OrderStatus.CANCELLED_ALL):
+                continue  # e.g. cancel of a filled order
+
+            order['order_status'] = status
+            if fill is not None:
+                _, qty, price = fill
+                sign = 1 if order['trd_side'] == ft.TrdSide.BUY else -1
+                order['dealt_qty'] = qty
+                order['dealt_avg_price'] = price
+                code = order['code']
+                held = self.positions.get(code, 0)
+                self.positions[code] = held + sign * qty
+                if sign > 0 and held >= 0:
+                    cost = self.costs.get(code, 0.0)
+                    self.costs[code] = (cost * held + qty * price) / \
+                        (held + qty)
+                elif not self.positions[code]:
+                    self.costs[code] = 0.0
+                self.cash -= sign * qty * price
+                self._push_deal(order, qty, price)
+
+            self._push_order(order)
+
+    def _header(self, rsp, order):
+        rsp.retType = ft.RET_OK
+        rsp.s2c.header.trdEnv = _number(ft.TrdEnv, order['trd_env'])
+        rsp.s2c.header.accID = order['acc_id']
+        rsp.s2c.header.trdMarket = _TRDSECMARKETS[order['code'][:2]]
+
+    def _push_order(self, order):
+        rsp = Trd_UpdateOrder_pb2.Response()
+        self._header(rsp, order)
+        o = rsp.s2c.order
+        o.trdSide = _number(ft.TrdSide, order['trd_side'])
+        o.orderType = _number(ft.OrderType, order['order_type'])
+        o.orderStatus = _number(ft.OrderStatus, order['order_status'])
+        o.orderID = int(order['order_id'])
+        o.orderIDEx = order['order_id']
+        o.code = order['code'].split('.', 1)[1]
+        o.secMarket = _TRDSECMARKETS[order['code'][:2]]
+        o.name = o.code
+        o.qty = order['qty']
+        o.price = order['price']
+        o.createTime = order['create_time']
+        o.updateTime = datetime.now().strftime(_DTFMT)
+        o.fillQty = order['dealt_qty']
+        o.fillAvgPrice = order['dealt_avg_price']
+        o.remark = order['remark']
+        for handler in self._handlers:
+            if isinstance(handler, ft.TradeOrderHandlerBase):
+                handler.on_recv_rsp(rsp)
+
+    def _push_deal(self, order, qty, price):
+        rsp = Trd_UpdateOrderFill_pb2.Response()
+        self._header(rsp, order)
+        f = rsp.s2c.orderFill
+        f.trdSide = _number(ft.TrdSide, order['trd_side'])
+        f.fillID = next(self.opend.ids)
+        f.fillIDEx = str(f.fillID)
+        f.orderID = int(order['order_id'])
+        f.orderIDEx = order['order_id']
+        f.code = order['code'].split('.', 1)[1]
+        f.secMarket = _TRDSECMARKETS[order['code'][:2]]
+        f.name = f.code
+        f.qty = qty
+        f.price = price
+        f.createTime = datetime.now().strftime(_DTFMT)
+        f.status = _number(ft.DealStatus, ft.DealStatus.OK)
+        for handler in self._handlers:
+            if isinstance(handler, ft.TradeDealHandlerBase):
+                handler.on_recv_rsp(rsp)
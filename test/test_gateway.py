@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''``FutuGateway``, its shared memory rings and the datas reading them'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import itertools
+import os
+import threading
+import time
+
+import backtrader as bt
+import futu as ft
+
+import btfutu
+from btfutu.gateway import (_BARWIDTH, FutuGateway, ShmRing, ShmRingReader,
+                            ring_name)
+from conftest import Recorder
+
+_names = itertools.count()
+
+
+def _name():
+    # rings outlive a crashed run, not reused across runs
+    return 'btt%d_%d' % (os.getpid(), next(_names))
+
+
+def _row(i):
+    return (float(i),) * _BARWIDTH
+
+
+def test_ring_read_in_order():
+    name = _name()
+    ring = ShmRing(name, 4, _BARWIDTH)
+    reader = ShmRingReader(name)
+    try:
+        for i in range(3):
+            ring.put(_row(i))
+        assert [reader.get()[0] for i in range(3)] == [0.0, 1.0, 2.0]
+        assert reader.get() is None
+        assert reader.dropped == 0
+    finally:
+        reader.close()
+        ring.close()
+
+
+def test_ring_lapped_reader_skips():
+    # the slot of the oldest row of a full ring is the one written next,
+    # the reader skips it too
+    name = _name()
+    ring = ShmRing(name, 4, _BARWIDTH)
+    reader = ShmRingReader(name)
+    try:
+        for i in range(4):
+            ring.put(_row(i))
+        assert [reader.get()[0] for i in range(3)] == [1.0, 2.0, 3.0]
+        assert reader.dropped == 1
+    finally:
+        reader.close()
+        ring.close()
+
+
+def test_gateway_publishes(opend):
+    gateway = FutuGateway(['HK.00700'], [ft.SubType.TICKER], name=_name(),
+                          size=1024)
+    gateway.start()
+    try:
+        reader = ShmRingReader(ring_name(gateway.name, 'HK.00700',
+                                         ft.SubType.TICKER))
+        row = reader.get(timeout=5.0)
+        reader.close()
+    finally:
+        gateway.close()
+
+    assert row is not None
+    assert 90.0 < row[4] < 110.0  # the close, around the price of the mock
+
+
+def test_gateway_data_arms_stop_orders(opend, fresh):
+    # no push in the process of the data: the store is armed on its rows,
+    # with the latency stamps on too
+    name = _name()
+    ring = ShmRing(ring_name(name, 'HK.00700', ft.SubType.TICKER), 64,
+                   _BARWIDTH)
+
+    def writer():
+        t0 = bt.date2num(opend.start)
+        for i in range(60):
+            time.sleep(0.01)
+            price = 100.0 + i
+            ring.put((t0 + i / 86400.0, price, price, price, price, 100.0))
+        ring.close()  # the data ends
+
+    def script(strat):
+        if len(strat) == 1:
+            strat.sent = [strat.buy(size=100, exectype=bt.Order.Stop,
+                                    price=105.0)]
+
+    fresh(latency=True)
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(btfutu.FutuFeed(dataname='HK.00700',
+                                    subtype=ft.SubType.TICKER,
+                                    backfill_start=False, gateway=name))
+    cerebro.setbroker(btfutu.FutuBroker())
+    cerebro.addstrategy(Recorder, script=script, maxbars=60,
+                        done=lambda s: s.settled(*s.sent))
+    t = threading.Thread(target=writer)
+    t.daemon = True
+    t.start()
+    strat = cerebro.run()[0]
+    t.join()
+
+    order, = strat.sent
+    assert strat.status(order) == 'Completed'
+    assert len(opend.orders) == 1
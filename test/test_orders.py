@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''Order path of ``FutuBroker``/``FutuStore`` against ``MockOpenD``'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+import backtrader as bt
+import futu as ft
+import pandas as pd
+
+import btfutu
+from btfutu.positions import PositionBook
+from conftest import Recorder
+
+
+def _run(fresh, script, done, code='HK.00700', **kwargs):
+    fresh(**kwargs)
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(btfutu.FutuFeed(dataname=code,
+                                    subtype=ft.SubType.TICKER,
+                                    backfill_start=False))
+    cerebro.setbroker(btfutu.FutuBroker())
+    cerebro.addstrategy(Recorder, script=script, done=done)
+    return cerebro.run()[0]
+
+
+def _once(f):
+    # script of the first bar only
+    def script(strat):
+        if len(strat) == 1:
+            strat.sent = f(strat)
+    return script
+
+
+def _settled(strat):
+    sent = getattr(strat, 'sent', None)
+    return sent is not None and strat.settled(*sent)
+
+
+def test_market_order_fills(opend, fresh):
+    strat = _run(fresh, _once(lambda s: [s.buy(size=200)]), _settled)
+    order, = strat.sent
+    assert strat.status(order) == 'Completed'
+    assert strat.broker.getposition(strat.data).size == 200
+    assert len(opend.orders) == 1
+
+
+def test_limit_order_cancelled(opend, fresh):
+    opend.fill = False
+
+    def script(strat):
+        if len(strat) == 1:
+            strat.sent = [strat.buy(size=100, exectype=bt.Order.Limit,
+                                    price=90.0)]
+        elif strat.status(strat.sent[0]) == 'Accepted':
+            strat.cancel(strat.sent[0])
+
+    strat = _run(fresh, script, _settled)
+    order, = strat.sent
+    assert strat.status(order) == 'Canceled'
+    assert strat.broker.getposition(strat.data).size == 0
+
+
+def test_odd_lot_rejected(opend, fresh):
+    strat = _run(fresh, _once(lambda s: [s.buy(size=150)]), _settled)
+    order, = strat.sent
+    assert strat.status(order) == 'Rejected'
+    assert 'size not a multiple of lot 100' in strat.store
+    assert not opend.orders  # never sent
+
+
+def test_stop_triggered_by_pushes(opend, fresh):
+    # futu has no stop orders, the store arms it on the ticker pushes and
+    # sends a market order once the price is at the stop
+    strat = _run(fresh, _once(lambda s: [
+        s.buy(size=100, exectype=bt.Order.Stop, price=50.0)]), _settled)
+    order, = strat.sent
+    assert strat.status(order) == 'Completed'
+    assert len(opend.orders) == 1
+
+
+def test_oco_cancels_the_others(opend, fresh):
+    opend.fill = False
+
+    def orders(strat):
+        o1 = strat.buy(size=100, exectype=bt.Order.Limit, price=90.0)
+        o2 = strat.buy(size=100, exectype=bt.Order.Limit, price=80.0,
+                       oco=o1)
+        return [o1, o2]
+
+    def script(strat):
+        _once(orders)(strat)
+        o1 = strat.sent[0]
+        if len(strat) > 1 and strat.status(o1) == 'Accepted':
+            strat.cancel(o1)
+
+    strat = _run(fresh, script, _settled)
+    assert [strat.status(o) for o in strat.sent] == ['Canceled'] * 2
+
+
+def test_orders_in_both_directions_complete(opend, fresh):
+    strat = _run(fresh, _once(lambda s: [
+        (s.buy if i % 2 == 0 else s.sell)(size=100) for i in range(20)]),
+        _settled, orderqsize=20)
+    assert all(strat.status(o) == 'Completed' for o in strat.sent)
+    assert strat.broker.getposition(strat.data).size == 0
+    assert strat.trades and strat.trades[-1].isclosed
+
+
+def _orderpush(oid):
+    return pd.DataFrame(dict(order_id=[oid],
+                             order_status=[ft.OrderStatus.FILLED_ALL],
+                             dealt_qty=[100.0], dealt_avg_price=[100.0]))
+
+
+def test_unknown_order_pushes_dropped(opend, fresh):
+    store = fresh()
+    store._order_updates(_orderpush('999'))  # none in flight: not ours
+    assert not store._transpend
+
+    store._inflight += 1  # maybe the one being placed
+    store._order_updates(_orderpush('998'))
+    assert list(store._transpend) == ['998']
+
+    store._inflight -= 1
+    store._landed()  # none in flight and still unknown: not ours
+    assert not store._transpend
+
+
+def test_account_waited_by_every_caller(opend, fresh):
+    opend.connect = 0.2  # the account opens while they wait
+    store = fresh()
+    store.start(broker=btfutu.FutuBroker())
+    seen = []
+
+    def reader():
+        store._wait_account()
+        seen.append(store.account is not None)
+
+    threads = [threading.Thread(target=reader) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert seen == [True, True]
+    assert store._tradestart is None
+    store.stop()
+
+
+def test_positions_added_up_across_accounts():
+    book = PositionBook()
+    book.seed(pd.DataFrame(dict(code=['HK.00700'], qty=[100.0],
+                                average_cost=[10.0])))
+    book.seed(pd.DataFrame(dict(code=['HK.00700'], qty=[300.0],
+                                average_cost=[20.0])))
+    pos = book['HK.00700']
+    assert pos.size == 400
+    assert pos.price == 17.5
+
+
+def test_setlot_kept_over_static_lots():
+    book = PositionBook()
+    book.setlot('HK.00005', 400)
+    book.uselots({'HK.00005': 100, 'HK.00700': 100})
+    assert book.lot('HK.00005') == 400
+    assert book.lot('HK.00700') == 100
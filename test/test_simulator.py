@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2020 Damon Yuan <damon.yuan.dev@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''``FutuBroker(simulate=True)`` against the ``BackBroker`` of backtrader,
+on synthetic bars'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import itertools
+import random
+
+import backtrader as bt
+import numpy as np
+
+import btfutu
+from btfutu.spreads import HK_STOCKS
+from conftest import Recorder
+
+_CODES = ('HK.00700', 'HK.00005')
+
+
+def _bars(seed, n=300):
+    rng = np.random.RandomState(seed)
+    dts = bt.date2num(np.datetime64('2020-06-01T09:30').astype(object)) + \
+        np.arange(n) / 1440.0
+    close = np.round(50.0 + np.cumsum(rng.choice((-0.1, 0.0, 0.1), n)), 2)
+    opn = np.round(np.r_[close[0], close[:-1]], 2)
+    high = np.maximum(opn, close) + 0.05
+    low = np.minimum(opn, close) - 0.05
+    return np.column_stack([dts, opn, high, low, close, np.full(n, 1e4)])
+
+
+def _run(fresh, script, broker=None, cash=1e6, lots=None):
+    bt.OrderBase.refbasis = itertools.count(1)  # same refs on each run
+    cerebro = bt.Cerebro(stdstats=False)
+    for i, code in enumerate(_CODES):
+        cerebro.adddata(btfutu.ArrayFeed(dataname=code, bars=_bars(i),
+                                         timeframe=bt.TimeFrame.Minutes))
+    if broker is None:
+        fresh()
+        broker = btfutu.FutuBroker(simulate=True, cash=cash)
+        for code, lot in (lots or dict()).items():
+            broker.positions.setlot(code, lot)
+    else:
+        broker.setcash(cash)
+        broker.addcommissioninfo(btfutu.FutuCommInfo())
+    cerebro.setbroker(broker)
+    cerebro.addstrategy(Recorder, script=script)
+    return cerebro.run()[0]
+
+
+def _random_orders(strat):
+    # market, limit and stop orders on the tick ladder, every 7 bars
+    if len(strat) == 1:
+        strat.rnd = random.Random(1)
+    if len(strat) % 7:
+        return
+    rnd = strat.rnd
+    for d in strat.datas:
+        exectype = rnd.choice((bt.Order.Market, bt.Order.Limit,
+                               bt.Order.Stop))
+        price = float(HK_STOCKS.round(d.close[0] + rnd.uniform(-0.3, 0.3)))
+        order = strat.buy if rnd.random() < 0.5 else strat.sell
+        order(data=d, size=100, exectype=exectype, price=price)
+
+
+def _fills(strat):
+    return [(ref, name) for ref, name in strat.orders
+            if name in ('Completed', 'Canceled', 'Margin', 'Rejected')]
+
+
+def test_matches_backbroker(fresh):
+    sim = _run(fresh, _random_orders)
+    back = _run(fresh, _random_orders, broker=bt.brokers.BackBroker())
+    assert _fills(sim) and _fills(sim) == _fills(back)
+    assert sim.broker.getcash() == back.broker.getcash()
+    assert sim.broker.getvalue() == back.broker.getvalue()
+
+
+def _once(f):
+    def script(strat):
+        if len(strat) == 2:
+            strat.sent = f(strat)
+    return script
+
+
+def test_odd_lot_and_off_tick_rejected(fresh):
+    strat = _run(fresh, _once(lambda s: [
+        s.buy(size=150),
+        s.buy(size=100, exectype=bt.Order.Limit, price=50.013),
+        s.buy(size=100, exectype=bt.Order.Limit, price=60.0)]),
+        lots={'HK.00700': 100})
+    assert [strat.status(o) for o in strat.sent] == [
+        'Rejected', 'Rejected', 'Completed']
+    # no live data to get them to notify_store, left in the store
+    msgs = [msg for msg, args, kwargs in
+            btfutu.FutuStore().get_notifications()]
+    assert 'size not a multiple of lot 100' in msgs
+    assert strat.broker.getposition(strat.data).size == 100
+
+
+def test_setlot_before_run_kept(fresh):
+    # the lots of the static data of the store must not replace it
+    strat = _run(fresh, _once(lambda s: [s.buy(data=s.datas[1], size=150)]),
+                 lots={'HK.00005': 100})
+    order, = strat.sent
+    assert strat.status(order) == 'Rejected'
+
+
+def test_buy_over_cash_margin(fresh):
+    strat = _run(fresh, _once(lambda s: [s.buy(size=100000)]), cash=10000.0)
+    order, = strat.sent
+    assert strat.status(order) == 'Margin'
+    assert strat.broker.getcash() == 10000.0